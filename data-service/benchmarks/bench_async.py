@@ -0,0 +1,150 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+"""
+Compares the data service on Flask (app.py, a thread per request on the werkzeug server) against the data service on
+aiohttp (app_async.py, one event loop with the AsyncDatabase) under concurrent load against a local mongod. Each
+server runs in its own process. The load is --concurrency clients getting random action executions for --duration
+seconds, then a dashboard fan-out of --fanout executions requested at once. It prints the requests per second,
+p50/p95/p99 latency and the time of a fan-out for each server.
+
+Usage:
+    python bench_async.py --conf-home /opt/llamaflow/conf --executions 10000 --concurrency 64 --duration 20 --fanout 50
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+import aiohttp
+
+code_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "code")
+sys.path.insert(0, code_dir)
+
+# The action namespace of the executions the benchmark inserts, they are removed when it finishes
+benchmark_namespace = "llamaflow-benchmark"
+
+def serve(server, port, conf_home):
+    """
+    Run one of the servers in this process, printing "ready" once it accepts requests.
+    """
+    os.chdir(code_dir)
+    from modules.database import Database
+    Database.conf_home = conf_home
+    if server == "sync":
+        from werkzeug.serving import make_server, WSGIRequestHandler
+        import app
+        class QuietRequestHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+        http_server = make_server("127.0.0.1", port, app.app.app, threaded=True, request_handler=QuietRequestHandler)
+        print("ready", flush=True)
+        http_server.serve_forever()
+    else:
+        from aiohttp import web
+        import app_async
+        print("ready", flush=True)
+        web.run_app(app_async.application, host="127.0.0.1", port=port, print=None, access_log=None)
+
+def seed(conf_home, executions):
+    """
+    Insert the action executions the clients get, and return their ids.
+    """
+    from modules.database import Database
+    Database.conf_home = conf_home
+    collection = Database().get_mongo_client()["workflow-engine"]["runnerExecution"]
+    documents = [{"action_namespace": benchmark_namespace, "action_name": "echo", "version": 1, "execution_status": "success",
+        "parameters": {"number": number}, "execution_output": "x" * 512} for number in range(executions)]
+    return [str(execution_id) for execution_id in collection.insert_many(documents).inserted_ids], collection
+
+async def client(session, url, ids, deadline, latencies):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        async with session.get(url + random.choice(ids)) as response:
+            await response.read()
+        latencies.append(time.perf_counter() - start)
+
+async def load(url, ids, concurrency, duration, fanout, rounds):
+    """
+    Drive the concurrent load, then the fan-outs, and return the results.
+    """
+    connector = aiohttp.TCPConnector(limit=max(concurrency, fanout))
+    async with aiohttp.ClientSession(connector=connector) as session:
+        latencies = []
+        start = time.perf_counter()
+        await asyncio.gather(*[client(session, url, ids, start + duration, latencies) for worker in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+        fanouts = []
+        for attempt in range(rounds):
+            fanout_start = time.perf_counter()
+            responses = await asyncio.gather(*[session.get(url + execution_id) for execution_id in random.sample(ids, fanout)])
+            for response in responses:
+                await response.read()
+            fanouts.append(time.perf_counter() - fanout_start)
+
+    latencies.sort()
+    percentile = lambda fraction: latencies[min(int(len(latencies) * fraction), len(latencies) - 1)] * 1000
+    return {"requests_per_second": len(latencies) / elapsed, "p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99),
+        "fanout_ms": sum(fanouts) / len(fanouts) * 1000}
+
+def measure(server, port, args, ids):
+    """
+    Start a server, load it, stop it and print its results.
+    """
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", server, "--port", str(port), "--conf-home", args.conf_home],
+        stdout=subprocess.PIPE, text=True)
+    try:
+        if process.stdout.readline().strip() != "ready":
+            raise RuntimeError(f"The {server} server did not start")
+        time.sleep(1)
+        results = asyncio.run(load(f"http://127.0.0.1:{port}/api/runner/", ids, args.concurrency, args.duration, args.fanout, args.rounds))
+    finally:
+        process.terminate()
+        process.wait()
+    print(f"{server:>6}: {results['requests_per_second']:8.0f} requests per second  p50 {results['p50']:7.2f} ms  p95 {results['p95']:7.2f} ms  "
+        f"p99 {results['p99']:7.2f} ms  fan-out of {args.fanout} {results['fanout_ms']:7.2f} ms")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conf-home", default="/opt/llamaflow/conf")
+    parser.add_argument("--executions", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--fanout", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--serve", choices=["sync", "async"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.conf_home)
+        return
+
+    ids, collection = seed(args.conf_home, args.executions)
+    try:
+        sync = measure("sync", args.port, args, ids)
+        async_results = measure("async", args.port + 1, args, ids)
+        print(f"async serves {async_results['requests_per_second'] / sync['requests_per_second']:.2f}x the requests per second, "
+            f"fan-outs take {async_results['fanout_ms'] / sync['fanout_ms']:.2f}x the time")
+    finally:
+        collection.delete_many({"action_namespace": benchmark_namespace})
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+"""
+Sends a request to every handler of the data service through the Flask test client, against mongomock, and checks the
+status of each response and the documents the writing handlers leave behind. The handlers that are not routed, like
+get_workflow_execution and update_workflow_result, are called inside a request context. Any handler that raises, such
+as one referencing a name its module does not define, fails the check with its 500.
+
+Needs mongomock, no mongod. Exits with 1 if a check failed.
+
+Usage:
+    python check_handlers.py
+"""
+
+import contextlib
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "code"))
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "code"))
+
+failures = []
+
+def check(name, passed, detail=""):
+    """
+    Record and print the outcome of a check, to the real stdout since the handlers' own prints are silenced.
+    """
+    print(("ok    " if passed else "FAIL  ") + name + (": " + str(detail) if detail and not passed else ""), file=sys.__stdout__)
+    if not passed:
+        failures.append(name)
+
+def seed(db):
+    """
+    Insert the documents the requests read, and return their ids.
+    """
+    execution_id = str(db.runnerExecution.insert_one({"action_namespace": "core", "action_name": "echo", "version": 1, "execution_status": "submitted"}).inserted_id)
+    workflow_execution_id = str(db.workflowExecution.insert_one({"workflow_namespace": "testing", "workflow_name": "test1", "version": 1, "status": "running"}).inserted_id)
+    db.workflowDefinition.insert_one({"namespace": "testing", "workflow_name": "test1", "version": 1, "entrypoint": "step1", "workflow": {}})
+    db.actionDefinition.insert_one({"namespace": "core", "action_name": "echo", "version": 1})
+    return execution_id, workflow_execution_id
+
+def main():
+    import mongomock
+    import modules.database as database
+
+    mongo_client = mongomock.MongoClient()
+    database.MongoClient = lambda *args, **kwargs: mongo_client
+    database.connection_settings = lambda conf_home: ("mongodb://mongomock", {})
+    db = mongo_client["workflow-engine"]
+    execution_id, workflow_execution_id = seed(db)
+    missing_id = "0" * 24
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app
+        import runner
+    client = app.app.app.test_client()
+
+    requests = [
+        ("GET", "/api/runner/" + execution_id, None, 200),
+        ("GET", "/api/runner/" + missing_id, None, 404),
+        ("POST", "/api/runner/" + execution_id, {"job_id": "check", "pod_id": "check", "execution_status": "success", "execution_output": "checked"}, 204),
+        ("GET", "/api/runner/executions?action_namespace=core", None, 200),
+        ("GET", "/api/runner/definitions?namespace=core", None, 200),
+        ("GET", "/api/workflow/executions?workflow_namespace=testing", None, 200),
+        ("GET", "/api/workflow/definitions?namespace=testing", None, 200),
+        ("GET", "/api/workflow/testing/test1/1", None, 200),
+        ("GET", "/api/workflow/testing/missing/1", None, 406),
+    ]
+    for method, path, body, expected in requests:
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = client.open(path, method=method, json=body)
+        check(f"{method} {path} answers {expected}", response.status_code == expected, f"got {response.status_code} {response.get_data(as_text=True)[:200]}")
+
+    posted = db.runnerExecution.find_one({"_id": database.ObjectId(execution_id)})
+    check("POST /api/runner/{execution_id} writes the result", posted.get("execution_output") == "checked", posted)
+    response = client.get("/api/runner/" + execution_id)
+    check("GET /api/runner/{execution_id} serves the posted result", response.status_code == 200 and response.get_json().get("execution_output") == "checked", response.get_data(as_text=True)[:200])
+
+    with app.app.app.test_request_context(), contextlib.redirect_stdout(io.StringIO()):
+        try:
+            execution = runner.get_workflow_execution(workflow_execution_id)
+            check("get_workflow_execution returns the execution", execution.get("status") == "running", execution)
+        except Exception as error:
+            check("get_workflow_execution returns the execution", False, repr(error))
+        try:
+            runner.get_workflow_execution(missing_id)
+            check("get_workflow_execution aborts with 404 when not found", False, "no error")
+        except Exception as error:
+            check("get_workflow_execution aborts with 404 when not found", getattr(error, "code", None) == 404, repr(error))
+        try:
+            runner.update_workflow_result(workflow_execution_id, {"status": "success"})
+            updated = db.workflowExecution.find_one({"_id": database.ObjectId(workflow_execution_id)})
+            check("update_workflow_result writes the result", updated.get("status") == "success", updated)
+        except Exception as error:
+            check("update_workflow_result writes the result", False, repr(error))
+
+    print(f"{len(failures)} checks failed" if failures else "all checks passed")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -16,10 +16,13 @@
 from flask import render_template, current_app
 import connexion
 from modules.database import Database
+from modules import metrics
+from modules import indexes
 
 app = connexion.App(__name__, specification_dir="./")
 app.add_api("swagger.yml")
 db_connection = Database()
+indexes.create_indexes(db_connection)
 #db.init_app(app)
 with app.app.app_context():
         current_app.db_connection = db_connection
@@ -29,5 +32,9 @@ with app.app.app_context():
 def home():
     return render_template("home.html")
 
+@app.route("/metrics")
+def prometheus_metrics():
+    return metrics.metrics()
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8000, debug=True)
\ No newline at end of file
@@ -0,0 +1,58 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+"""
+The data service on aiohttp with asyncio handlers, the alternative to app.py. The API is the same swagger.yml, each
+operation is served by the coroutine of the same name in runner_async.py or workflow_async.py, and the database is
+reached with the AsyncDatabase. Run it with:
+
+    python app_async.py
+    gunicorn app_async:application --worker-class aiohttp.GunicornWebWorker --bind 0.0.0.0:8000
+"""
+
+import importlib
+import connexion
+from aiohttp import web
+from prometheus_client import CONTENT_TYPE_LATEST
+from connexion.resolver import Resolver
+from modules.database import Database
+from modules import indexes
+from modules import metrics
+
+def resolve_async(function_name):
+    """
+    A function to get the handler of an operation, the operationId "runner.get_execution" is served by
+    runner_async.get_execution.
+
+    Parameters:
+        function_name (Str): The operationId
+
+    Returns:
+        Callable: The coroutine function handling the operation
+    """
+    module_name, name = function_name.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name + "_async"), name)
+
+async def prometheus_metrics(request):
+    return web.Response(body=metrics.metrics_text(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+app = connexion.AioHttpApp(__name__, specification_dir="./")
+app.add_api("swagger.yml", resolver=Resolver(resolve_async), pass_context_arg_name="request")
+app.app.router.add_get("/metrics", prometheus_metrics)
+application = app.app
+indexes.create_indexes(Database())
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=8000)
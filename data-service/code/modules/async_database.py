@@ -0,0 +1,185 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+import re
+import time
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import DESCENDING
+from bson import ObjectId
+from modules.database import Database, connection_settings, json_safe
+from modules import metrics
+
+class AsyncDatabase:
+    """
+    The asyncio version of the Database class, with the same methods as coroutines, for the data service running on
+    aiohttp. A request waiting on the database yields the event loop to the other requests instead of blocking a
+    worker, and the reads of one request can run concurrently with asyncio.gather.
+
+    Attributes:
+        mongo_client (AsyncIOMotorClient): The client class for the db connection
+    """
+
+    def __init__(self) -> None:
+        """
+        The constructor for the AsyncDatabase class. The config comes from db.yaml in the conf_home of the Database class,
+        and the client connects on first use, in the event loop it is used in.
+
+        Parameters:
+            self (AsyncDatabase): The object itself
+        """
+        uri, options = connection_settings(Database.conf_home)
+        self.mongo_client = AsyncIOMotorClient(uri, connect=False, **options)
+
+    def get_mongo_client(self):
+        """
+        Get a client to connect to the database
+
+        Parameters:
+            self (AsyncDatabase): The object itself
+        """
+        return self.mongo_client
+
+    async def find_by_id(self, database, collection, object_id, projection=None):
+        """
+        A method to find a document by its object id.
+
+        Parameters:
+            self (AsyncDatabase): The instantiation of the AsyncDatabase class
+            databse (str): The name of the database to search in
+            collection (str): The name of the collection to search in
+            object_id (Str): The id of the document to find. The id must be 24 hexadecimal characters with lowercase letters
+            projection (Dict): Optional, the fields to return. By default the whole document is returned
+
+        Returns:
+            Dict: A dict with the document if the document is found.
+            None: If the document is not found.
+        """
+        if not re.match('^[0-9a-f]{24}$',object_id):
+            raise ValueError("Object id must be 24 chacters hexadecimal string with lowercase letters")
+
+        start = time.monotonic()
+        result = await self.mongo_client[database][collection].find_one({"_id": ObjectId(object_id)}, projection)
+        metrics.db_operation_seconds.labels("find_by_id", collection).observe(time.monotonic() - start)
+
+        return json_safe(result)
+
+    async def find_one_by_query(self, database, collection, query, projection=None):
+        """
+        A function to find one record using a query
+
+        Parameters:
+            self (AsyncDatabase): The instantiation of the AsyncDatabase class
+            databse (str): The name of the database to search in
+            collection (str): The name of the collection to search in
+            query (Dict): A dictonary with the query
+            projection (Dict): Optional, the fields to return. By default the whole document is returned
+
+        Returns:
+            Dict: A dict with the document if document is found
+            None: If the document is not found
+        """
+        start = time.monotonic()
+        result = await self.mongo_client[database][collection].find_one(query, projection)
+        metrics.db_operation_seconds.labels("find_one_by_query", collection).observe(time.monotonic() - start)
+
+        return json_safe(result)
+
+    async def find_page(self, database, collection, query, projection=None, limit=100, after=None):
+        """
+        A function to find one page of the documents matching a query, newest first, keyset paginated on _id the same
+        way as Database.find_page.
+
+        Parameters:
+            self (AsyncDatabase): The instantiation of the AsyncDatabase class
+            databse (str): The name of the database to search in
+            collection (str): The name of the collection to search in
+            query (Dict): A dictonary with the query
+            projection (Dict): Optional, the fields to return. By default the whole document is returned
+            limit (Int): The most documents to return
+            after (ObjectId): Optional, the _id of the last document of the previous page
+
+        Returns:
+            List: The documents of the page
+            Str: The cursor of the next page, the _id of the last document, or None if this is the last page
+        """
+        if after is not None:
+            id_range = dict(query.get("_id", {}))
+            id_range["$lt"] = min(after, id_range["$lt"]) if "$lt" in id_range else after
+            query = dict(query, _id=id_range)
+
+        start = time.monotonic()
+        cursor = self.mongo_client[database][collection].find(query, projection).sort("_id", DESCENDING).limit(limit + 1)
+        documents = await cursor.to_list(length=limit + 1)
+        metrics.db_operation_seconds.labels("find_page", collection).observe(time.monotonic() - start)
+
+        next_cursor = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            next_cursor = str(documents[-1]["_id"])
+        return json_safe(documents), next_cursor
+
+    async def insert_document(self, database, collection, document):
+        """
+        A function to insert a new doument
+
+        Parameters:
+            self (AsyncDatabase): The instantiation of the AsyncDatabase class
+            databse (str): The name of the database to insert into
+            collection (str): The name of the collection to insert into
+            document (Dict): A dictonary with the document to inset into a collection
+
+        Returns:
+            object_id (Str): A 24 character hexadecmal string that represents the id of the new object
+        """
+        start = time.monotonic()
+        result = await self.mongo_client[database][collection].insert_one(document)
+        metrics.db_operation_seconds.labels("insert_document", collection).observe(time.monotonic() - start)
+
+        return str(result.inserted_id)
+
+    async def update_one(self, database, collection, query, document):
+        """
+        A function to update a document
+
+        Parameters:
+            self (AsyncDatabase): The instantiation of the AsyncDatabase class
+            databse (str): The name of the database the document resides in
+            collection (str): The name of the collection the document resides in
+            query (Dict): The query to find the document
+            document (Dict): The data to update with
+
+        Returns:
+            (Str): The document ID of the updated document
+        """
+        start = time.monotonic()
+        result = await self.mongo_client[database][collection].update_one(query, {'$set':document}, upsert=True)
+        metrics.db_operation_seconds.labels("update_one", collection).observe(time.monotonic() - start)
+
+        return str(result.upserted_id)
+
+async_database = None
+
+def get_async_database():
+    """
+    A function to get the AsyncDatabase shared by the request handlers of the process, created on first use.
+
+    Returns:
+        AsyncDatabase: The shared database
+    """
+    global async_database
+
+    if async_database is None:
+        async_database = AsyncDatabase()
+    return async_database
@@ -15,11 +15,88 @@
 
 
 import yaml
-from pymongo import MongoClient
+from pymongo import MongoClient, DESCENDING
+from pymongo.errors import PyMongoError
 from bson import ObjectId, json_util
 import urllib.parse
 import json
 import re
+import datetime
+from modules import metrics
+
+# Optional settings in db.yaml that tune the connection pool, mapped to their MongoClient keyword arguments
+pool_settings = {
+    "max_pool_size": "maxPoolSize",
+    "min_pool_size": "minPoolSize",
+    "max_idle_time_ms": "maxIdleTimeMS",
+    "wait_queue_timeout_ms": "waitQueueTimeoutMS",
+    "connect_timeout_ms": "connectTimeoutMS",
+    "socket_timeout_ms": "socketTimeoutMS",
+    "server_selection_timeout_ms": "serverSelectionTimeoutMS",
+}
+
+json_types = (str, int, float, bool, type(None))
+
+def json_safe(value):
+    """
+    A function to make a document returned by pymongo safe to serialize as JSON, in the legacy extended JSON the API
+    has always returned: ObjectId as {"$oid": Str} and datetime as {"$date": Int} milliseconds since the epoch. This is
+    the json_util format of pymongo 3. pymongo 4 defaults to relaxed extended JSON, so other BSON types are converted
+    with json_util.LEGACY_JSON_OPTIONS. Only the values that are not already JSON types are converted, so large strings
+    like runner output are passed through without being copied.
+
+    Parameters:
+        value (Object): The document, or a value inside it
+
+    Returns:
+        Object: The value with ObjectId as {"$oid": Str}, datetime as {"$date": Int} and other BSON types in extended JSON
+    """
+    if isinstance(value, json_types):
+        return value
+    elif isinstance(value, dict):
+        return {key: json_safe(item) for key, item in value.items()}
+    elif isinstance(value, list):
+        return [json_safe(item) for item in value]
+    elif isinstance(value, ObjectId):
+        return {"$oid": str(value)}
+    elif isinstance(value, datetime.datetime):
+        return {"$date": bson_datetime_ms(value)}
+    else:
+        return json.loads(json_util.dumps(value, json_options=json_util.LEGACY_JSON_OPTIONS))
+
+def bson_datetime_ms(value):
+    """
+    A function to convert a datetime to milliseconds since the epoch, the way BSON stores it.
+
+    Parameters:
+        value (datetime): The datetime to convert, naive datetimes are treated as UTC
+
+    Returns:
+        Int: The number of milliseconds since the epoch
+    """
+    if value.utcoffset() is not None:
+        value = value - value.utcoffset()
+    delta = value.replace(tzinfo=None) - datetime.datetime(1970, 1, 1)
+    return (delta.days * 86400 + delta.seconds) * 1000 + delta.microseconds // 1000
+
+def connection_settings(conf_home):
+    """
+    A function to get the connection string and client options of the database from db.yaml.
+
+    Parameters:
+        conf_home (Str): The directory db.yaml is in
+
+    Returns:
+        Str: The connection string
+        Dict: The client keyword arguments of the pool settings set in db.yaml
+    """
+    with open(conf_home+"/db.yaml",'r') as file:
+        db_config = yaml.safe_load(file)
+
+    username = urllib.parse.quote_plus(db_config['username'])
+    password = urllib.parse.quote_plus(db_config['password'])
+    options = {pool_settings[setting]: db_config[setting] for setting in pool_settings if db_config.get(setting) is not None}
+    return 'mongodb://%s:%s@%s:%s' % (username, password, db_config['host'], db_config['port']), options
 
 class DocumentNotFound(Exception):
     pass
@@ -43,12 +120,9 @@ class Database:
         Parameters:
             self (Database): The object itself
         """
-        with open(self.conf_home+"/db.yaml",'r') as file:
-            db_config = yaml.safe_load(file)
-
-        username = urllib.parse.quote_plus(db_config['username'])
-        password = urllib.parse.quote_plus(db_config['password'])
-        self.mongo_client = MongoClient('mongodb://%s:%s@%s:%s' % (username, password, db_config['host'], db_config['port']))
+        uri, options = connection_settings(self.conf_home)
+        # connect=False delays connecting until first use, so a client created before the server forks its workers is safe
+        self.mongo_client = MongoClient(uri, connect=False, **options)
         self.app = None
 
     def init_app(self, app):
@@ -68,7 +142,7 @@ class Database:
         return self.mongo_client
     
 
-    def find_by_id(self, database, collection, object_id):
+    def find_by_id(self, database, collection, object_id, projection=None):
         """
         A method to find a document by its object id. 
         
@@ -77,6 +151,7 @@ class Database:
             databse (str): The name of the database to search in
             collection (str): The name of the collection to search in
             object_id (Str): The id of the document to find. The id must be 24 hexadecimal characters with lowercase letters
+            projection (Dict): Optional, the fields to return. By default the whole document is returned
 
         Returns:
             Dict: A dict with the document if the document is found. 
@@ -90,11 +165,12 @@ class Database:
             raise "Object id must be 24 chacters hexadecimal string with lowercase letters"
 
         object_instance =  ObjectId(object_id)
-        result = collection_conn.find_one({"_id": object_instance})
+        with metrics.db_operation_seconds.labels("find_by_id", collection).time():
+            result = collection_conn.find_one({"_id": object_instance}, projection)
 
-        return json.loads(json_util.dumps(result))
+        return json_safe(result)
 
-    def find_one_by_query(self, database, collection, query):
+    def find_one_by_query(self, database, collection, query, projection=None):
         """
         A function to find one record using a query
 
@@ -103,6 +179,7 @@ class Database:
             databse (str): The name of the database to search in
             collection (str): The name of the collection to search in
             query (Dict): A dictonary with the query
+            projection (Dict): Optional, the fields to return. By default the whole document is returned
         
         Returns:
             Dict: A dict with the document if document is found
@@ -110,10 +187,71 @@ class Database:
         """
         database_conn = self.mongo_client[database]
         collection_conn = database_conn[collection]
-        result = collection_conn.find_one(query)
+        with metrics.db_operation_seconds.labels("find_one_by_query", collection).time():
+            result = collection_conn.find_one(query, projection)
 
-        return json.loads(json_util.dumps(result))
+        return json_safe(result)
     
+    def find_page(self, database, collection, query, projection=None, limit=100, after=None):
+        """
+        A function to find one page of the documents matching a query, newest first. The pages are keyset paginated on
+        _id, so every page is a single range scan of an index ending in _id, however deep into the results it is.
+
+        Parameters:
+            self (Database): The instantiation of the Database class
+            databse (str): The name of the database to search in
+            collection (str): The name of the collection to search in
+            query (Dict): A dictonary with the query
+            projection (Dict): Optional, the fields to return. By default the whole document is returned
+            limit (Int): The most documents to return
+            after (ObjectId): Optional, the _id of the last document of the previous page
+
+        Returns:
+            List: The documents of the page
+            Str: The cursor of the next page, the _id of the last document, or None if this is the last page
+        """
+        database_conn = self.mongo_client[database]
+        collection_conn = database_conn[collection]
+
+        if after is not None:
+            id_range = dict(query.get("_id", {}))
+            id_range["$lt"] = min(after, id_range["$lt"]) if "$lt" in id_range else after
+            query = dict(query, _id=id_range)
+
+        # One more document than the page is read, to know if there is a next page without another round trip
+        with metrics.db_operation_seconds.labels("find_page", collection).time():
+            documents = list(collection_conn.find(query, projection).sort("_id", DESCENDING).limit(limit + 1))
+
+        next_cursor = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            next_cursor = str(documents[-1]["_id"])
+        return json_safe(documents), next_cursor
+
+    def create_indexes(self, database, collection, indexes):
+        """
+        A function to create indexes on a collection. Creating an index that already exists does nothing, so this is
+        safe to run every time the service starts.
+
+        Parameters:
+            self (Database): The instantiation of the Database class
+            databse (str): The name of the database the collection resides in
+            collection (str): The name of the collection
+            indexes (List): A list of (keys, options) tuples, the options must include the name of the index
+
+        Returns:
+            List: The names of the indexes that failed to be created
+        """
+        collection_conn = self.mongo_client[database][collection]
+        failed = []
+        for keys, options in indexes:
+            try:
+                collection_conn.create_index(keys, **options)
+            except PyMongoError as error:
+                print("Failed to create the " + options["name"] + " index on " + collection + ": ", error)
+                failed.append(options["name"])
+        return failed
+
     def insert_document(self, database, collection, document):
         """
         A function to insert a new doument
@@ -130,7 +268,8 @@ class Database:
 
         database_conn = self.mongo_client[database]
         collection_conn = database_conn[collection]
-        result = collection_conn.insert_one(document)
+        with metrics.db_operation_seconds.labels("insert_document", collection).time():
+            result = collection_conn.insert_one(document)
 
         return str(result.inserted_id)
 
@@ -152,7 +291,8 @@ class Database:
         database_conn = self.mongo_client[database]
         collection_conn = database_conn[collection]
 
-        result = collection_conn.update_one("workflow-engine", "workflowExecution", query, {'$set':document}, upsert=True)
+        with metrics.db_operation_seconds.labels("update_one", collection).time():
+            result = collection_conn.update_one(query, {'$set':document}, upsert=True)
         return str(result.upserted_id)
     
 
@@ -0,0 +1,146 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+"""
+The indexes the queries of the data service need, declared in one place. They are created when the service starts, and
+the module is also a command line tool to create them ahead of a deploy and to report the indexes that are missing or
+unused. The collections are shared with the workflow engine, which declares the indexes of its own queries.
+
+index_usage and index_report mirror workflow-engine/code/modules/indexes.py rather than importing it: the two services
+are built and deployed separately and share no code. The engine's module works on its own Database class, which
+opens one collection at a time, while this service passes the database and collection to each call.
+
+Usage:
+    python -m modules.indexes --create
+    python -m modules.indexes --report
+"""
+
+import argparse
+import json
+import sys
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from modules.database import Database
+
+# The indexes of each collection as (keys, options) tuples. The list indexes end in _id after the fields filtered on by
+# equality, so a page is one range scan of the index in _id order, and the time range, being a range on _id, is part of
+# the same scan.
+required_indexes = {
+    "workflowDefinition": [
+        # Definition lookups by namespace, name and version, the same index the workflow engine declares
+        ([("namespace", ASCENDING), ("workflow_name", ASCENDING), ("version", ASCENDING)], {"name": "namespace_name_version", "unique": True}),
+        ([("namespace", ASCENDING), ("_id", DESCENDING)], {"name": "namespace_id"}),
+    ],
+    "actionDefinition": [
+        ([("namespace", ASCENDING), ("action_name", ASCENDING), ("version", ASCENDING)], {"name": "namespace_name_version", "unique": True}),
+        ([("namespace", ASCENDING), ("_id", DESCENDING)], {"name": "namespace_id"}),
+    ],
+    "workflowExecution": [
+        ([("status", ASCENDING), ("_id", DESCENDING)], {"name": "status_id"}),
+        ([("workflow_namespace", ASCENDING), ("status", ASCENDING), ("_id", DESCENDING)], {"name": "namespace_status_id"}),
+        ([("workflow_namespace", ASCENDING), ("workflow_name", ASCENDING), ("_id", DESCENDING)], {"name": "namespace_name_id"}),
+    ],
+    "runnerExecution": [
+        ([("execution_status", ASCENDING), ("_id", DESCENDING)], {"name": "execution_status_id"}),
+        ([("action_namespace", ASCENDING), ("execution_status", ASCENDING), ("_id", DESCENDING)], {"name": "namespace_execution_status_id"}),
+        ([("action_namespace", ASCENDING), ("action_name", ASCENDING), ("_id", DESCENDING)], {"name": "namespace_name_id"}),
+    ],
+}
+
+def create_indexes(db_connection, database="workflow-engine"):
+    """
+    A function to create the required indexes. Creating an index that already exists does nothing, so it is safe to run
+    every time the service starts.
+
+    Parameters:
+        db_connection (Database): The connection to the database
+        database (Str): The name of the database
+
+    Returns:
+        List: The names of the indexes that failed to be created, as "<collection>.<index>"
+    """
+    failed = []
+    for collection, indexes in required_indexes.items():
+        failed = failed + [collection + "." + name for name in db_connection.create_indexes(database, collection, indexes)]
+    return failed
+
+def index_usage(collection_conn):
+    """
+    A function to get how often each index of a collection was used, from the $indexStats of the server. The counts
+    start when the server starts or the index is created, and are for the server answering, not the whole replica set.
+
+    Parameters:
+        collection_conn (Collection): The collection
+
+    Returns:
+        Dict: The number of operations that used each index and the time counting started, by index name. None if the server does not give index stats
+    """
+    try:
+        return {stats["name"]: {"ops": stats["accesses"]["ops"], "since": str(stats["accesses"]["since"])}
+            for stats in collection_conn.aggregate([{"$indexStats": {}}])}
+    except (OperationFailure, NotImplementedError) as error:
+        print("Index stats are not available for " + collection_conn.name + ": ", error)
+        return None
+
+def index_report(db_connection, database="workflow-engine"):
+    """
+    A function to compare the indexes in the database with the required indexes.
+
+    Parameters:
+        db_connection (Database): The connection to the database
+        database (Str): The name of the database
+
+    Returns:
+        Dict: For each collection:
+            missing: The required indexes that do not exist
+            different: The required indexes that exist under their name with other keys
+            undeclared: The indexes that exist but are not required by the data service, they may be used by the workflow engine
+            unused: The indexes no operation used since the server started counting
+            usage: The operations of each index, if the server gives index stats
+    """
+    report = {}
+    for collection, indexes in required_indexes.items():
+        collection_conn = db_connection.get_mongo_client()[database][collection]
+        existing = collection_conn.index_information()
+        required = {options["name"]: keys for keys, options in indexes}
+        usage = index_usage(collection_conn)
+        report[collection] = {
+            "missing": [name for name in required if name not in existing],
+            "different": [name for name, keys in required.items() if name in existing and [(field, direction) for field, direction in existing[name]["key"]] != keys],
+            "undeclared": [name for name in existing if name not in required and name != "_id_"],
+            "unused": sorted(name for name, stats in (usage or {}).items() if stats["ops"] == 0 and name != "_id_"),
+            "usage": usage
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conf-home", default=Database.conf_home)
+    parser.add_argument("--database", default="workflow-engine")
+    parser.add_argument("--create", action="store_true", help="Create the missing indexes")
+    parser.add_argument("--report", action="store_true", help="Print the missing, different, undeclared and unused indexes as JSON")
+    args = parser.parse_args()
+
+    Database.conf_home = args.conf_home
+    db_connection = Database()
+    failed = []
+    if args.create:
+        failed = create_indexes(db_connection, args.database)
+    if args.report or not args.create:
+        print(json.dumps(index_report(db_connection, args.database), indent=2))
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
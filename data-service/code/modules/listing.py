@@ -0,0 +1,127 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+import re
+import datetime
+from flask import abort, current_app
+from bson.objectid import ObjectId
+
+# The fields returned for each collection when a list request does not ask for fields. Large fields like the
+# parameters, results and runner output are left out, a client that needs them asks for them or gets the document.
+default_fields = {
+    "workflowExecution": ["workflow_namespace", "workflow_name", "version", "status", "priority", "queued_time", "time"],
+    "runnerExecution": ["action_namespace", "action_name", "version", "execution_status", "job_id", "runner_pool", "submitted_time", "finished_time"],
+    "workflowDefinition": ["namespace", "workflow_name", "version"],
+    "actionDefinition": ["namespace", "action_name", "version", "execution_mode", "runner_pool", "cacheable"],
+}
+
+max_limit = 1000
+
+def object_id_time(timestamp):
+    """
+    A function to get the smallest ObjectId created at a time, ObjectIds start with their creation time in seconds.
+
+    Parameters:
+        timestamp (Float): The unix timestamp
+
+    Returns:
+        ObjectId: The smallest ObjectId of the second the timestamp falls in
+    """
+    return ObjectId.from_datetime(datetime.datetime.fromtimestamp(int(timestamp), datetime.timezone.utc))
+
+class InvalidListRequest(Exception):
+    pass
+
+def projection(collection, fields):
+    """
+    A function to get the projection of a list request.
+
+    Parameters:
+        collection (Str): The collection listed
+        fields (List): The fields asked for, or None for the default fields of the collection
+
+    Returns:
+        Dict: The projection, the _id is always returned as it is the cursor
+    """
+    fields = fields or default_fields[collection]
+    for field in fields:
+        if not re.match(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z0-9_]+)*$', field):
+            raise InvalidListRequest(f"Invalid field {field}")
+    return {field: 1 for field in fields}
+
+def list_query(collection, filters, fields=None, limit=100, after=None, since=None, until=None):
+    """
+    A function to get the query of a list request, shared by the Flask and the aiohttp handlers.
+
+    Parameters:
+        collection (Str): The collection to list
+        filters (Dict): The fields to match exactly, filters that are None are left out
+        fields (List): Optional, the fields to return
+        limit (Int): The most documents to return, at most 1000
+        after (Str): Optional, the next_cursor of the previous page
+        since (Float): Optional, only documents created at or after this unix timestamp
+        until (Float): Optional, only documents created before this unix timestamp
+
+    Returns:
+        Dict: The query
+        Dict: The projection
+        ObjectId: The _id to continue after, or None for the first page
+
+    Raises:
+        InvalidListRequest: If the limit, a field or the cursor is not valid
+    """
+    if limit < 1 or limit > max_limit:
+        raise InvalidListRequest(f"Limit must be between 1 and {max_limit}")
+
+    query = {field: value for field, value in filters.items() if value is not None}
+    id_range = {}
+    if since is not None:
+        id_range["$gte"] = object_id_time(since)
+    if until is not None:
+        id_range["$lt"] = object_id_time(until)
+    if id_range:
+        query["_id"] = id_range
+
+    if after is not None:
+        if not re.match('^[0-9a-f]{24}$', after):
+            raise InvalidListRequest("Cursor must be 24 chacters hexadecimal string with lowercase letters")
+        after = ObjectId(after)
+
+    return query, projection(collection, fields), after
+
+def list_documents(collection, filters, fields=None, limit=100, after=None, since=None, until=None):
+    """
+    A function to list a page of the documents of a collection, newest first.
+
+    Parameters:
+        collection (Str): The collection to list
+        filters (Dict): The fields to match exactly, filters that are None are left out
+        fields (List): Optional, the fields to return
+        limit (Int): The most documents to return, at most 1000
+        after (Str): Optional, the next_cursor of the previous page
+        since (Float): Optional, only documents created at or after this unix timestamp
+        until (Float): Optional, only documents created before this unix timestamp
+
+    Returns:
+        Dict: The documents as items, and the next_cursor to get the next page with, None on the last page
+    """
+    try:
+        query, fields_projection, after = list_query(collection, filters, fields, limit, after, since, until)
+    except InvalidListRequest as error:
+        abort(406, str(error))
+
+    db_connection = current_app.db_connection
+    items, next_cursor = db_connection.find_page("workflow-engine", collection, query, fields_projection, limit, after)
+    return {"items": items, "next_cursor": next_cursor}
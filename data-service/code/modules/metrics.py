@@ -0,0 +1,58 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+
+import os
+from flask import Response
+from prometheus_client import Counter, Histogram, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import multiprocess
+
+db_operation_seconds = Histogram(
+    "llamaflow_data_service_db_operation_seconds", "Time of a database operation made by the data service",
+    ["operation", "collection"])
+definition_lookup_seconds = Histogram(
+    "llamaflow_definition_lookup_seconds", "Time to get a workflow or action definition",
+    ["kind", "namespace", "name", "version"])
+execution_lookup_seconds = Histogram(
+    "llamaflow_execution_lookup_seconds", "Time to get an action execution",
+    ["action_namespace", "action_name", "action_version"])
+response_cache_total = Counter(
+    "llamaflow_response_cache", "Lookups of responses in the response cache", ["endpoint", "result"])
+responses_not_modified_total = Counter(
+    "llamaflow_responses_not_modified", "Conditional requests answered with 304 Not Modified", ["endpoint"])
+
+def metrics():
+    """
+    The /metrics endpoint, in the Prometheus text format. When the app runs in several processes with
+    PROMETHEUS_MULTIPROC_DIR set, the metrics of every process are combined.
+
+    Returns:
+        Response: The metrics
+    """
+    return Response(metrics_text(), mimetype=CONTENT_TYPE_LATEST)
+
+def metrics_text():
+    """
+    The metrics in the Prometheus text format, combined across processes when PROMETHEUS_MULTIPROC_DIR is set.
+
+    Returns:
+        Bytes: The metrics
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+
+    return generate_latest()
@@ -0,0 +1,188 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+import hashlib
+import json
+import threading
+import time
+from cachetools import TLRUCache
+from modules import metrics
+
+# The action execution statuses of a finished execution. A finished execution can still change, the engine posts a
+# result again when a runner retries its postback, so its response is cached in-process but clients revalidate it.
+finished_statuses = ["success", "failed"]
+
+# How long clients and the cache may reuse a definition. A published definition version is not meant to change, but
+# the workflow engine lets a version be published again, so definitions are only reused for a while.
+definition_max_age = 300
+
+# How long a finished execution stays in the in-process cache. Results posted to this service invalidate it, results
+# written by the workflow engine do not, so it is kept short.
+execution_cache_ttl = 60
+
+class ResponseCache:
+    """
+    An in-process cache of serialized responses of resources that do not change, keyed by the resource. Each entry has
+    the JSON body, its strong ETag and its Cache-Control header, so a hit is answered without reading the database or
+    serializing the document again. Entries expire after their own time to live, and the least recently used entries
+    are removed to keep the bodies under max_bytes.
+
+    Attributes:
+        cache (TLRUCache): The cached responses, sized by the length of their body
+        lock (Lock): Protects the cache
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024) -> None:
+        """
+        The constructor for the ResponseCache class.
+
+        Parameters:
+            self (ResponseCache): The object itself
+            max_bytes (Int): The most bytes of response bodies to keep
+        """
+        self.cache = TLRUCache(maxsize=max_bytes, ttu=lambda key, entry, now: now + entry["ttl"], timer=time.monotonic,
+            getsizeof=lambda entry: len(entry["body"]))
+        self.lock = threading.Lock()
+
+    def get(self, endpoint, key):
+        """
+        Get a cached response, counting the hit or miss.
+
+        Parameters:
+            self (ResponseCache): The object itself
+            endpoint (Str): The endpoint the response is for, the label of the metrics
+            key (Tuple): The resource
+
+        Returns:
+            Dict: The body, etag and cache_control of the response
+            None: If the response is not cached
+        """
+        with self.lock:
+            entry = self.cache.get(key)
+        metrics.response_cache_total.labels(endpoint, "hit" if entry else "miss").inc()
+        return entry
+
+    def put(self, key, entry):
+        """
+        Cache a response for the time to live of the entry. A body larger than the whole cache is not cached.
+
+        Parameters:
+            self (ResponseCache): The object itself
+            key (Tuple): The resource
+            entry (Dict): The response from cache_entry
+
+        Returns:
+            none
+        """
+        with self.lock:
+            try:
+                self.cache[key] = entry
+            except ValueError:
+                pass
+
+    def invalidate(self, key):
+        """
+        Remove a cached response.
+
+        Parameters:
+            self (ResponseCache): The object itself
+            key (Tuple): The resource
+
+        Returns:
+            none
+        """
+        with self.lock:
+            self.cache.pop(key, None)
+
+def cache_entry(document, cache_control, ttl=0):
+    """
+    A function to serialize a response and give it a strong ETag, the hash of the body.
+
+    Parameters:
+        document (Dict): The JSON safe document
+        cache_control (Str): The Cache-Control header of the response
+        ttl (Float): How long the response may be kept in the in-process cache
+
+    Returns:
+        Dict: The body, etag, cache_control and ttl of the response
+    """
+    body = json.dumps(document, separators=(",", ":")).encode()
+    return {"body": body, "etag": '"' + hashlib.sha256(body).hexdigest()[:32] + '"', "cache_control": cache_control, "ttl": ttl}
+
+def execution_entry(execution):
+    """
+    A function to get the response of an action execution. Clients must revalidate every response with its ETag, since
+    even a finished execution can change. A finished execution is also cached in-process for execution_cache_ttl.
+
+    Parameters:
+        execution (Dict): The action execution
+
+    Returns:
+        Dict: The response from cache_entry
+    """
+    if execution.get("execution_status") in finished_statuses:
+        return cache_entry(execution, "no-cache", execution_cache_ttl)
+    return cache_entry(execution, "no-cache")
+
+def definition_entry(definition):
+    """
+    A function to get the response of a definition.
+
+    Parameters:
+        definition (Dict): The workflow or action definition
+
+    Returns:
+        Dict: The response from cache_entry
+    """
+    return cache_entry(definition, f"public, max-age={definition_max_age}", definition_max_age)
+
+def not_modified(entry, if_none_match):
+    """
+    A function to check if a conditional request already has the response.
+
+    Parameters:
+        entry (Dict): The response from cache_entry
+        if_none_match (Str): The If-None-Match header of the request, or None
+
+    Returns:
+        Bool: If the response is not modified, and a 304 can be sent instead
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or entry["etag"] in tags or "W/" + entry["etag"] in tags
+
+def respond(endpoint, entry, if_none_match):
+    """
+    A function to get the status, body and headers to answer a request with, a 304 without a body when the request
+    already has the response.
+
+    Parameters:
+        endpoint (Str): The endpoint the response is for, the label of the metrics
+        entry (Dict): The response from cache_entry
+        if_none_match (Str): The If-None-Match header of the request, or None
+
+    Returns:
+        Int: The status
+        Bytes: The body
+        Dict: The ETag and Cache-Control headers
+    """
+    headers = {"ETag": entry["etag"], "Cache-Control": entry["cache_control"]}
+    if not_modified(entry, if_none_match):
+        metrics.responses_not_modified_total.labels(endpoint).inc()
+        return 304, b"", headers
+    return 200, entry["body"], headers
+
+response_cache = ResponseCache()
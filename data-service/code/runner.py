@@ -15,12 +15,15 @@
 
 
 import time
-from flask import abort, request
+from flask import abort, request, current_app, Response
 import re
 from kubernetes import client, config, utils
 import yaml
 from urllib.parse import urlparse
 from bson.objectid import ObjectId
+from modules import metrics
+from modules import listing
+from modules.response_cache import response_cache, execution_entry, respond
 from time import sleep
 
 def get_workflow_execution(execution_id):
@@ -46,52 +49,13 @@ def get_workflow_execution(execution_id):
     if not re.match('^[0-9a-f]{24}$',execution_id):
         abort(406, "Execution id must be 24 chacters hexadecimal string with lowercase letters")
 
-    db_connection = Database("workflow-engine", "workflowExecution")
-    
-    result = db_connection.find_by_id(execution_id)
+    db_connection = current_app.db_connection
+
+    result = db_connection.find_by_id("workflow-engine", "workflowExecution", execution_id)
     if result:
         return result
     else:
-        raise(f"Workflow execution {execution_id} not found", execution_id)
-
-
-    """
-    A function to execute a workflow
-
-    Parameters:
-        execution_id (string): A 24 character hexadecimal string with lowercase letters.
-
-    Returns:
-        none
-    """
-    if not re.match('^[0-9a-f]{24}$',execution_id):
-        abort(406, "Execution id must be 24 chacters hexadecimal string with lowercase letters")
-
-    execution = get_workflow_execution(execution_id)
-    definition = get_workflow_definition(execution["workflow_namespace"],execution["workflow_name"],execution["version"])
-
-    entrypoint = definition['entrypoint']
-    current_action = definition['workflow'][entrypoint]
-    step_name = entrypoint
-    workflow_complete = False
-    action_executions = {}
-
-    while not workflow_complete:
-        action_executions[step_name] = single_action_execute(current_action['action_namespace'], current_action['action_name'], current_action['version'], current_action['parameters'])
-         
-        if current_action['on_success'] != "complete_workflow":
-            next_step = current_action['on_success']
-            current_action = definition['workflow'][next_step]
-            step_name = next_step
-        else:
-            workflow_complete = True
-
-    workflow_result = {
-        "status": "success",
-        "action_executions": action_executions
-    }
-
-    update_workflow_result(execution_id, workflow_result)
+        abort(404, f"Workflow execution {execution_id} not found")
 
 
 def result(execution_id, runner_result):
@@ -108,7 +72,7 @@ def result(execution_id, runner_result):
     if not re.match('^[0-9a-f]{24}$',execution_id):
         abort(406, "Execution id must be 24 chacters hexadecimal string with lowercase letters")
 
-    db_connection = Database("workflow-engine", "runnerExecution")
+    db_connection = current_app.db_connection
 
     runner_result['time'] = int(time.time())
 
@@ -117,8 +81,9 @@ def result(execution_id, runner_result):
 
 
     query = {"_id": ObjectId(execution_id)}
-    result = db_connection.collection.update_one(query, {'$set':runner_result})
-    print("Insert Result: ", result.upserted_id)
+    result = db_connection.update_one("workflow-engine", "runnerExecution", query, runner_result)
+    response_cache.invalidate(("execution", execution_id))
+    print("Insert Result: ", result)
 
 def update_workflow_result(execution_id, workflow_result):
     """
@@ -132,7 +97,7 @@ def update_workflow_result(execution_id, workflow_result):
         none  
     """
 
-    global db_connection
+    db_connection = current_app.db_connection
 
     if not re.match('^[0-9a-f]{24}$',execution_id):
         abort(406, "Execution id must be 24 chacters hexadecimal string with lowercase letters")
@@ -144,7 +109,7 @@ def update_workflow_result(execution_id, workflow_result):
 
 
     query = {"_id": ObjectId(execution_id)}
-    result = db_connection.update_one("workflow-engine", "workflowExecution", query, {'$set':workflow_result})
+    result = db_connection.update_one("workflow-engine", "workflowExecution", query, workflow_result)
     return result
 
 
@@ -163,21 +128,70 @@ def get_execution(execution_id):
     "execution_status": Str ("submitted", "success", "failed")
     "parameters": The parameters for the action, this will be a string or object, depending on the action
 
+    A finished execution is cached in-process for a short time. Every response has a strong ETag and no-cache, so
+    clients revalidate it, a request with a matching If-None-Match gets a 304.
+
     Parameters:
         execution_id (string): A 24 character hexadecimal string with lowercase letters.
 
     Returns:
-        Dict: A dictory with the action execution information.
+        Response: The action execution information as JSON
     """
     if not re.match('^[0-9a-f]{24}$',execution_id):
         abort(406, "Execution id must be 24 chacters hexadecimal string with lowercase letters")
-    
-    global db_connection
-    result = db_connection.find_by_id("workflow-engine", "runnerExecution",execution_id)
-    if result:
-        return result
-    else:
-        abort(404, f"Execution {execution_id} not found")
+
+    key = ("execution", execution_id)
+    entry = response_cache.get("get_execution", key)
+    if entry is None:
+        db_connection = current_app.db_connection
+        start = time.monotonic()
+        result = db_connection.find_by_id("workflow-engine", "runnerExecution",execution_id)
+        if not result:
+            abort(404, f"Execution {execution_id} not found")
+        metrics.execution_lookup_seconds.labels(result.get("action_namespace"), result.get("action_name"), str(result.get("version"))).observe(time.monotonic() - start)
+        entry = execution_entry(result)
+        if entry["ttl"]:
+            response_cache.put(key, entry)
+
+    status, body, headers = respond("get_execution", entry, request.headers.get("If-None-Match"))
+    return Response(body, status, headers, mimetype="application/json")
+
+def list_executions(action_namespace=None, action_name=None, execution_status=None, since=None, until=None, fields=None, limit=100, after=None):
+    """
+    The function to list action executions, newest first, a page at a time.
+
+    Parameters:
+        action_namespace (Str): Optional, only executions of actions in this namespace
+        action_name (Str): Optional, only executions of actions with this name
+        execution_status (Str): Optional, only executions with this status
+        since (Float): Optional, only executions submitted at or after this unix timestamp
+        until (Float): Optional, only executions submitted before this unix timestamp
+        fields (List): Optional, the fields to return, by default the fields that describe the execution without its parameters and output
+        limit (Int): The most executions to return, at most 1000
+        after (Str): Optional, the next_cursor of the previous page
+
+    Returns:
+        Dict: The executions as items, and the next_cursor to get the next page with, None on the last page
+    """
+    filters = {"action_namespace": action_namespace, "action_name": action_name, "execution_status": execution_status}
+    return listing.list_documents("runnerExecution", filters, fields, limit, after, since, until)
+
+def list_action_definitions(namespace=None, action_name=None, fields=None, limit=100, after=None):
+    """
+    The function to list action definitions, newest first, a page at a time.
+
+    Parameters:
+        namespace (Str): Optional, only actions in this namespace
+        action_name (Str): Optional, only the versions of the action with this name
+        fields (List): Optional, the fields to return
+        limit (Int): The most definitions to return, at most 1000
+        after (Str): Optional, the next_cursor of the previous page
+
+    Returns:
+        Dict: The definitions as items, and the next_cursor to get the next page with, None on the last page
+    """
+    filters = {"namespace": namespace, "action_name": action_name}
+    return listing.list_documents("actionDefinition", filters, fields, limit, after)
 
 def get_action_definition(action_namespace,action_name,version):
     """
@@ -198,7 +212,7 @@ def get_action_definition(action_namespace,action_name,version):
             "container_tag": String,
             "parameter_schema": None, to be used later
     """
-    global db_connection
+    db_connection = current_app.db_connection
     
     query = {"$and": [
         {"namespace":action_namespace},
@@ -206,7 +220,8 @@ def get_action_definition(action_namespace,action_name,version):
         {"version":version}
     ]}
     
-    result = db_connection.find_one_by_query("workflow-engine", "actionDefinition",query)
+    with metrics.definition_lookup_seconds.labels("action", action_namespace, action_name, str(version)).time():
+        result = db_connection.find_one_by_query("workflow-engine", "actionDefinition",query)
     if result:
         return result
     else:
@@ -227,7 +242,7 @@ def create_execution_record(action_namespace,action_name,version,parameters,job_
     Returns:
         execution_id (Str): A 24 character hexadecimal string 
     """
-    global db_connection
+    db_connection = current_app.db_connection
 
     document = {
         "action_namespace": action_namespace,
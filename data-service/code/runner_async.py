@@ -0,0 +1,131 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+"""
+The aiohttp versions of the handlers in runner.py, for the data service running with app_async.py. They take the same
+parameters and return the same responses, with the database calls awaited.
+"""
+
+import re
+import time
+from bson.objectid import ObjectId
+from aiohttp import web
+from connexion.exceptions import ProblemException
+from modules.async_database import get_async_database
+from modules import listing
+from modules.response_cache import response_cache, execution_entry, respond
+from modules import metrics
+
+async def do_something():
+    pass
+
+async def get_execution(execution_id, request):
+    """
+    The function to get the information about an action execution. It will include the parameters the action should run with and if it has completed the result.
+    Finished executions are cached and answered with 304 the same way as runner.get_execution.
+
+    Parameters:
+        execution_id (string): A 24 character hexadecimal string with lowercase letters.
+        request (Request): The aiohttp request
+
+    Returns:
+        Response: The action execution information as JSON
+    """
+    if not re.match('^[0-9a-f]{24}$',execution_id):
+        raise ProblemException(406, "Not Acceptable", "Execution id must be 24 chacters hexadecimal string with lowercase letters")
+
+    key = ("execution", execution_id)
+    entry = response_cache.get("get_execution", key)
+    if entry is None:
+        start = time.monotonic()
+        result = await get_async_database().find_by_id("workflow-engine", "runnerExecution", execution_id)
+        if not result:
+            raise ProblemException(404, "Not Found", f"Execution {execution_id} not found")
+        metrics.execution_lookup_seconds.labels(result.get("action_namespace"), result.get("action_name"), str(result.get("version"))).observe(time.monotonic() - start)
+        entry = execution_entry(result)
+        if entry["ttl"]:
+            response_cache.put(key, entry)
+
+    return cached_response("get_execution", entry, request)
+
+def cached_response(endpoint, entry, request):
+    """
+    A function to answer a request with a response from cache_entry, or a 304 when the request already has it.
+
+    Parameters:
+        endpoint (Str): The endpoint the response is for, the label of the metrics
+        entry (Dict): The response from cache_entry
+        request (Request): The aiohttp request
+
+    Returns:
+        Response: The response
+    """
+    status, body, headers = respond(endpoint, entry, request.headers.get("If-None-Match"))
+    if status == 304:
+        return web.Response(status=status, headers=headers)
+    return web.Response(body=body, status=status, headers=headers, content_type="application/json")
+
+async def result(execution_id, runner_result):
+    """
+    A function to capture the result of an actin execution
+
+    Parameters:
+        execution_id (string): A 24 character hexadecimal string with lowercase letters.
+        runner_result (dict): A dictonary containg the result of the execution
+
+    Returns:
+        none
+    """
+    if not re.match('^[0-9a-f]{24}$',execution_id):
+        raise ProblemException(406, "Not Acceptable", "Execution id must be 24 chacters hexadecimal string with lowercase letters")
+
+    runner_result['time'] = int(time.time())
+    await get_async_database().update_one("workflow-engine", "runnerExecution", {"_id": ObjectId(execution_id)}, runner_result)
+    response_cache.invalidate(("execution", execution_id))
+
+async def list_executions(action_namespace=None, action_name=None, execution_status=None, since=None, until=None, fields=None, limit=100, after=None):
+    """
+    The function to list action executions, newest first, a page at a time. See runner.list_executions.
+
+    Returns:
+        Dict: The executions as items, and the next_cursor to get the next page with, None on the last page
+    """
+    filters = {"action_namespace": action_namespace, "action_name": action_name, "execution_status": execution_status}
+    return await list_documents("runnerExecution", filters, fields, limit, after, since, until)
+
+async def list_action_definitions(namespace=None, action_name=None, fields=None, limit=100, after=None):
+    """
+    The function to list action definitions, newest first, a page at a time. See runner.list_action_definitions.
+
+    Returns:
+        Dict: The definitions as items, and the next_cursor to get the next page with, None on the last page
+    """
+    filters = {"namespace": namespace, "action_name": action_name}
+    return await list_documents("actionDefinition", filters, fields, limit, after)
+
+async def list_documents(collection, filters, fields=None, limit=100, after=None, since=None, until=None):
+    """
+    A function to list a page of the documents of a collection, newest first. See listing.list_documents.
+
+    Returns:
+        Dict: The documents as items, and the next_cursor to get the next page with, None on the last page
+    """
+    try:
+        query, fields_projection, after = listing.list_query(collection, filters, fields, limit, after, since, until)
+    except listing.InvalidListRequest as error:
+        raise ProblemException(406, "Not Acceptable", str(error))
+
+    items, next_cursor = await get_async_database().find_page("workflow-engine", collection, query, fields_projection, limit, after)
+    return {"items": items, "next_cursor": next_cursor}
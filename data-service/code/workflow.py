@@ -14,19 +14,60 @@
 #      limitations under the License.
 
 
-from flask import abort, request, current_app
+from flask import abort, request, current_app, Response
+from modules import metrics
+from modules import listing
+from modules.response_cache import response_cache, definition_entry, respond
 
 
+def list_workflow_executions(workflow_namespace=None, workflow_name=None, status=None, since=None, until=None, fields=None, limit=100, after=None):
+    """
+    A function to list workflow executions, newest first, a page at a time.
+
+    Parameters:
+        workflow_namespace (Str): Optional, only executions of workflows in this namespace
+        workflow_name (Str): Optional, only executions of workflows with this name
+        status (Str): Optional, only executions with this status
+        since (Float): Optional, only executions submitted at or after this unix timestamp
+        until (Float): Optional, only executions submitted before this unix timestamp
+        fields (List): Optional, the fields to return, by default the fields that describe the execution without its parameters and result
+        limit (Int): The most executions to return, at most 1000
+        after (Str): Optional, the next_cursor of the previous page
+
+    Returns:
+        Dict: The executions as items, and the next_cursor to get the next page with, None on the last page
+    """
+    filters = {"workflow_namespace": workflow_namespace, "workflow_name": workflow_name, "status": status}
+    return listing.list_documents("workflowExecution", filters, fields, limit, after, since, until)
+
+def list_workflow_definitions(namespace=None, workflow_name=None, fields=None, limit=100, after=None):
+    """
+    A function to list workflow definitions, newest first, a page at a time.
+
+    Parameters:
+        namespace (Str): Optional, only workflows in this namespace
+        workflow_name (Str): Optional, only the versions of the workflow with this name
+        fields (List): Optional, the fields to return
+        limit (Int): The most definitions to return, at most 1000
+        after (Str): Optional, the next_cursor of the previous page
+
+    Returns:
+        Dict: The definitions as items, and the next_cursor to get the next page with, None on the last page
+    """
+    filters = {"namespace": namespace, "workflow_name": workflow_name}
+    return listing.list_documents("workflowDefinition", filters, fields, limit, after)
+
 def get_workflow_definition(bundle,name,version):
     """
-    A function to get the definitin of an workflow from the database
+    A function to get the definitin of an workflow from the database. The response is cached in-process and by
+    clients for definition_max_age seconds, and has a strong ETag, a request with a matching If-None-Match gets a 304.
     
     Parameters:
         bundle (Str): The bundle the action resides in
         workflow_name (Str): The name of the action
         version (Int): The version of the action
     Returns:
-        Dict: A dict with the defination of the action.
+        Response: The defination of the workflow as JSON.
         Schema:
             "namespace": String,
             "workflow_name": String,
@@ -35,16 +76,23 @@ def get_workflow_definition(bundle,name,version):
             "parameter_schema": None, to be used later
     """
 
-    db_connection = current_app.db_connection
-    
-    query = {"$and": [
-        {"namespace":bundle},
-        {"workflow_name":name},
-        {"version":version}
-    ]}
-
-    result = db_connection.find_one_by_query("workflow-engine", "workflowDefinition",query)
-    if result:
-        return result
-    else:
-        abort(406, f"Workflow {name} in bundle {bundle} with version {version} not found")
+    key = ("workflow_definition", bundle, name, version)
+    entry = response_cache.get("get_workflow_definition", key)
+    if entry is None:
+        db_connection = current_app.db_connection
+
+        query = {"$and": [
+            {"namespace":bundle},
+            {"workflow_name":name},
+            {"version":version}
+        ]}
+
+        with metrics.definition_lookup_seconds.labels("workflow", bundle, name, str(version)).time():
+            result = db_connection.find_one_by_query("workflow-engine", "workflowDefinition",query)
+        if not result:
+            abort(406, f"Workflow {name} in bundle {bundle} with version {version} not found")
+        entry = definition_entry(result)
+        response_cache.put(key, entry)
+
+    status, body, headers = respond("get_workflow_definition", entry, request.headers.get("If-None-Match"))
+    return Response(body, status, headers, mimetype="application/json")
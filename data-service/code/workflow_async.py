@@ -0,0 +1,75 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+"""
+The aiohttp versions of the handlers in workflow.py, for the data service running with app_async.py.
+"""
+
+from connexion.exceptions import ProblemException
+from modules.async_database import get_async_database
+from modules import metrics
+from modules.response_cache import response_cache, definition_entry
+from runner_async import list_documents, cached_response
+
+async def list_workflow_executions(workflow_namespace=None, workflow_name=None, status=None, since=None, until=None, fields=None, limit=100, after=None):
+    """
+    A function to list workflow executions, newest first, a page at a time. See workflow.list_workflow_executions.
+
+    Returns:
+        Dict: The executions as items, and the next_cursor to get the next page with, None on the last page
+    """
+    filters = {"workflow_namespace": workflow_namespace, "workflow_name": workflow_name, "status": status}
+    return await list_documents("workflowExecution", filters, fields, limit, after, since, until)
+
+async def list_workflow_definitions(namespace=None, workflow_name=None, fields=None, limit=100, after=None):
+    """
+    A function to list workflow definitions, newest first, a page at a time. See workflow.list_workflow_definitions.
+
+    Returns:
+        Dict: The definitions as items, and the next_cursor to get the next page with, None on the last page
+    """
+    filters = {"namespace": namespace, "workflow_name": workflow_name}
+    return await list_documents("workflowDefinition", filters, fields, limit, after)
+
+async def get_workflow_definition(bundle,name,version,request):
+    """
+    A function to get the definitin of an workflow from the database. Cached and answered with 304 the same way as
+    workflow.get_workflow_definition.
+
+    Parameters:
+        bundle (Str): The bundle the action resides in
+        workflow_name (Str): The name of the action
+        version (Int): The version of the action
+        request (Request): The aiohttp request
+    Returns:
+        Response: The defination of the workflow as JSON.
+    """
+    key = ("workflow_definition", bundle, name, version)
+    entry = response_cache.get("get_workflow_definition", key)
+    if entry is None:
+        query = {"$and": [
+            {"namespace":bundle},
+            {"workflow_name":name},
+            {"version":version}
+        ]}
+
+        with metrics.definition_lookup_seconds.labels("workflow", bundle, name, str(version)).time():
+            result = await get_async_database().find_one_by_query("workflow-engine", "workflowDefinition", query)
+        if not result:
+            raise ProblemException(406, "Not Acceptable", f"Workflow {name} in bundle {bundle} with version {version} not found")
+        entry = definition_entry(result)
+        response_cache.put(key, entry)
+
+    return cached_response("get_workflow_definition", entry, request)
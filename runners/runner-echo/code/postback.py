@@ -0,0 +1,225 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+
+import atexit
+import threading
+import time
+import requests
+
+class ResultBatcher:
+    """
+    Collects results in the background and posts them to the engine in batches, so a runner can go back to claiming
+    work without waiting on its postback. A batch is posted when it has max_batch results or its oldest result has
+    waited max_delay seconds. If a batch can not be posted the results are posted one at a time instead.
+    """
+
+    def __init__(self, postback_base_url, max_batch=100, max_delay=0.05, retries=3, session=None):
+        """
+        Parameters:
+            postback_base_url (Str): The runner url of the engine api, the batch is posted to its /results path
+            max_batch (Int): The most results posted in one request
+            max_delay (Float): The longest a result waits for its batch to fill, in seconds
+            retries (Int): The number of times a batch is retried before its results are posted one at a time
+            session (requests.Session): Optional, the session to post with
+        """
+        self.postback_base_url = postback_base_url
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.retries = retries
+        self.session = session or requests.Session()
+        self.pending = []
+        self.oldest = None
+        self.closed = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name="result-batcher", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def add(self, result):
+        """
+        Queue a result to be posted.
+
+        Parameters:
+            result (Dict): The result of an execution, with its execution_id
+        """
+        with self.condition:
+            if not self.pending:
+                self.oldest = time.monotonic()
+            self.pending.append(result)
+            if len(self.pending) >= self.max_batch:
+                self.condition.notify()
+
+    def close(self):
+        """
+        Post the results that are still queued and stop the background thread.
+        """
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.closed:
+                    if len(self.pending) >= self.max_batch:
+                        break
+                    if self.pending:
+                        remaining = self.oldest + self.max_delay - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self.condition.wait(remaining)
+                    else:
+                        self.condition.wait()
+                batch = self.pending[:self.max_batch]
+                self.pending = self.pending[self.max_batch:]
+                self.oldest = time.monotonic() if self.pending else None
+                closed = self.closed
+
+            if batch:
+                self.post(batch)
+            if closed and not batch:
+                return
+
+    def post(self, batch):
+        """
+        Post a batch of results, retrying with a backoff, and posting them one at a time if the batch keeps failing.
+
+        Parameters:
+            batch (List): The results to post
+        """
+        for attempt in range(self.retries):
+            try:
+                response = self.session.post(self.postback_base_url + "/results", json=batch, timeout=30)
+                if response.status_code == 200:
+                    for error in response.json().get("errors", []):
+                        print("Failed to post the result of " + error["execution_id"] + ": ", error["error"])
+                    return
+                print("Failed to post a batch of results, status code: ", response.status_code)
+                if response.status_code < 500:
+                    break
+            except requests.RequestException as error:
+                print("Failed to post a batch of results: ", error)
+            time.sleep(0.5 * 2 ** attempt)
+
+        for result in batch:
+            try:
+                response = self.session.post(self.postback_base_url + "/" + result["execution_id"], json=result, timeout=30)
+                print("Status Code: ", response.status_code)
+            except requests.RequestException as error:
+                print("Failed to post the result of " + result["execution_id"] + ": ", error)
+
+class LeaseRenewer:
+    """
+    Renews the lease of a claimed action in the background while it runs, so the engine does not give the action to
+    another worker. The lease is renewed every third of its length, until close.
+    """
+
+    def __init__(self, claim_url, execution_id, worker_id, lease_seconds):
+        """
+        Parameters:
+            claim_url (Str): The claim url of the runner pool
+            execution_id (Str): The execution id of the claimed action
+            worker_id (Str): The id of the worker that claimed the action
+            lease_seconds (Float): How long the lease lasts without being renewed
+        """
+        self.url = claim_url + "/" + execution_id
+        self.worker_id = worker_id
+        self.interval = lease_seconds / 3
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="lease-renewer", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                response = requests.post(self.url, json={"worker_id": self.worker_id}, timeout=10)
+                if response.status_code == 409:
+                    print("Lost the claim of the execution: ", self.url)
+                    return
+                if response.status_code != 200:
+                    print("Failed to renew the claim, status code: ", response.status_code)
+            except requests.RequestException as error:
+                print("Failed to renew the claim: ", error)
+
+    def close(self):
+        """
+        Stop renewing the lease.
+        """
+        self.stopped.set()
+        self.thread.join()
+
+class OutputWriter:
+    """
+    Streams the output of a running action to the engine. Written output is buffered, and sent by the first write
+    after flush_interval seconds, by a write that fills the buffer to max_buffer characters, or by close.
+    """
+
+    def __init__(self, postback_base_url, execution_id, flush_interval=1, max_buffer=65536, session=None):
+        """
+        Parameters:
+            postback_base_url (Str): The runner url of the engine api
+            execution_id (Str): The execution the output belongs to
+            flush_interval (Float): The longest output is buffered, in seconds
+            max_buffer (Int): The most characters buffered before they are sent
+            session (requests.Session): Optional, the session to post with
+        """
+        self.url = postback_base_url + "/" + execution_id + "/output"
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.session = session or requests.Session()
+        self.buffer = []
+        self.buffered = 0
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+    def write(self, output):
+        """
+        Buffer output to be sent.
+
+        Parameters:
+            output (Str): The output to append
+        """
+        with self.lock:
+            self.buffer.append(output)
+            self.buffered += len(output)
+            due = self.buffered >= self.max_buffer or time.monotonic() - self.last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Send the buffered output.
+        """
+        with self.lock:
+            output = "".join(self.buffer)
+            self.buffer = []
+            self.buffered = 0
+            self.last_flush = time.monotonic()
+            if not output:
+                return
+            try:
+                self.session.post(self.url, json={"output": output}, timeout=30)
+            except requests.RequestException as error:
+                print("Failed to send output: ", error)
+
+    def close(self):
+        """
+        Send the output still buffered.
+        """
+        self.flush()
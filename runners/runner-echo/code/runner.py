@@ -14,24 +14,118 @@
 #      limitations under the License.
 
 import os
+import socket
+import time
 import requests
+from postback import LeaseRenewer, ResultBatcher
+from time import sleep
 
 
-pod_id = os.environ['POD_ID']
-job_id = os.environ['JOB_ID']
-execution_id = os.environ['EXECUTION_ID']
-echo_data = os.environ["RUNNER_ARGS"]
-url = os.environ["POSTBACK_BASE_URL"] + "/" + execution_id
+def run(runner_args):
+    """
+    Run the action. The echo runner returns its arguments as the output.
 
-data = {
-    "job_id": job_id,
-    "pod_id": pod_id,
-    "execution_id": execution_id,
-    "execution_status": "success",
-    "execution_output": echo_data,
-}
+    Parameters:
+        runner_args (Str): The arguments of the action
 
-response = requests.post(url, json=data)
+    Returns:
+        Str: The execution status ("success", "failed")
+        Str: The execution output
+    """
+    return "success", runner_args
 
-print("Status Code: ", response.status_code)
-print("Data: ", data)
\ No newline at end of file
+def run_once():
+    """
+    Run a single action with the arguments from the environment, this is how the runner runs as a kubernetes job.
+    """
+    pod_id = os.environ['POD_ID']
+    job_id = os.environ['JOB_ID']
+    execution_id = os.environ['EXECUTION_ID']
+    echo_data = os.environ["RUNNER_ARGS"]
+    url = os.environ["POSTBACK_BASE_URL"] + "/" + execution_id
+
+    start_time = time.time()
+    execution_status, execution_output = run(echo_data)
+    data = {
+        "job_id": job_id,
+        "pod_id": pod_id,
+        "execution_id": execution_id,
+        "execution_status": execution_status,
+        "execution_output": execution_output,
+        "start_time": start_time,
+    }
+
+    response = requests.post(url, json=data)
+
+    print("Status Code: ", response.status_code)
+    print("Data: ", data)
+
+def run_loop():
+    """
+    Run as a long lived worker of a runner pool. Work is claimed from the engine, run, and the result posted back,
+    until the process is stopped. The claim waits on the engine side for work, up to CLAIM_WAIT seconds, so an idle
+    worker does not spin. The claim of the running action is renewed in the background so the engine does not give it
+    to another worker.
+    An action that raises is posted back as failed, and a failed postback is logged and the worker keeps looping.
+    If POSTBACK_BATCH_SIZE is more than 1 the results are posted in the background in batches of up to that size.
+    """
+    pod_id = os.environ.get('POD_ID', socket.gethostname())
+    claim_url = os.environ["RUNNER_POOL_URL"]
+    postback_base_url = os.environ["POSTBACK_BASE_URL"]
+    session = requests.Session()
+    batch_size = int(os.environ.get("POSTBACK_BATCH_SIZE", 1))
+    batcher = ResultBatcher(postback_base_url, batch_size, float(os.environ.get("POSTBACK_BATCH_DELAY", 0.05))) if batch_size > 1 else None
+    claim_wait = int(os.environ.get("CLAIM_WAIT", 5))
+
+    while True:
+        claim_start = time.monotonic()
+        try:
+            response = session.post(claim_url, json={"worker_id": pod_id}, params={"wait": claim_wait}, timeout=claim_wait + 10)
+        except requests.RequestException as error:
+            print("Failed to claim work: ", error)
+            sleep(1)
+            continue
+        if response.status_code == 204:
+            # The engine returns right away when too many claims are already waiting
+            if time.monotonic() - claim_start < claim_wait:
+                sleep(1)
+            continue
+        elif response.status_code != 200:
+            print("Failed to claim work, status code: ", response.status_code)
+            sleep(1)
+            continue
+
+        work = response.json()
+        start_time = time.time()
+        renewer = LeaseRenewer(claim_url, work["execution_id"], pod_id, work["lease_seconds"])
+        try:
+            execution_status, execution_output = run(work["runner_args"])
+        except Exception as error:
+            print("Failed to run execution: ", work["execution_id"], error)
+            execution_status, execution_output = "failed", str(error)
+        finally:
+            renewer.close()
+        data = {
+            "job_id": work["job_id"],
+            "pod_id": pod_id,
+            "execution_id": work["execution_id"],
+            "execution_status": execution_status,
+            "execution_output": execution_output,
+            "start_time": start_time,
+        }
+
+        if batcher:
+            batcher.add(data)
+        else:
+            try:
+                response = session.post(postback_base_url + "/" + work["execution_id"], json=data, timeout=30)
+                print("Status Code: ", response.status_code)
+            except requests.RequestException as error:
+                print("Failed to post back result: ", work["execution_id"], error)
+        print("Data: ", data)
+
+if __name__ == "__main__":
+    if os.environ.get("RUNNER_MODE") == "loop":
+        run_loop()
+    else:
+        run_once()
@@ -0,0 +1,98 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+"""
+Compares the database overhead of one workflow step with a new MongoClient per Database object (the old behaviour)
+against the shared client pool. A step does the same reads and writes as execute_workflow: the action definition lookup,
+the execution record insert, the status polls and the result write.
+
+Usage:
+    python bench_database.py --conf-home /opt/llamaflow/conf --steps 200 --polls 3
+"""
+
+import argparse
+import os
+import sys
+import time
+import urllib.parse
+from pymongo import MongoClient
+from bson import ObjectId
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "code"))
+from modules.database import Database, get_db_config
+
+def new_client_database(conf_home, database, collection):
+    """
+    Build a Database object the way it was built before the client pool, with its own MongoClient.
+    """
+    db_config = get_db_config(conf_home)
+    username = urllib.parse.quote_plus(db_config['username'])
+    password = urllib.parse.quote_plus(db_config['password'])
+    db_connection = Database.__new__(Database)
+    db_connection.mongo_client = MongoClient('mongodb://%s:%s@%s:%s' % (username, password, db_config['host'], db_config['port']))
+    db_connection.database = db_connection.mongo_client[database]
+    db_connection.collection = db_connection.database[collection]
+    return db_connection
+
+def run_step(make_database, polls):
+    """
+    Run the database calls of one workflow step and close any client the step opened.
+    """
+    opened = []
+    def database(collection):
+        db_connection = make_database("llamaflow-benchmark", collection)
+        opened.append(db_connection)
+        return db_connection
+
+    database("actionDefinition").find_one_by_query({"namespace": "core", "action_name": "echo", "version": 1})
+    execution_id = database("runnerExecution").insert_document({"execution_status": "submitted"})
+    for poll in range(polls):
+        database("runnerExecution").find_by_id(execution_id)
+    database("runnerExecution").collection.update_one({"_id": ObjectId(execution_id)}, {"$set": {"execution_status": "success"}})
+    return opened
+
+def measure(name, make_database, steps, polls, close):
+    """
+    Time a number of workflow steps and print the average time per step.
+    """
+    start = time.perf_counter()
+    for step in range(steps):
+        opened = run_step(make_database, polls)
+        if close:
+            for db_connection in opened:
+                db_connection.mongo_client.close()
+    elapsed = time.perf_counter() - start
+    print(f"{name:>12}: {elapsed / steps * 1000:8.2f} ms per step ({steps} steps)")
+    return elapsed / steps
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conf-home", default=Database.conf_home)
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--polls", type=int, default=3)
+    args = parser.parse_args()
+
+    Database.conf_home = args.conf_home
+    Database("llamaflow-benchmark", "actionDefinition").insert_document({"namespace": "core", "action_name": "echo", "version": 1})
+
+    try:
+        fresh = measure("new client", lambda database, collection: new_client_database(args.conf_home, database, collection), args.steps, args.polls, True)
+        pooled = measure("shared pool", Database, args.steps, args.polls, False)
+        print(f"per step db overhead reduced by {(1 - pooled / fresh) * 100:.1f}%")
+    finally:
+        Database("llamaflow-benchmark", "actionDefinition").mongo_client.drop_database("llamaflow-benchmark")
+
+if __name__ == "__main__":
+    main()
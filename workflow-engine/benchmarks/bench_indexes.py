@@ -0,0 +1,137 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+"""
+Measures the latency of the engine's hot lookups against a large execution history, first with only the _id index and
+then with the indexes of modules/indexes.py, and prints the p50 and p95 latency and the documents examined per lookup.
+The lookups are the definition lookup, the workflow executor claiming queued and expired work, the idempotency key
+check of a submission and a runner pool claim. Needs a real mongod, the indexes make no difference to mongomock.
+
+Usage:
+    python bench_indexes.py --conf-home /opt/llamaflow/conf --executions 1000000 --lookups 200
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from pymongo import ASCENDING, DESCENDING
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "code"))
+from modules.database import Database
+from modules import indexes
+
+database = "llamaflow-benchmark"
+
+def seed(executions, definitions, batch):
+    """
+    Insert the definitions, and the workflow and runner executions of a long history: nearly all finished, a few queued
+    or running, and one in ten submitted with an idempotency key.
+    """
+    now = time.time()
+    Database(database, "workflowDefinition").collection.insert_many(
+        [{"namespace": f"ns{number % 50}", "workflow_name": f"workflow{number}", "version": 1, "workflow": {}} for number in range(definitions)])
+    Database(database, "actionDefinition").collection.insert_many(
+        [{"namespace": f"ns{number % 50}", "action_name": f"action{number}", "version": 1, "runner_pool": f"pool{number % 10}"} for number in range(definitions)])
+
+    workflow_executions = Database(database, "workflowExecution").collection
+    runner_executions = Database(database, "runnerExecution").collection
+    for start in range(0, executions, batch):
+        workflows = []
+        runners = []
+        for number in range(start, min(start + batch, executions)):
+            status = "queued" if number % 10000 == 0 else "running" if number % 10000 == 1 else "failed" if number % 20 == 0 else "success"
+            workflow = {"workflow_namespace": f"ns{number % 50}", "workflow_name": f"workflow{number % definitions}", "version": 1,
+                "status": status, "priority": number % 3, "queued_time": now - executions + number, "parameters": {"number": number}}
+            if status == "running":
+                workflow["lease_expires"] = now + 30
+            if number % 10 == 0:
+                workflow["idempotency_key"] = f"key{number}"
+            workflows.append(workflow)
+            runner = {"action_namespace": f"ns{number % 50}", "action_name": f"action{number % definitions}", "version": 1,
+                "execution_status": "queued" if number % 10000 == 0 else status if status in ("failed", "success") else "submitted"}
+            if number % 4 == 0:
+                runner["runner_pool"] = f"pool{number % 10}"
+            runners.append(runner)
+        workflow_executions.insert_many(workflows, ordered=False)
+        runner_executions.insert_many(runners, ordered=False)
+        print(f"seeded {min(start + batch, executions)} of {executions} executions", end="\r")
+    print()
+
+def lookups(executions, definitions):
+    """
+    The lookups to time, each a function of a random number returning the cursor of one lookup.
+    """
+    now = time.time()
+    return {
+        "definition": lambda number: Database(database, "actionDefinition").collection.find(
+            {"$and": [{"namespace": f"ns{number % definitions % 50}"}, {"action_name": f"action{number % definitions}"}, {"version": 1}]}).limit(1),
+        "claim queued": lambda number: Database(database, "workflowExecution").collection.find(
+            {"status": "queued"}).sort([("priority", DESCENDING), ("queued_time", ASCENDING)]).limit(1),
+        "claim expired": lambda number: Database(database, "workflowExecution").collection.find(
+            {"status": "running", "lease_expires": {"$lt": now}}).sort([("lease_expires", ASCENDING)]).limit(1),
+        "idempotency key": lambda number: Database(database, "workflowExecution").collection.find(
+            {"idempotency_key": f"key{number % executions // 10 * 10}"}, {"_id": 1}).limit(1),
+        "pool claim": lambda number: Database(database, "runnerExecution").collection.find(
+            {"runner_pool": f"pool{number % 10}", "execution_status": "queued"}).sort([("_id", ASCENDING)]).limit(1),
+    }
+
+def docs_examined(cursor):
+    """
+    Get the number of documents a lookup examined from its explain output.
+    """
+    return cursor.explain().get("executionStats", {}).get("totalDocsExamined")
+
+def measure(label, lookups, count):
+    """
+    Time each lookup a number of times and print its p50 and p95 latency in milliseconds.
+    """
+    results = {}
+    for name, lookup in lookups.items():
+        latencies = []
+        for attempt in range(count):
+            number = random.randrange(1 << 30)
+            start = time.perf_counter()
+            list(lookup(number))
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        results[name] = (latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)], docs_examined(lookup(0)))
+        print(f"{label:>10} {name:>16}: p50 {results[name][0]:9.2f} ms  p95 {results[name][1]:9.2f} ms  docs examined {results[name][2]}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conf-home", default=Database.conf_home)
+    parser.add_argument("--executions", type=int, default=1000000)
+    parser.add_argument("--definitions", type=int, default=1000)
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=10000)
+    args = parser.parse_args()
+
+    Database.conf_home = args.conf_home
+    try:
+        seed(args.executions, args.definitions, args.batch)
+        timed = lookups(args.executions, args.definitions)
+        scans = measure("_id only", timed, args.lookups)
+        indexes.create_indexes(database)
+        indexed = measure("indexed", timed, args.lookups)
+        for name in timed:
+            print(f"{name:>16}: p50 {scans[name][0] / indexed[name][0]:8.1f}x faster with the indexes")
+    finally:
+        Database(database, "workflowExecution").mongo_client.drop_database(database)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+"""
+Creates jobs through JobSubmitter against a stand-in for the kubernetes BatchV1Api that throttles every third create
+request with a 429, the way an API server under load does. It compares creating the jobs one at a time, the way a
+single action step does, against creating them concurrently, the way submit_executions does for the runs of a map step
+admitted together, and prints the jobs per second, the throttled requests and the time spent backing off.
+
+With --retry-after 0 the 429s carry no Retry-After header, so the exponential backoff with jitter is measured instead.
+The retries of concurrent requests that were throttled together come back together, so a job can be throttled
+several times in a row, --max-retries sets how many times before its creation fails.
+No kubernetes cluster or mongod is needed.
+
+Usage:
+    python bench_job_submit.py --jobs 300 --throttle-every 3 --latency 0.01 --max-in-flight 16
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from kubernetes.client.rest import ApiException
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "code"))
+import modules.kube as kube
+
+class ThrottlingBatchApi:
+    """
+    Stands in for kubernetes.client.BatchV1Api. Each create request takes latency seconds, and every throttle_every-th
+    request is rejected with a 429.
+    """
+
+    latency = 0.01
+    throttle_every = 3
+    retry_after = 0.05
+    lock = threading.Lock()
+    requests = 0
+    throttled = 0
+
+    def __init__(self, api_client=None):
+        pass
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            cls.requests = 0
+            cls.throttled = 0
+
+    def create_namespaced_job(self, namespace, body):
+        time.sleep(self.latency)
+        with ThrottlingBatchApi.lock:
+            ThrottlingBatchApi.requests += 1
+            throttle = self.throttle_every and ThrottlingBatchApi.requests % self.throttle_every == 0
+            if throttle:
+                ThrottlingBatchApi.throttled += 1
+        if throttle:
+            error = ApiException(status=429, reason="Too Many Requests")
+            error.headers = {"Retry-After": str(self.retry_after)} if self.retry_after else {}
+            raise error
+        return body
+
+def make_jobs(count):
+    return [{"metadata": {"name": f"bench-{index}"}} for index in range(count)]
+
+def one_at_a_time(submitter, jobs):
+    return [submitter.create_job(job) for job in jobs]
+
+def concurrent(submitter, jobs):
+    return submitter.create_jobs(jobs)
+
+def measure(name, create, submitter, jobs):
+    """
+    Time creating the jobs and print the jobs created per second with the number of throttled requests.
+    """
+    ThrottlingBatchApi.reset()
+    retry_after = submitter.retry_after
+    backoff = {"seconds": 0.0}
+    backoff_lock = threading.Lock()
+
+    def counted_retry_after(error, current_backoff):
+        seconds = retry_after(error, current_backoff)
+        with backoff_lock:
+            backoff["seconds"] += seconds
+        return seconds
+
+    submitter.retry_after = counted_retry_after
+    try:
+        start = time.perf_counter()
+        created = create(submitter, jobs)
+        elapsed = time.perf_counter() - start
+    finally:
+        submitter.retry_after = retry_after
+
+    print(f"{name:>14}: {len(created) / elapsed:8.0f} jobs per second ({len(created)} jobs, {ThrottlingBatchApi.requests} requests, "
+          f"{ThrottlingBatchApi.throttled} throttled, {backoff['seconds']:.2f}s backing off)")
+    return len(created) / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=300)
+    parser.add_argument("--throttle-every", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--retry-after", type=float, default=0.05)
+    parser.add_argument("--max-in-flight", type=int, default=16)
+    parser.add_argument("--max-retries", type=int, default=10)
+    parser.add_argument("--backoff", type=float, default=0.05)
+    args = parser.parse_args()
+
+    ThrottlingBatchApi.latency = args.latency
+    ThrottlingBatchApi.throttle_every = args.throttle_every
+    ThrottlingBatchApi.retry_after = args.retry_after
+    kube.client.BatchV1Api = ThrottlingBatchApi
+    kube.get_api_client = lambda connection_pool_size: None
+
+    submitter = kube.JobSubmitter("bench", args.max_in_flight, args.max_in_flight, args.max_retries, args.backoff)
+    jobs = make_jobs(args.jobs)
+    single = measure("one at a time", one_at_a_time, submitter, jobs)
+    batch = measure("concurrent", concurrent, submitter, jobs)
+    print(f"concurrent creation sustains {batch / single:.1f}x the jobs per second")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+"""
+Compares converting a runnerExecution document for the API with a json_util.dumps and json.loads round trip (the old
+behaviour of Database.find_by_id) against json_safe. Documents of 1 KB, 100 KB and 10 MB of runner output are used.
+No database is needed, the documents are built in memory the way pymongo returns them.
+
+Usage:
+    python bench_json_safe.py --repeat 20
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+import tracemalloc
+from bson import ObjectId, json_util
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "code"))
+from modules.database import json_safe
+
+sizes = {"1 KB": 1024, "100 KB": 100 * 1024, "10 MB": 10 * 1024 * 1024}
+
+def build_document(output_size):
+    """
+    Build a runnerExecution document with an execution_output of the given size.
+    """
+    return {
+        "_id": ObjectId(),
+        "action_namespace": "core",
+        "action_name": "echo",
+        "version": 1,
+        "parameters": {"hosts": ["host-%d" % host for host in range(10)]},
+        "job_id": "core-echo-1715000000000000000",
+        "pod_id": "core-echo-1715000000000000000-abcde",
+        "execution_status": "success",
+        "execution_output": "x" * output_size,
+        "submitted": datetime.datetime.utcnow(),
+        "time": 1715000000,
+    }
+
+def round_trip(document):
+    """
+    Convert a document the way Database.find_by_id did before json_safe.
+    """
+    return json.loads(json_util.dumps(document))
+
+def measure(convert, document, repeat):
+    """
+    Time a conversion and measure the peak memory it allocates.
+
+    Returns:
+        Tuple: The average seconds per conversion and the peak bytes allocated
+    """
+    start = time.perf_counter()
+    for attempt in range(repeat):
+        convert(document)
+    elapsed = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    convert(document)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'round trip':>14} {'json_safe':>14} {'speedup':>8} {'round trip peak':>16} {'json_safe peak':>16}")
+    for name, size in sizes.items():
+        document = build_document(size)
+        assert round_trip(document) == json_safe(document)
+        old_time, old_peak = measure(round_trip, document, args.repeat)
+        new_time, new_peak = measure(json_safe, document, args.repeat)
+        print(f"{name:>8} {old_time * 1000:11.3f} ms {new_time * 1000:11.3f} ms {old_time / new_time:7.1f}x "
+              f"{old_peak / 1024:13.1f} KB {new_peak / 1024:13.1f} KB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+"""
+Compares writing runner results one update per result, the way POST /api/runner/{execution_id} does, against one
+unordered bulk write per batch, the way POST /api/runner/results does, and prints the results per second of each.
+
+Usage:
+    python bench_postback.py --conf-home /opt/llamaflow/conf --results 5000 --batch 100
+"""
+
+import argparse
+import os
+import sys
+import time
+from pymongo import UpdateOne
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "code"))
+from modules.database import Database
+
+def make_results(db_connection, count):
+    """
+    Insert submitted runner executions and build a result for each of them.
+    """
+    inserted = db_connection.collection.insert_many([{"execution_status": "submitted"} for execution in range(count)])
+    return [{"_id": execution_id, "execution_status": "success", "execution_output": "x" * 200, "time": int(time.time())} for execution_id in inserted.inserted_ids]
+
+def single_updates(db_connection, results, batch):
+    for result in results:
+        db_connection.collection.update_one({"_id": result["_id"]}, {"$set": {key: value for key, value in result.items() if key != "_id"}})
+
+def bulk_updates(db_connection, results, batch):
+    for start in range(0, len(results), batch):
+        operations = [UpdateOne({"_id": result["_id"]}, {"$set": {key: value for key, value in result.items() if key != "_id"}}) for result in results[start:start + batch]]
+        db_connection.collection.bulk_write(operations, ordered=False)
+
+def measure(name, write, db_connection, count, batch):
+    """
+    Time writing a number of results and print the results written per second.
+    """
+    results = make_results(db_connection, count)
+    start = time.perf_counter()
+    write(db_connection, results, batch)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>12}: {count / elapsed:10.0f} results per second ({count} results)")
+    return count / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conf-home", default=Database.conf_home)
+    parser.add_argument("--results", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args()
+
+    Database.conf_home = args.conf_home
+    db_connection = Database("llamaflow-benchmark", "runnerExecution")
+
+    try:
+        single = measure("update_one", single_updates, db_connection, args.results, args.batch)
+        bulk = measure("bulk_write", bulk_updates, db_connection, args.results, args.batch)
+        print(f"bulk writes sustain {bulk / single:.1f}x the results per second")
+    finally:
+        db_connection.mongo_client.drop_database("llamaflow-benchmark")
+
+if __name__ == "__main__":
+    main()
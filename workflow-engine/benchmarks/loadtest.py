@@ -0,0 +1,332 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+"""
+Load test of the workflow engine. N workflows of a chosen shape are submitted at once and run by the real workflow
+executor, submit_execution and the POST /api/runner/{execution_id} postback endpoint. The kubernetes API server is
+replaced with a fake one, and every job it is asked to create becomes a simulated runner that posts its result back
+through the Flask app after a configurable delay.
+
+The database is mongomock by default, or a real mongod with --conf-home pointing at a directory with a db.yaml.
+
+Reported, and saved as JSON with --output so runs can be compared across commits:
+    throughput in workflows and steps per second
+    p50/p95/p99 end to end workflow latency, from enqueue to the result being written
+    per step engine overhead, the workflow latency less the simulated runner time on its critical path, per step
+    database operations per step
+
+Usage:
+    python loadtest.py --workflows 200 --shape fanout --steps 5 --runner-delay 0.05 --output results.json
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+code_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "code")
+sys.path.insert(0, code_dir)
+
+def percentile(values, percent):
+    """
+    Get a percentile of a list of values, using the nearest rank.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(percent / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+def build_definition(shape, steps, max_parallel):
+    """
+    Build a workflow definition of the requested shape, using the loadtest/sim action.
+        linear: steps run one after another
+        fanout: a first step, steps run in parallel, then a join step
+        map: a single map step over steps items
+    """
+    def step(parameters):
+        return {"action_namespace": "loadtest", "action_name": "sim", "version": 1, "parameters": parameters}
+
+    workflow = {}
+    if shape == "linear":
+        for index in range(steps):
+            workflow[f"step{index}"] = dict(step(index), on_success=f"step{index + 1}" if index + 1 < steps else "complete_workflow")
+    elif shape == "fanout":
+        branches = [f"branch{index}" for index in range(steps)]
+        workflow["start"] = dict(step("start"), on_success=branches)
+        for index, branch in enumerate(branches):
+            workflow[branch] = step(index)
+        workflow["join"] = dict(step("join"), depends_on=branches, on_success="complete_workflow")
+    elif shape == "map":
+        workflow["map"] = dict(step(None), type="map", items=list(range(steps)), max_parallel=max_parallel, on_success="complete_workflow")
+        del workflow["map"]["parameters"]
+
+    return {
+        "namespace": "loadtest",
+        "workflow_name": shape,
+        "version": 1,
+        "entrypoint": "start" if shape == "fanout" else ("map" if shape == "map" else "step0"),
+        "max_concurrency": max_parallel,
+        "workflow": workflow,
+    }
+
+def critical_path(shape, steps, action_executions, delays):
+    """
+    Get the simulated runner time on the critical path of a finished workflow.
+    """
+    if shape == "linear":
+        return sum(delays[action_executions[f"step{index}"]] for index in range(steps))
+    elif shape == "fanout":
+        branches = [delays[action_executions[f"branch{index}"]] for index in range(steps)]
+        return delays[action_executions["start"]] + max(branches) + delays[action_executions["join"]]
+    else:
+        return max(delays[execution_id] for execution_id in action_executions["map"])
+
+def steps_per_workflow(shape, steps):
+    """
+    Get the number of actions one workflow of a shape runs.
+    """
+    return steps + 2 if shape == "fanout" else steps
+
+class OperationCounter:
+    """
+    Counts the database operations the engine sends, with a pymongo command listener for a real mongod or by wrapping
+    the collection methods of mongomock.
+    """
+
+    methods = ["find", "find_one", "find_one_and_update", "insert_one", "insert_many", "update_one", "update_many",
+               "replace_one", "delete_one", "delete_many", "bulk_write", "count_documents", "aggregate"]
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def increment(self):
+        with self.lock:
+            self.count = self.count + 1
+
+    def install_mongomock(self, collection_class):
+        counter = self
+        for name in self.methods:
+            original = getattr(collection_class, name, None)
+            if original is None:
+                continue
+            def counted(self, *args, _original=original, **kwargs):
+                counter.increment()
+                return _original(self, *args, **kwargs)
+            setattr(collection_class, name, counted)
+
+    def install_pymongo(self):
+        from pymongo import monitoring
+        counter = self
+
+        class Listener(monitoring.CommandListener):
+            def started(self, event):
+                if event.command_name not in ("isMaster", "hello", "ping", "endSessions", "saslStart", "saslContinue"):
+                    counter.increment()
+            def succeeded(self, event):
+                pass
+            def failed(self, event):
+                pass
+
+        monitoring.register(Listener())
+
+def setup_database(args, counter):
+    """
+    Point the engine at mongomock or a real mongod and start counting operations.
+    """
+    import modules.database as database
+    from modules import notifier
+
+    if args.conf_home:
+        counter.install_pymongo()
+        database.Database.conf_home = args.conf_home
+        return database.Database("workflow-engine", "workflowExecution").mongo_client
+
+    import mongomock
+    counter.install_mongomock(mongomock.collection.Collection)
+    mongo_client = mongomock.MongoClient()
+    database.MongoClient = lambda *client_args, **client_kwargs: mongo_client
+    database.db_configs[database.Database.conf_home] = {"host": "mongomock", "port": 27017, "username": "loadtest", "password": "loadtest"}
+    # mongomock has no change streams, the in-process notifier covers every postback in a single process
+    notifier.watcher = threading.current_thread()
+    return mongo_client
+
+class FakeBatchApi:
+    """
+    Stands in for kubernetes.client.BatchV1Api. Each created job becomes a simulated runner that posts its result to
+    the postback endpoint of the Flask app after its delay.
+    """
+
+    def __init__(self, api_client=None):
+        pass
+
+    def create_namespaced_job(self, namespace, body):
+        environment = {variable['name']: variable.get('value') for variable in body['spec']['template']['spec']['containers'][0]['env']}
+        simulator.start_runner(environment['EXECUTION_ID'], environment['JOB_ID'], environment['RUNNER_ARGS'])
+        return body
+
+class RunnerSimulator:
+    """
+    Runs the simulated runners, each is a timer that posts the result back through the Flask test client.
+    """
+
+    def __init__(self, flask_app, delay, jitter, failure_rate):
+        self.flask_app = flask_app
+        self.delay = delay
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.delays = {}
+        self.lock = threading.Lock()
+
+    def start_runner(self, execution_id, job_id, runner_args):
+        delay = max(0, self.delay + random.uniform(-self.jitter, self.jitter))
+        with self.lock:
+            self.delays[execution_id] = delay
+        timer = threading.Timer(delay, self.post_result, (execution_id, job_id, runner_args))
+        timer.daemon = True
+        timer.start()
+
+    def post_result(self, execution_id, job_id, runner_args):
+        execution_status = "failed" if random.random() < self.failure_rate else "success"
+        with self.flask_app.test_client() as test_client:
+            test_client.post("/api/runner/" + execution_id, json={
+                "job_id": job_id,
+                "pod_id": job_id,
+                "execution_status": execution_status,
+                "execution_output": runner_args,
+            })
+
+simulator = None
+
+def main():
+    global simulator
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workflows", type=int, default=100, help="number of workflows submitted at once")
+    parser.add_argument("--shape", choices=["linear", "fanout", "map"], default="linear")
+    parser.add_argument("--steps", type=int, default=3, help="steps per workflow, branches for fanout, items for map")
+    parser.add_argument("--max-parallel", type=int, default=10, help="max_concurrency of the workflow and max_parallel of a map step")
+    parser.add_argument("--executor-workers", type=int, default=256)
+    parser.add_argument("--runner-delay", type=float, default=0.05, help="seconds a simulated runner takes")
+    parser.add_argument("--runner-jitter", type=float, default=0.0, help="random seconds added or removed from the delay")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of simulated runners that fail")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--conf-home", help="directory with a db.yaml for a real mongod, mongomock is used without it")
+    parser.add_argument("--output", help="file to save the results to as JSON")
+    args = parser.parse_args()
+
+    counter = OperationCounter()
+    mongo_client = setup_database(args, counter)
+
+    import modules.kube as kube
+    import modules.definitions as definitions
+    kube.client.BatchV1Api = FakeBatchApi
+    kube.get_api_client = lambda connection_pool_size: None
+    if not args.conf_home:
+        definitions.DefinitionWatcher.start = lambda watcher: None
+
+    import app
+    import runner
+    from modules.executor import WorkflowExecutor
+
+    simulator = RunnerSimulator(app.app.app, args.runner_delay, args.runner_jitter, args.failure_rate)
+    database = mongo_client["workflow-engine"]
+    database.workflowDefinition.delete_many({"namespace": "loadtest"})
+    database.actionDefinition.delete_many({"namespace": "loadtest"})
+    database.workflowDefinition.insert_one(build_definition(args.shape, args.steps, args.max_parallel))
+    database.actionDefinition.insert_one({"namespace": "loadtest", "action_name": "sim", "version": 1, "container_repo": "loadtest",
+                                          "container_name": "sim", "container_tag": "1", "execution_backend": "kubernetes"})
+
+    finished = {}
+    finished_lock = threading.Lock()
+    all_finished = threading.Event()
+    update_workflow_result = runner.update_workflow_result
+    def record_finish(execution_id, workflow_result, owner=None):
+        update_workflow_result(execution_id, workflow_result, owner)
+        with finished_lock:
+            finished[execution_id] = (time.perf_counter(), workflow_result["status"], workflow_result.get("action_executions", {}))
+            if len(finished) == args.workflows:
+                all_finished.set()
+    runner.update_workflow_result = record_finish
+
+    runner.workflow_executor = WorkflowExecutor(runner.run_workflow, args.executor_workers, 1)
+    runner.workflow_executor.start()
+
+    execution_ids = [str(database.workflowExecution.insert_one({"workflow_namespace": "loadtest", "workflow_name": args.shape, "version": 1,
+                                                                "status": "submitted"}).inserted_id) for workflow in range(args.workflows)]
+
+    operations_before = counter.count
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        enqueued = {}
+        for execution_id in execution_ids:
+            enqueued[execution_id] = time.perf_counter()
+            runner.enqueue_workflow(execution_id)
+        completed = all_finished.wait(args.timeout)
+        elapsed = time.perf_counter() - start
+    operations = counter.count - operations_before
+
+    steps = steps_per_workflow(args.shape, args.steps)
+    latencies = []
+    overheads = []
+    failed = 0
+    for execution_id, (finish_time, status, action_executions) in finished.items():
+        latency = finish_time - enqueued[execution_id]
+        latencies.append(latency)
+        if status != "success":
+            failed = failed + 1
+            continue
+        overheads.append((latency - critical_path(args.shape, args.steps, action_executions, simulator.delays)) / steps)
+
+    step_count = steps * (len(finished) - failed)
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=code_dir).stdout.strip()
+    except OSError:
+        commit = None
+
+    results = {
+        "time": datetime.datetime.utcnow().isoformat() + "Z",
+        "commit": commit,
+        "config": vars(args),
+        "database": "mongod" if args.conf_home else "mongomock",
+        "completed": completed,
+        "workflows": len(finished),
+        "failed_workflows": failed,
+        "elapsed_seconds": elapsed,
+        "workflows_per_second": len(finished) / elapsed,
+        "steps_per_second": step_count / elapsed,
+        "latency_seconds": {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95), "p99": percentile(latencies, 99), "max": max(latencies) if latencies else None},
+        "step_overhead_seconds": {"p50": percentile(overheads, 50), "p95": percentile(overheads, 95), "p99": percentile(overheads, 99)},
+        "db_operations": operations,
+        "db_operations_per_step": operations / step_count if step_count else None,
+    }
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    os._exit(0 if completed else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+"""
+Scale out test of the workflow engine. The same batch of workflows is run by 1, 2, 4... engine processes sharing one
+mongod, and the throughput of each run is compared with the single engine run. Each engine process runs the real
+workflow executor, which claims workflow executions with a lease, and a fake kubernetes API whose simulated runners
+post their results to the engine that submitted them.
+
+A real mongod is needed, the engines are separate processes. Point --conf-home at a directory with a db.yaml.
+
+Reported, and saved as JSON with --output:
+    throughput in workflows per second, and the speedup over the first replica count
+    p50/p95 latency from queued to finished
+    how evenly the workflows were spread over the engines
+
+Usage:
+    python scaleout.py --conf-home /opt/llamaflow/conf --replicas 1,2,4 --workflows 1000 --executor-workers 16
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "code"))
+from loadtest import build_definition, percentile
+
+namespace = "loadtest"
+
+class SimulatedBatchApi:
+    """
+    Stands in for kubernetes.client.BatchV1Api in an engine process. Each created job is a timer that posts the result
+    to the engine through runner.result after the runner delay.
+    """
+
+    delay = 0.05
+
+    def __init__(self, api_client=None):
+        pass
+
+    def create_namespaced_job(self, namespace, body):
+        import runner
+        environment = {variable['name']: variable.get('value') for variable in body['spec']['template']['spec']['containers'][0]['env']}
+        result = {"job_id": environment['JOB_ID'], "pod_id": environment['JOB_ID'], "execution_status": "success", "execution_output": environment['RUNNER_ARGS']}
+        timer = threading.Timer(self.delay, runner.result, (environment['EXECUTION_ID'], result))
+        timer.daemon = True
+        timer.start()
+        return body
+
+def run_engine(args):
+    """
+    Run one engine process until it is terminated. It prints "ready" once its workflow executor is claiming work.
+    """
+    import modules.database as database
+    import modules.kube as kube
+    import modules.definitions as definitions
+    from modules import notifier
+
+    database.Database.conf_home = args.conf_home
+    SimulatedBatchApi.delay = args.runner_delay
+    kube.client.BatchV1Api = SimulatedBatchApi
+    kube.get_api_client = lambda connection_pool_size: None
+    # results are posted to the engine that submitted the runner, the in-process notifier covers them all
+    notifier.watcher = threading.current_thread()
+    definitions.DefinitionWatcher.start = lambda watcher: None
+
+    import runner
+    from modules.executor import WorkflowExecutor
+
+    runner.workflow_executor = WorkflowExecutor(runner.run_workflow, args.executor_workers, args.poll_interval, args.lease_seconds)
+    runner.workflow_executor.start()
+
+    print("ready", flush=True)
+    sys.stdout = open(os.devnull, "w")
+    while True:
+        time.sleep(3600)
+
+def run_replicas(args, database, replicas):
+    """
+    Run the batch of workflows with a number of engine processes and measure it.
+    """
+    database.workflowExecution.delete_many({"workflow_namespace": namespace})
+    database.runnerExecution.delete_many({"action_namespace": namespace})
+
+    command = [sys.executable, os.path.abspath(__file__), "--engine", "--conf-home", args.conf_home,
+               "--executor-workers", str(args.executor_workers), "--runner-delay", str(args.runner_delay),
+               "--poll-interval", str(args.poll_interval), "--lease-seconds", str(args.lease_seconds)]
+    engines = [subprocess.Popen(command, stdout=subprocess.PIPE, text=True) for replica in range(replicas)]
+    try:
+        for engine in engines:
+            if engine.stdout.readline().strip() != "ready":
+                raise RuntimeError("An engine process failed to start")
+
+        queued_time = time.time()
+        database.workflowExecution.insert_many([{"workflow_namespace": namespace, "workflow_name": args.shape, "version": 1,
+                                                 "status": "queued", "queued_time": queued_time} for workflow in range(args.workflows)])
+        start = time.perf_counter()
+        deadline = start + args.timeout
+        finished = 0
+        while finished < args.workflows and time.perf_counter() < deadline:
+            time.sleep(0.1)
+            finished = database.workflowExecution.count_documents({"workflow_namespace": namespace, "status": {"$in": ["success", "failed"]}})
+        elapsed = time.perf_counter() - start
+    finally:
+        for engine in engines:
+            engine.terminate()
+        for engine in engines:
+            engine.wait()
+
+    latencies = []
+    owners = {}
+    failed = 0
+    for execution in database.workflowExecution.find({"workflow_namespace": namespace}, projection={"status": 1, "owner": 1, "queued_time": 1, "trace.end": 1}):
+        owners[execution.get("owner")] = owners.get(execution.get("owner"), 0) + 1
+        if execution.get("status") == "success":
+            latencies.append(execution["trace"]["end"] - execution["queued_time"])
+        elif execution.get("status") == "failed":
+            failed = failed + 1
+
+    return {
+        "replicas": replicas,
+        "completed": finished == args.workflows,
+        "workflows": finished,
+        "failed_workflows": failed,
+        "elapsed_seconds": elapsed,
+        "workflows_per_second": finished / elapsed,
+        "latency_seconds": {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95)},
+        "workflows_per_engine": {"min": min(owners.values()), "max": max(owners.values())} if owners else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conf-home", required=True, help="directory with a db.yaml for the mongod the engines share")
+    parser.add_argument("--replicas", default="1,2,4", help="comma separated engine process counts to run")
+    parser.add_argument("--workflows", type=int, default=1000)
+    parser.add_argument("--shape", choices=["linear", "fanout", "map"], default="linear")
+    parser.add_argument("--steps", type=int, default=3, help="steps per workflow, branches for fanout, items for map")
+    parser.add_argument("--max-parallel", type=int, default=10)
+    parser.add_argument("--executor-workers", type=int, default=16, help="workflows each engine runs at once")
+    parser.add_argument("--runner-delay", type=float, default=0.05, help="seconds a simulated runner takes")
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="seconds an idle engine waits between claims")
+    parser.add_argument("--lease-seconds", type=float, default=30)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--output", help="file to save the results to as JSON")
+    parser.add_argument("--engine", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.engine:
+        run_engine(args)
+        return
+
+    from modules.database import Database
+    Database.conf_home = args.conf_home
+    database = Database("workflow-engine", "workflowExecution").database
+    database.workflowDefinition.delete_many({"namespace": namespace})
+    database.actionDefinition.delete_many({"namespace": namespace})
+    database.workflowDefinition.insert_one(build_definition(args.shape, args.steps, args.max_parallel))
+    database.actionDefinition.insert_one({"namespace": namespace, "action_name": "sim", "version": 1, "container_repo": "loadtest",
+                                          "container_name": "sim", "container_tag": "1", "execution_backend": "kubernetes"})
+
+    runs = []
+    for replicas in [int(count) for count in args.replicas.split(",")]:
+        run = run_replicas(args, database, replicas)
+        run["speedup"] = run["workflows_per_second"] / runs[0]["workflows_per_second"] if runs else 1.0
+        runs.append(run)
+        print(f"{replicas:>3} engines: {run['workflows_per_second']:8.1f} workflows/s  speedup {run['speedup']:4.2f}x  "
+              f"p50 {run['latency_seconds']['p50'] or 0:.3f}s  p95 {run['latency_seconds']['p95'] or 0:.3f}s  "
+              f"per engine {run['workflows_per_engine']}", flush=True)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"config": vars(args), "runs": runs}, file, indent=2)
+
+if __name__ == "__main__":
+    main()
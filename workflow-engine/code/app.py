@@ -15,13 +15,25 @@
 
 from flask import render_template # Remove: import Flask
 import connexion
+import runner
+from modules import metrics
+from modules import indexes
 
 app = connexion.App(__name__, specification_dir="./")
 app.add_api("swagger.yml")
+indexes.create_indexes()
+runner.prepare_definitions()
+runner.workflow_executor.start()
+runner.retention_sweeper.start()
+runner.start_local_runner_pools()
 
 @app.route("/")
 def home():
     return render_template("home.html")
 
+@app.route("/metrics")
+def prometheus_metrics():
+    return metrics.metrics()
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8000, debug=True)
\ No newline at end of file
@@ -0,0 +1,180 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+
+import itertools
+import threading
+import time
+from modules import metrics
+
+class AdmissionController:
+    """
+    Decides when an action may be launched, so one large workflow can not take all the runners. An action holds a
+    slot from its launch until it finishes. Slots are limited:
+        max_running: The actions running at once in this engine, 0 for no limit
+        namespace_limits: The actions running at once for each workflow namespace, a namespace without its own limit gets default_namespace_limit
+        action_limits: The actions running at once of an action, keyed by "<action namespace>/<action name>"
+    Actions waiting for a slot are admitted highest priority first. Between waiting actions of the same priority, the
+    workflow namespace with the fewest running actions goes first, so namespaces share the slots fairly, and within a
+    namespace the actions are admitted in the order they arrived. An action held back only by the limit of its own
+    namespace or action does not hold back the actions behind it.
+    The limits apply to each engine process.
+
+    Attributes:
+        condition (Condition): Guards the counts and queue, and wakes waiting actions when slots are freed
+        waiting (List): The waiting actions
+        running (Dict): The running actions of each workflow namespace
+        running_actions (Dict): The running actions of each action
+    """
+
+    def __init__(self, max_running=0, namespace_limits=None, action_limits=None, default_namespace_limit=0) -> None:
+        """
+        The constructor for the AdmissionController class.
+
+        Parameters:
+            self (AdmissionController): The object itself
+            max_running (Int): The actions running at once in this engine, 0 for no limit
+            namespace_limits (Dict): The actions running at once for each workflow namespace
+            action_limits (Dict): The actions running at once of each action, keyed by "<action namespace>/<action name>"
+            default_namespace_limit (Int): The limit of a workflow namespace without its own, 0 for no limit
+        """
+        self.max_running = max_running
+        self.namespace_limits = namespace_limits or {}
+        self.action_limits = action_limits or {}
+        self.default_namespace_limit = default_namespace_limit
+        self.condition = threading.Condition()
+        self.sequence = itertools.count()
+        self.waiting = []
+        self.running = {}
+        self.running_actions = {}
+        self.total_running = 0
+
+    def fits(self, entry):
+        """
+        Check a waiting action fits within the limits. Called with the condition held.
+        """
+        if self.max_running and self.total_running >= self.max_running:
+            return False
+        namespace_limit = self.namespace_limits.get(entry["workflow_namespace"], self.default_namespace_limit)
+        if namespace_limit and self.running.get(entry["workflow_namespace"], 0) >= namespace_limit:
+            return False
+        action_limit = self.action_limits.get(entry["action"])
+        if action_limit and self.running_actions.get(entry["action"], 0) >= action_limit:
+            return False
+        return True
+
+    def admit(self):
+        """
+        Admit the waiting actions that fit, in priority and fair share order. Called with the condition held.
+        """
+        admitted = False
+        while True:
+            candidates = sorted(self.waiting, key=lambda entry: (-entry["priority"], self.running.get(entry["workflow_namespace"], 0), entry["sequence"]))
+            entry = next((candidate for candidate in candidates if self.fits(candidate)), None)
+            if entry is None:
+                break
+            self.waiting.remove(entry)
+            entry["admitted"] = True
+            self.running[entry["workflow_namespace"]] = self.running.get(entry["workflow_namespace"], 0) + 1
+            self.running_actions[entry["action"]] = self.running_actions.get(entry["action"], 0) + 1
+            self.total_running = self.total_running + 1
+            metrics.admission_running.labels(entry["workflow_namespace"]).inc()
+            metrics.admission_queued.labels(entry["workflow_namespace"]).dec()
+            admitted = True
+        if admitted:
+            self.condition.notify_all()
+
+    def acquire(self, workflow_namespace, action_namespace, action_name, priority=0):
+        """
+        Wait for a slot to launch an action.
+
+        Parameters:
+            self (AdmissionController): The object itself
+            workflow_namespace (Str): The namespace of the workflow the action runs in
+            action_namespace (Str): The namespace the action resides in
+            action_name (Str): The name of the action
+            priority (Int): Actions with a higher priority are admitted first
+
+        Returns:
+            Dict: The slot, to be given back with release
+        """
+        entry = {
+            "workflow_namespace": workflow_namespace,
+            "action": f"{action_namespace}/{action_name}",
+            "priority": priority,
+            "sequence": next(self.sequence),
+            "queued_time": time.time(),
+            "admitted": False
+        }
+        start = time.monotonic()
+        with self.condition:
+            self.waiting.append(entry)
+            metrics.admission_queued.labels(workflow_namespace).inc()
+            self.admit()
+            while not entry["admitted"]:
+                self.condition.wait()
+        metrics.admission_wait_seconds.labels(workflow_namespace).observe(time.monotonic() - start)
+        return entry
+
+    def release(self, entry):
+        """
+        Give back the slot of a finished action, and admit the waiting actions it makes room for.
+
+        Parameters:
+            self (AdmissionController): The object itself
+            entry (Dict): The slot acquire returned
+
+        Returns:
+            none
+        """
+        with self.condition:
+            self.running[entry["workflow_namespace"]] = self.running[entry["workflow_namespace"]] - 1
+            self.running_actions[entry["action"]] = self.running_actions[entry["action"]] - 1
+            self.total_running = self.total_running - 1
+            metrics.admission_running.labels(entry["workflow_namespace"]).dec()
+            self.admit()
+
+    def status(self):
+        """
+        Get the limits, and the running and waiting actions of each workflow namespace.
+
+        Parameters:
+            self (AdmissionController): The object itself
+
+        Returns:
+            Dict: The admission status
+        """
+        now = time.time()
+        with self.condition:
+            queued = {}
+            for entry in self.waiting:
+                namespace = queued.setdefault(entry["workflow_namespace"], {"queued": 0, "oldest_wait_seconds": 0})
+                namespace["queued"] = namespace["queued"] + 1
+                namespace["oldest_wait_seconds"] = max(namespace["oldest_wait_seconds"], now - entry["queued_time"])
+            return {
+                "limits": {
+                    "max_running": self.max_running,
+                    "default_namespace_limit": self.default_namespace_limit,
+                    "namespace_limits": self.namespace_limits,
+                    "action_limits": self.action_limits
+                },
+                "running": self.total_running,
+                "queued": len(self.waiting),
+                "namespaces": {
+                    namespace: dict(queued.get(namespace, {"queued": 0, "oldest_wait_seconds": 0}), running=self.running.get(namespace, 0))
+                    for namespace in set(self.running) | set(queued)
+                },
+                "actions": {action: count for action, count in self.running_actions.items() if count}
+            }
@@ -0,0 +1,241 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+def get_runner_args(parameters):
+    """
+    A function to encode the parameters of an action for the runner, the runner gets them as a string.
+
+    Parameters:
+        parameters (Object): The parameters of the action
+
+    Returns:
+        Str: The parameters as is if they are a string, otherwise as JSON
+    """
+    if isinstance(parameters, str):
+        return parameters
+    return json.dumps(parameters)
+
+class ExecutionBackend:
+    """
+    The interface of the backends that run job mode actions. A backend starts the runner of each execution with the
+    runner environment contract: EXECUTION_ID, JOB_ID, POD_ID, RUNNER_ARGS and POSTBACK_BASE_URL. The runner posts its
+    result back to /api/runner/{execution_id} itself, so submit does not wait for the runner to finish.
+    """
+
+    def submit(self, executions):
+        """
+        Start the runners of some executions.
+
+        Parameters:
+            self (ExecutionBackend): The object itself
+            executions (List): Dicts with the action_definition, job_id, execution_id and parameters of each execution
+
+        Returns:
+            none
+        """
+        raise NotImplementedError
+
+
+class KubernetesBackend(ExecutionBackend):
+    """
+    Runs each execution as a kubernetes job.
+
+    Attributes:
+        job_submitter (JobSubmitter): Creates the jobs with the shared API client
+    """
+
+    def __init__(self, job_submitter) -> None:
+        """
+        The constructor for the KubernetesBackend class.
+
+        Parameters:
+            self (KubernetesBackend): The object itself
+            job_submitter (JobSubmitter): Creates the jobs with the shared API client
+        """
+        self.job_submitter = job_submitter
+
+    def submit(self, executions):
+        """
+        Create the jobs of some executions, concurrently when there is more than one.
+
+        Parameters:
+            self (KubernetesBackend): The object itself
+            executions (List): Dicts with the action_definition, job_id, execution_id and parameters of each execution
+
+        Returns:
+            none
+        """
+        job_dicts = [self.build_job(execution['action_definition'], execution['job_id'], execution['execution_id'], execution['parameters']) for execution in executions]
+        self.job_submitter.create_jobs(job_dicts)
+
+    def build_job(self, action_definition, job_id, execution_id, parameters):
+        """
+        A function to build the kubernetes job that runs an action
+
+        Parameters:
+            self (KubernetesBackend): The object itself
+            action_definition (Dict): The definition of the action
+            job_id (Str): The name of the kubernetes job
+            execution_id (Str): A 24 character hexadecimal string
+            parameters (Object): The parameters of the action
+
+        Returns:
+            Dict: The batch/v1 Job
+        """
+        #This is not pretty, but better than using a heredoc with some yaml in it.
+        job_dict = {
+            'apiVersion': 'batch/v1',
+            'kind': 'Job',
+            'metadata': { 'name': job_id},
+            'spec': {
+                'template': {
+                    'spec': {
+                        'containers': [{
+                                'name': 'action-runner',
+                                'image': f"{action_definition['container_repo']}/{action_definition['container_name']}:{action_definition['container_tag']}",
+                                'env': [
+                                    {
+                                        'name': 'RUNNER_ARGS',
+                                        'value': get_runner_args(parameters)
+                                    }, {
+                                        'name': 'POD_ID',
+                                        'valueFrom': {'fieldRef': { 'fieldPath': 'metadata.name'}}
+                                    }, {
+                                        'name': 'JOB_ID',
+                                        'value': job_id
+                                    }, {
+                                        'name': 'EXECUTION_ID',
+                                        'value': execution_id
+                                    }, {
+                                        'name': 'POSTBACK_BASE_URL',
+                                        'valueFrom': {'configMapKeyRef': {'name': 'postback-url', 'key':'url'}}
+                                    }
+                                ]
+                            }
+                        ],
+                        'restartPolicy': 'Never',
+                        'imagePullSecrets': [
+                            {'name': 'regcred'}
+                        ]
+                    }
+                },
+                'backoffLimit': 0,
+                'podFailurePolicy': {
+                    'rules': [
+                        {
+                            'action': 'FailJob',
+                            'onExitCodes': {
+                                'containerName': 'action-runner',
+                                'operator': 'NotIn',
+                                'values': [0]
+                            }
+                        }, {
+                            'action': 'Ignore',
+                            'onPodConditions': [
+                                {'type': 'DisruptionTarget'}
+                            ]
+                        }
+                    ]
+                }
+            }
+        }
+
+        return job_dict
+
+
+class LocalBackend(ExecutionBackend):
+    """
+    Runs each execution as a local process, running the entrypoint of the runner container directly, such as
+    runners/runner-echo/code/runner.py. This skips cluster scheduling and container start for small actions, and lets
+    the whole engine run on a single box. The processes run on a bounded thread pool, so submit returns right away.
+
+    Attributes:
+        entrypoints (Dict): Maps a container_name to the path of its runner script, an action definition can also set local_entrypoint
+        postback_base_url (Str): The url runners post their results to, such as http://127.0.0.1:8000/api/runner
+        report_failure (Callable): Called with the execution id and output when a runner exits with an error
+        pool (ThreadPoolExecutor): The threads the runner processes are started and waited on from
+    """
+
+    def __init__(self, entrypoints, postback_base_url, max_workers, report_failure) -> None:
+        """
+        The constructor for the LocalBackend class.
+
+        Parameters:
+            self (LocalBackend): The object itself
+            entrypoints (Dict): Maps a container_name to the path of its runner script
+            postback_base_url (Str): The url runners post their results to
+            max_workers (Int): The maximum number of runner processes at once
+            report_failure (Callable): Called with the execution id and output when a runner exits with an error
+        """
+        self.entrypoints = entrypoints
+        self.postback_base_url = postback_base_url
+        self.report_failure = report_failure
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="local-runner")
+
+    def submit(self, executions):
+        """
+        Queue the runner processes of some executions.
+
+        Parameters:
+            self (LocalBackend): The object itself
+            executions (List): Dicts with the action_definition, job_id, execution_id and parameters of each execution
+
+        Returns:
+            none
+        """
+        for execution in executions:
+            self.pool.submit(self.run, execution)
+
+    def run(self, execution):
+        """
+        Run the runner process of an execution and wait for it to exit. If the runner exits with an error it may not
+        have posted a result, so the failure is reported instead of leaving the execution waiting until it times out.
+
+        Parameters:
+            self (LocalBackend): The object itself
+            execution (Dict): The action_definition, job_id, execution_id and parameters of the execution
+
+        Returns:
+            none
+        """
+        action_definition = execution['action_definition']
+        entrypoint = action_definition.get('local_entrypoint', self.entrypoints.get(action_definition['container_name']))
+        if entrypoint is None:
+            self.report_failure(execution['execution_id'], f"No local entrypoint for container {action_definition['container_name']}")
+            return
+
+        env = dict(os.environ)
+        env.update({
+            "EXECUTION_ID": execution['execution_id'],
+            "JOB_ID": execution['job_id'],
+            "POD_ID": execution['job_id'],
+            "RUNNER_ARGS": get_runner_args(execution['parameters']),
+            "POSTBACK_BASE_URL": self.postback_base_url,
+        })
+        try:
+            completed = subprocess.run([sys.executable, entrypoint], env=env, capture_output=True, text=True)
+        except OSError as error:
+            self.report_failure(execution['execution_id'], str(error))
+            return
+
+        if completed.returncode != 0:
+            self.report_failure(execution['execution_id'], completed.stderr)
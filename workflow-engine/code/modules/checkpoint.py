@@ -0,0 +1,195 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+
+import threading
+import time
+from bson.objectid import ObjectId
+from modules.database import Database
+
+class LeaseLostError(Exception):
+    pass
+
+class WorkflowCheckpoint:
+    """
+    The progress of a workflow execution, checkpointed to the steps field of its workflowExecution document so an
+    engine that picks the workflow up after a restart continues where it stopped. Each step records the execution id
+    of its actions before they are submitted, and its result once it completes:
+        steps.<step name>.status: "running", "success" or "failed"
+        steps.<step name>.executions.<index>: The execution id of the action, index 0 or the item index of a map step
+        steps.<step name>.result: The result of the step once it succeeded
+        steps.<step name>.cached.<index>: When the action was served from the result cache instead of running
+    Every write is fenced by the owner of the workflow execution, so an engine that lost its lease stops writing.
+    Step names are used in the field paths, so they should not contain "." or start with "$".
+
+    Attributes:
+        execution_id (Str): The workflow execution id
+        owner (Str): The engine that holds the lease on the workflow execution
+        steps (Dict): The checkpointed steps, as read when the workflow execution was claimed
+    """
+
+    def __init__(self, execution_id, owner, steps=None) -> None:
+        """
+        The constructor for the WorkflowCheckpoint class.
+
+        Parameters:
+            self (WorkflowCheckpoint): The object itself
+            execution_id (Str): A 24 character hexadecimal string with lowercase letters.
+            owner (Str): The engine that holds the lease on the workflow execution
+            steps (Dict): The steps field of the workflow execution, if it has one
+        """
+        self.execution_id = execution_id
+        self.owner = owner
+        self.steps = steps or {}
+        self.lock = threading.Lock()
+
+    def completed(self):
+        """
+        Get the steps that already succeeded.
+
+        Parameters:
+            self (WorkflowCheckpoint): The object itself
+
+        Returns:
+            Dict: Maps the name of each step that succeeded to its result
+        """
+        return {name: step['result'] for name, step in self.steps.items() if step.get('status') == "success"}
+
+    def action_execution_id(self, step_name, index=0):
+        """
+        Get the execution id an action of a step runs as. A step that was started before a restart gets the id it
+        was given then, so the engine re-attaches to the action instead of submitting it again. Otherwise a new id is
+        checkpointed before the action is submitted.
+
+        Parameters:
+            self (WorkflowCheckpoint): The object itself
+            step_name (Str): The name of the step
+            index (Int): The item index of a map step, 0 for other steps
+
+        Returns:
+            Str: The execution id
+            Bool: True if the id was checkpointed before a restart
+        """
+        with self.lock:
+            execution_id = self.steps.get(step_name, {}).get('executions', {}).get(str(index))
+            if execution_id:
+                return execution_id, True
+
+            execution_id = str(ObjectId())
+            self.steps.setdefault(step_name, {}).setdefault('executions', {})[str(index)] = execution_id
+        self.write({
+            f"steps.{step_name}.status": "running",
+            f"steps.{step_name}.executions.{index}": execution_id
+        })
+        return execution_id, False
+
+    def action_cached(self, step_name, index=0):
+        """
+        Checkpoint that an action of a step was served from the result cache, with the time of the cache hit.
+
+        Parameters:
+            self (WorkflowCheckpoint): The object itself
+            step_name (Str): The name of the step
+            index (Int): The item index of a map step, 0 for other steps
+
+        Returns:
+            none
+        """
+        hit_time = time.time()
+        with self.lock:
+            self.steps.setdefault(step_name, {}).setdefault('cached', {})[str(index)] = hit_time
+        self.write({f"steps.{step_name}.cached.{index}": hit_time})
+
+    def cache_hits(self):
+        """
+        Get the actions that were served from the result cache.
+
+        Parameters:
+            self (WorkflowCheckpoint): The object itself
+
+        Returns:
+            Dict: Maps each step name to the time of the cache hit of each item index, as a string, that was cached
+        """
+        with self.lock:
+            return {name: dict(step['cached']) for name, step in self.steps.items() if step.get('cached')}
+
+    def action_executions(self, map_steps):
+        """
+        Get the execution ids of the actions the steps were given so far, the way run_graph returns them, for a
+        workflow that did not finish.
+
+        Parameters:
+            self (WorkflowCheckpoint): The object itself
+            map_steps (Set): The names of the map steps, whose execution ids are listed by item index
+
+        Returns:
+            Dict: Maps each step name to its execution id, or list of execution ids for a map step
+        """
+        with self.lock:
+            steps = {name: dict(step.get('executions', {})) for name, step in self.steps.items() if step.get('executions')}
+        return {name: [executions[index] for index in sorted(executions, key=int)] if name in map_steps else executions.get("0")
+            for name, executions in steps.items()}
+
+    def step_succeeded(self, step_name, result):
+        """
+        Checkpoint a step as succeeded, so it is not run again.
+
+        Parameters:
+            self (WorkflowCheckpoint): The object itself
+            step_name (Str): The name of the step
+            result (Str or List): The execution id, or ids of a map step, the step ran
+
+        Returns:
+            none
+        """
+        self.write({
+            f"steps.{step_name}.status": "success",
+            f"steps.{step_name}.result": result,
+            f"steps.{step_name}.finished_time": time.time()
+        })
+
+    def step_failed(self, step_name, error):
+        """
+        Checkpoint a step as failed.
+
+        Parameters:
+            self (WorkflowCheckpoint): The object itself
+            step_name (Str): The name of the step
+            error (Exception): The error the step failed with
+
+        Returns:
+            none
+        """
+        self.write({
+            f"steps.{step_name}.status": "failed",
+            f"steps.{step_name}.error": str(error),
+            f"steps.{step_name}.finished_time": time.time()
+        })
+
+    def write(self, fields):
+        """
+        Write checkpoint fields to the workflow execution, if this engine still owns it.
+
+        Parameters:
+            self (WorkflowCheckpoint): The object itself
+            fields (Dict): The fields to set
+
+        Raises:
+            LeaseLostError: If another engine took over the workflow execution
+        """
+        db_connection = Database("workflow-engine", "workflowExecution")
+        result = db_connection.collection.update_one({"_id": ObjectId(self.execution_id), "owner": self.owner}, {"$set": fields})
+        if result.matched_count == 0:
+            raise LeaseLostError(f"Workflow execution {self.execution_id} is no longer owned by {self.owner}")
@@ -0,0 +1,77 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+
+import os
+import yaml
+
+conf_home = "/opt/llamaflow/conf"
+
+defaults = {
+    "executor_workers": 256,
+    "executor_poll_interval": 5,
+    "definition_cache_size": 1024,
+    "workflow_max_concurrency": 10,
+    "map_max_parallel": 10,
+    "map_submit_batch_delay": 0.02,
+    "kube_namespace": "testing",
+    "kube_connection_pool_size": 32,
+    "kube_max_in_flight": 16,
+    "execution_backend": "kubernetes",
+    "local_entrypoints": {},
+    "local_max_workers": 32,
+    "local_runner_pools": {},
+    "local_api_url": "http://127.0.0.1:8000/api",
+    "runner_pool_claim_max_wait": 5,
+    "runner_pool_max_waiting_claims": 8,
+    "runner_pool_lease_seconds": 60,
+    "runner_pool_max_claims": 3,
+    "trace_export_file": None,
+    "trace_export_url": None,
+    "output_chunk_size": 262144,
+    "output_inline_limit": 65536,
+    "workflow_lease_seconds": 30,
+    "workflow_max_recoveries": 3,
+    "action_cache_ttl": 3600,
+    "admission_max_running": 0,
+    "admission_default_namespace_limit": 0,
+    "admission_namespace_limits": {},
+    "admission_action_limits": {},
+    "retention_rules": [],
+    "retention_interval": 3600,
+    "retention_archive_dir": "/opt/llamaflow/archive",
+    "retention_batch_size": 1000,
+}
+
+engine_config = None
+
+def get_engine_config():
+    """
+    A function to get the configuration of the workflow engine. The config comes from /opt/llamaflow/conf/engine.yaml,
+    any setting missing from the file uses its default. The file is only read once per process.
+
+    Returns:
+        Dict: A dict with the engine configuration
+    """
+    global engine_config
+
+    if engine_config is None:
+        config = dict(defaults)
+        if os.path.exists(conf_home + "/engine.yaml"):
+            with open(conf_home + "/engine.yaml", 'r') as file:
+                config.update(yaml.safe_load(file) or {})
+        engine_config = config
+
+    return engine_config
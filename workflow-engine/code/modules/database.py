@@ -14,17 +14,129 @@
 #      limitations under the License.
 
 
+import os
+import threading
 import yaml
 from pymongo import MongoClient
 from bson import ObjectId, json_util
 import urllib.parse
 import json
 import re
+import datetime
+
+# Optional settings in db.yaml that tune the connection pool, mapped to their MongoClient keyword arguments
+pool_settings = {
+    "max_pool_size": "maxPoolSize",
+    "min_pool_size": "minPoolSize",
+    "max_idle_time_ms": "maxIdleTimeMS",
+    "wait_queue_timeout_ms": "waitQueueTimeoutMS",
+    "connect_timeout_ms": "connectTimeoutMS",
+    "socket_timeout_ms": "socketTimeoutMS",
+    "server_selection_timeout_ms": "serverSelectionTimeoutMS",
+}
+
+db_configs = {}
+mongo_clients = {}
+mongo_clients_pid = os.getpid()
+mongo_clients_lock = threading.Lock()
+
+def get_db_config(conf_home):
+    """
+    A function to get the database config. The db.yaml file is only read once per process.
+
+    Parameters:
+        conf_home (Str): The directory db.yaml is in
+
+    Returns:
+        Dict: A dict with the database config
+    """
+    db_config = db_configs.get(conf_home)
+    if db_config is None:
+        with open(conf_home+"/db.yaml",'r') as file:
+            db_config = yaml.safe_load(file)
+        db_configs[conf_home] = db_config
+
+    return db_config
+
+def get_mongo_client(conf_home):
+    """
+    A function to get the MongoClient for a database config. There is one client per config in each process, and every
+    Database object shares it, so the connection pool is reused instead of opening a new connection for each query.
+    The client is created lazily and does not connect until it is first used. After a fork the child process builds its
+    own clients, since a MongoClient is not safe to use across a fork.
+
+    Parameters:
+        conf_home (Str): The directory db.yaml is in
+
+    Returns:
+        MongoClient: The shared client
+    """
+    global mongo_clients_pid
+
+    db_config = get_db_config(conf_home)
+    options = {pool_settings[setting]: db_config[setting] for setting in pool_settings if db_config.get(setting) is not None}
+    key = (db_config['host'], db_config['port'], db_config['username'], tuple(sorted(options.items())))
+
+    with mongo_clients_lock:
+        if mongo_clients_pid != os.getpid():
+            mongo_clients.clear()
+            mongo_clients_pid = os.getpid()
+
+        mongo_client = mongo_clients.get(key)
+        if mongo_client is None:
+            username = urllib.parse.quote_plus(db_config['username'])
+            password = urllib.parse.quote_plus(db_config['password'])
+            mongo_client = MongoClient('mongodb://%s:%s@%s:%s' % (username, password, db_config['host'], db_config['port']), connect=False, **options)
+            mongo_clients[key] = mongo_client
+
+    return mongo_client
+
+json_types = (str, int, float, bool, type(None))
+
+def json_safe(value):
+    """
+    A function to make a document returned by pymongo safe to serialize as JSON. It gives the same result as a
+    json_util.dumps and json.loads round trip, but only the values that are not already JSON types are converted,
+    so large strings like runner output are passed through without being copied.
+
+    Parameters:
+        value (Object): The document, or a value inside it
+
+    Returns:
+        Object: The value with ObjectId as {"$oid": Str}, datetime as {"$date": Int} and other BSON types in extended JSON
+    """
+    if isinstance(value, json_types):
+        return value
+    elif isinstance(value, dict):
+        return {key: json_safe(item) for key, item in value.items()}
+    elif isinstance(value, list):
+        return [json_safe(item) for item in value]
+    elif isinstance(value, ObjectId):
+        return {"$oid": str(value)}
+    elif isinstance(value, datetime.datetime):
+        return {"$date": bson_datetime_ms(value)}
+    else:
+        return json.loads(json_util.dumps(value))
+
+def bson_datetime_ms(value):
+    """
+    A function to convert a datetime to milliseconds since the epoch, the way BSON stores it.
+
+    Parameters:
+        value (datetime): The datetime to convert, naive datetimes are treated as UTC
+
+    Returns:
+        Int: The number of milliseconds since the epoch
+    """
+    if value.utcoffset() is not None:
+        value = value - value.utcoffset()
+    delta = value.replace(tzinfo=None) - datetime.datetime(1970, 1, 1)
+    return (delta.days * 86400 + delta.seconds) * 1000 + delta.microseconds // 1000
 
 class Database:
     """
-    This is a class used for accessing the database. When initialize it it open a connection to the database. 
-    The config for the database connection comes from /opt/self-service-portal/conf/db.conf
+    This is a class used for accessing the database. The connection comes from a client shared by the whole process,
+    so creating a Database object is cheap. The config for the database connection comes from /opt/llamaflow/conf/db.yaml
 
     Attributes:
         mongo_client (MongoClient): The client class for the db connection
@@ -42,22 +154,18 @@ class Database:
             database (Str): The name of the database to connect to
             collection (Str): The name of the collection to connect to
         """
-        with open(self.conf_home+"/db.yaml",'r') as file:
-            db_config = yaml.safe_load(file)
-
-        username = urllib.parse.quote_plus(db_config['username'])
-        password = urllib.parse.quote_plus(db_config['password'])
-        self.mongo_client = MongoClient('mongodb://%s:%s@%s:%s' % (username, password, db_config['host'], db_config['port']))
+        self.mongo_client = get_mongo_client(self.conf_home)
         self.database = self.mongo_client[database]
         self.collection = self.database[collection]
 
-    def find_by_id(self, object_id):
+    def find_by_id(self, object_id, projection=None):
         """
         A method to find a document by its object id. 
         
         Parameters:
             self (Database): The instantiation of the Database class
             object_id (Str): The id of the document to find. The id must be 24 hexadecimal characters with lowercase letters
+            projection (Dict): Optional, the fields to return. By default the whole document is returned
 
         Returns:
             Dict: A dict with the document if the document is found. 
@@ -67,26 +175,27 @@ class Database:
             raise "Object id must be 24 chacters hexadecimal string with lowercase letters"
 
         object_instance =  ObjectId(object_id)
-        result = self.collection.find_one({"_id": object_instance})
+        result = self.collection.find_one({"_id": object_instance}, projection)
 
-        return json.loads(json_util.dumps(result))
+        return json_safe(result)
 
-    def find_one_by_query(self, query):
+    def find_one_by_query(self, query, projection=None):
         """
         A function to find one record using a query
 
         Parameters:
             self (Database): The instantiation of the Database class
             query (Dict): A dictonary with the query
+            projection (Dict): Optional, the fields to return. By default the whole document is returned
         
         Returns:
             Dict: A dict with the document if document is found
             None: If the document is not found        
         """
 
-        result = self.collection.find_one(query)
+        result = self.collection.find_one(query, projection)
 
-        return json.loads(json_util.dumps(result))
+        return json_safe(result)
     
     def insert_document(self, document):
         """
@@ -0,0 +1,149 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+
+import threading
+from cachetools import LRUCache
+from pymongo.errors import PyMongoError
+
+class DefinitionCache:
+    """
+    An in-process LRU cache of workflow or action definitions keyed by (namespace, name, version). A published version
+    of a definition does not change, so it is only read from the database once. Concurrent misses for the same key
+    wait for the first one to load it, so a burst of identical submissions only reads the database once.
+    The cached dicts are shared, callers must not change them.
+
+    Attributes:
+        cache (LRUCache): The cached definitions
+        lock (Lock): Protects the cache and the loading locks
+        loading (Dict): Maps a key being loaded to the lock held while it is read from the database
+        hits (Int): The number of lookups answered from the cache
+        misses (Int): The number of lookups that read the database
+    """
+
+    def __init__(self, maxsize) -> None:
+        """
+        The constructor for the DefinitionCache class.
+
+        Parameters:
+            self (DefinitionCache): The object itself
+            maxsize (Int): The maximum number of definitions to keep
+        """
+        self.cache = LRUCache(maxsize=maxsize)
+        self.lock = threading.Lock()
+        self.loading = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, load):
+        """
+        Get a definition from the cache, loading it on a miss.
+
+        Parameters:
+            self (DefinitionCache): The object itself
+            key (Tuple): The (namespace, name, version) of the definition
+            load (Callable): Called without arguments to read the definition from the database, returns None if it does not exist
+
+        Returns:
+            Dict: The definition
+            None: If the definition does not exist, missing definitions are not cached
+        """
+        with self.lock:
+            definition = self.cache.get(key)
+            if definition is not None:
+                self.hits = self.hits + 1
+                return definition
+            key_lock = self.loading.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self.lock:
+                definition = self.cache.get(key)
+                if definition is not None:
+                    self.hits = self.hits + 1
+                    return definition
+
+            definition = load()
+
+            with self.lock:
+                self.misses = self.misses + 1
+                if definition is not None:
+                    self.cache[key] = definition
+                self.loading.pop(key, None)
+
+        return definition
+
+    def invalidate(self, key=None):
+        """
+        Remove a definition from the cache, or every definition if no key is given.
+
+        Parameters:
+            self (DefinitionCache): The object itself
+            key (Tuple): Optional, the (namespace, name, version) of the definition to remove
+
+        Returns:
+            none
+        """
+        with self.lock:
+            if key is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(key, None)
+
+
+class DefinitionWatcher(threading.Thread):
+    """
+    A background thread that clears a definition cache when definitions are changed or removed in the database by
+    something other than the publish API. New definitions do not need to clear it, since missing definitions are not
+    cached. Change streams need a replica set, if the server does not support them the watcher stops.
+
+    Attributes:
+        collection (Collection): The definition collection to watch
+        cache (DefinitionCache): The cache to clear
+    """
+
+    pipeline = [
+        {"$match": {"operationType": {"$in": ["update", "replace", "delete", "drop", "rename", "dropDatabase", "invalidate"]}}}
+    ]
+
+    def __init__(self, collection, cache) -> None:
+        """
+        The constructor for the DefinitionWatcher class.
+
+        Parameters:
+            self (DefinitionWatcher): The object itself
+            collection (Collection): The definition collection to watch
+            cache (DefinitionCache): The cache to clear
+        """
+        super().__init__(name=collection.name + "-watcher", daemon=True)
+        self.collection = collection
+        self.cache = cache
+
+    def run(self):
+        """
+        Watch the collection until the process exits or the change stream fails.
+
+        Parameters:
+            self (DefinitionWatcher): The object itself
+
+        Returns:
+            none
+        """
+        try:
+            with self.collection.watch(self.pipeline) as stream:
+                for change in stream:
+                    self.cache.invalidate()
+        except PyMongoError as error:
+            print("Definition watcher on " + self.collection.name + " stopped: ", error)
+        self.cache.invalidate()
@@ -0,0 +1,266 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+
+import os
+import socket
+import time
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+from modules.database import Database
+from modules import metrics
+
+class WorkflowExecutor:
+    """
+    Runs workflow executions in the background so the API call that starts a workflow can return right away.
+    The queue is durable, it is the workflowExecution documents with the status "queued". A dispatcher thread claims
+    them one at a time and hands them to a bounded pool of worker threads.
+    A claimed workflow execution is leased to this executor, recorded as its owner and lease_expires. A heartbeat
+    thread renews the leases of the running workflow executions. A running workflow execution whose lease expired,
+    because its engine stopped, is claimed like a queued one, and continues from its checkpointed steps. A workflow
+    execution whose lease expired again after max_recoveries recoveries, such as one that takes its engine down every
+    time it runs, is marked as failed instead.
+
+    Attributes:
+        execute (Callable): The function called with the execution id of each claimed workflow execution
+        max_workers (Int): The maximum number of workflow executions running at once
+        poll_interval (Float): The number of seconds between checks of the queue when nothing wakes the dispatcher
+        owner (Str): The id this executor claims workflow executions as, unique to the process
+        lease_seconds (Float): How long a lease lasts without being renewed
+        max_recoveries (Int): The number of times a workflow execution is recovered from an expired lease before it is failed
+        pool (ThreadPoolExecutor): The pool the workflow executions run in
+        slots (Semaphore): Counts the free workers, so work is only claimed when it can be started
+        wakeup (Event): Set when a workflow execution is enqueued to skip the rest of the poll interval
+        running (Set): The execution ids of the workflow executions running in this executor
+    """
+
+    def __init__(self, execute, max_workers, poll_interval, lease_seconds=30, owner=None, max_recoveries=3) -> None:
+        """
+        The constructor for the WorkflowExecutor class.
+
+        Parameters:
+            self (WorkflowExecutor): The object itself
+            execute (Callable): The function called with the execution id of each claimed workflow execution
+            max_workers (Int): The maximum number of workflow executions running at once
+            poll_interval (Float): The number of seconds between checks of the queue
+            lease_seconds (Float): How long a lease lasts without being renewed, leases are renewed every third of it
+            owner (Str): Optional, the id to claim workflow executions as, by default the host name, process id and a random suffix
+            max_recoveries (Int): The number of times a workflow execution is recovered from an expired lease before it is failed
+        """
+        self.execute = execute
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_recoveries = max_recoveries
+        self.owner = owner or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.pool = None
+        self.slots = threading.Semaphore(max_workers)
+        self.wakeup = threading.Event()
+        self.dispatcher = None
+        self.heartbeat = None
+        self.running = set()
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the dispatcher thread, if it is not already running.
+
+        Parameters:
+            self (WorkflowExecutor): The object itself
+
+        Returns:
+            none
+        """
+        with self.lock:
+            if self.dispatcher is None:
+                self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="workflow")
+                self.dispatcher = threading.Thread(target=self.dispatch, name="workflow-dispatcher", daemon=True)
+                self.dispatcher.start()
+                self.heartbeat = threading.Thread(target=self.renew_leases, name="workflow-heartbeat", daemon=True)
+                self.heartbeat.start()
+
+    def wake(self):
+        """
+        Wake the dispatcher up so a newly enqueued workflow execution is claimed right away.
+
+        Parameters:
+            self (WorkflowExecutor): The object itself
+
+        Returns:
+            none
+        """
+        self.wakeup.set()
+
+    def claim(self):
+        """
+        Atomically claim the highest priority, then oldest, queued workflow execution, or if none is queued a running workflow execution whose
+        lease expired. Claiming is a single find_one_and_update, so several engine processes can share the queue
+        without running the same workflow execution twice. The running workflow executions whose lease expired and
+        that were already recovered max_recoveries times are marked as failed rather than claimed.
+
+        Parameters:
+            self (WorkflowExecutor): The object itself
+
+        Returns:
+            Str: The execution id of the claimed workflow execution
+            None: If the queue is empty
+        """
+        db_connection = Database("workflow-engine", "workflowExecution")
+        now = time.time()
+        lease = {"owner": self.owner, "lease_expires": now + self.lease_seconds}
+        projection = {"_id": 1, "queued_time": 1, "workflow_namespace": 1, "workflow_name": 1, "version": 1}
+
+        execution = db_connection.collection.find_one_and_update(
+            {"status": "queued"},
+            {"$set": dict(lease, status="running", start_time=int(now))},
+            sort=[("priority", -1), ("queued_time", 1)],
+            projection=projection,
+            return_document=ReturnDocument.AFTER
+        )
+        if execution:
+            if "queued_time" in execution:
+                labels = metrics.workflow_label_values(execution.get("workflow_namespace"), execution.get("workflow_name"), execution.get("version"))
+                metrics.workflow_queue_wait_seconds.labels(**labels).observe(now - execution["queued_time"])
+            return self.started(str(execution["_id"]))
+
+        self.fail_unrecoverable(db_connection, now)
+        execution = db_connection.collection.find_one_and_update(
+            {"status": "running", "lease_expires": {"$lt": now}, "recoveries": {"$not": {"$gte": self.max_recoveries}}},
+            {"$set": lease, "$inc": {"recoveries": 1}},
+            sort=[("lease_expires", 1)],
+            projection=projection
+        )
+        if execution:
+            print("Recovering workflow execution " + str(execution["_id"]) + " from an expired lease")
+            return self.started(str(execution["_id"]))
+        return None
+
+    def fail_unrecoverable(self, db_connection, now):
+        """
+        Mark the running workflow executions whose lease expired after max_recoveries recoveries as failed.
+
+        Parameters:
+            self (WorkflowExecutor): The object itself
+            db_connection (Database): The connection to the workflowExecution collection
+            now (Float): The time of the claim
+
+        Returns:
+            none
+        """
+        result = db_connection.collection.update_many(
+            {"status": "running", "lease_expires": {"$lt": now}, "recoveries": {"$gte": self.max_recoveries}},
+            {"$set": {
+                "status": "failed",
+                "error": f"The workflow execution lost its lease after being recovered {self.max_recoveries} times, it is not recovered again",
+                "time": int(now)
+            }}
+        )
+        if result.modified_count:
+            print("Failed " + str(result.modified_count) + " workflow executions that exceeded max_recoveries")
+
+    def started(self, execution_id):
+        """
+        Record a claimed workflow execution as running in this executor, so its lease is renewed.
+
+        Parameters:
+            self (WorkflowExecutor): The object itself
+            execution_id (Str): A 24 character hexadecimal string with lowercase letters.
+
+        Returns:
+            Str: The execution id
+        """
+        with self.lock:
+            self.running.add(execution_id)
+        return execution_id
+
+    def renew_leases(self):
+        """
+        The heartbeat loop. Every third of the lease time it extends the leases of the workflow executions running in
+        this executor, with one update for all of them. A lease is lost if the heartbeat was late enough for another
+        engine to claim the workflow execution, the workflow then stops at its next fenced write.
+
+        Parameters:
+            self (WorkflowExecutor): The object itself
+
+        Returns:
+            none
+        """
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            with self.lock:
+                running = [ObjectId(execution_id) for execution_id in self.running]
+            if not running:
+                continue
+            try:
+                collection = Database("workflow-engine", "workflowExecution").collection
+                result = collection.update_many(
+                    {"_id": {"$in": running}, "owner": self.owner},
+                    {"$set": {"lease_expires": time.time() + self.lease_seconds}}
+                )
+                if result.matched_count < len(running):
+                    owned = {execution["_id"] for execution in collection.find({"_id": {"$in": running}, "owner": self.owner}, projection={"_id": 1})}
+                    for execution_id in set(running) - owned:
+                        print("Lost the lease on workflow execution " + str(execution_id) + ", it is stopped at its next checkpoint")
+            except Exception as error:
+                print("Failed to renew the workflow execution leases: ", error)
+
+    def dispatch(self):
+        """
+        The dispatcher loop. It waits for a free worker, claims a workflow execution and submits it to the pool.
+
+        Parameters:
+            self (WorkflowExecutor): The object itself
+
+        Returns:
+            none
+        """
+        while True:
+            self.slots.acquire()
+            try:
+                execution_id = self.claim()
+            except Exception as error:
+                print("Failed to claim a workflow execution: ", error)
+                execution_id = None
+
+            if execution_id is None:
+                self.slots.release()
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+                continue
+
+            self.pool.submit(self.run, execution_id)
+
+    def run(self, execution_id):
+        """
+        Run a single workflow execution in a worker and free the worker afterwards.
+
+        Parameters:
+            self (WorkflowExecutor): The object itself
+            execution_id (Str): A 24 character hexadecimal string with lowercase letters.
+
+        Returns:
+            none
+        """
+        try:
+            self.execute(execution_id)
+        except Exception as error:
+            print("Workflow execution " + execution_id + " raised an error: ", error)
+        finally:
+            with self.lock:
+                self.running.discard(execution_id)
+            self.slots.release()
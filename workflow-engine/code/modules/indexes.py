@@ -0,0 +1,226 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+"""
+The indexes of the collections of the workflow engine, declared in one place. They are created when the engine starts,
+and the module is also a command line tool to create them ahead of a deploy and to report the indexes that are missing
+or unused. An index that exists with other keys or options than its declaration is not changed when the engine
+starts, since creating it again means dropping it first, --recreate drops and creates those indexes.
+
+Usage:
+    python -m modules.indexes --create
+    python -m modules.indexes --create --recreate
+    python -m modules.indexes --report
+"""
+
+import argparse
+import json
+import sys
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+from modules.database import Database
+
+# The indexes of each collection as (keys, options) tuples, each with the name it is created under and the queries it serves.
+# The runner_pool index filters on $exists, since the field is only set when used, and a query matching the field by
+# equality implies $exists so it can use the index. The idempotency_key index keeps the $type filter it was first
+# created with, so existing databases do not have to rebuild it.
+required_indexes = {
+    "workflowDefinition": [
+        # Definition lookups by namespace, name and version, and no two definitions with the same key
+        ([("namespace", ASCENDING), ("workflow_name", ASCENDING), ("version", ASCENDING)], {"name": "namespace_name_version", "unique": True}),
+    ],
+    "actionDefinition": [
+        ([("namespace", ASCENDING), ("action_name", ASCENDING), ("version", ASCENDING)], {"name": "namespace_name_version", "unique": True}),
+    ],
+    "workflowExecution": [
+        # Workflow submissions with an idempotency key, partial so only executions submitted with a key are in it
+        ([("idempotency_key", ASCENDING)], {"name": "idempotency_key", "unique": True, "partialFilterExpression": {"idempotency_key": {"$type": "string"}}}),
+        # The workflow executors claiming the highest priority, then oldest, queued execution
+        ([("status", ASCENDING), ("priority", DESCENDING), ("queued_time", ASCENDING)], {"name": "status_priority_queued_time"}),
+        # The workflow executors taking over running executions whose lease expired
+        ([("status", ASCENDING), ("lease_expires", ASCENDING)], {"name": "status_lease_expires"}),
+    ],
+    "runnerExecution": [
+        # Runner pools claiming their oldest queued action
+        ([("runner_pool", ASCENDING), ("execution_status", ASCENDING), ("_id", ASCENDING)], {"name": "runner_pool_status_id", "partialFilterExpression": {"runner_pool": {"$exists": True}}}),
+    ],
+    "runnerOutput": [
+        # Reading the chunks of an execution in order, and no two chunks with the same number
+        ([("execution_id", ASCENDING), ("seq", ASCENDING)], {"name": "execution_id_seq", "unique": True}),
+    ],
+    "actionResultCache": [
+        # Removes the expired entries
+        ([("expires_at", ASCENDING)], {"name": "expires_at_ttl", "expireAfterSeconds": 0}),
+        # Removing the entries of executions archived by the retention sweeper
+        ([("execution_id", ASCENDING)], {"name": "execution_id"}),
+    ],
+}
+
+# The indexes earlier versions of the engine created that a required index replaced. They are dropped by create_indexes.
+replaced_indexes = {
+    "workflowExecution": [
+        # Replaced by status_priority_queued_time when the claim started ordering by priority
+        "status_queued_time",
+    ],
+}
+
+# The options of an index that are compared with its declaration, with the value an index without the option has.
+compared_options = {"unique": False, "partialFilterExpression": None, "expireAfterSeconds": None}
+
+def get_collection(database, collection):
+    """
+    A function to get a collection of a database.
+
+    Parameters:
+        database (Str): The name of the database
+        collection (Str): The name of the collection
+
+    Returns:
+        Collection: The collection
+    """
+    return Database(database, collection).collection
+
+def index_differs(existing, keys, options):
+    """
+    A function to check if an existing index differs from its declaration, in its keys or the options that are compared.
+
+    Parameters:
+        existing (Dict): The index as given by index_information
+        keys (List): The declared keys of the index
+        options (Dict): The declared options of the index
+
+    Returns:
+        Bool: True if the index has other keys or options than declared
+    """
+    if [(field, direction) for field, direction in existing["key"]] != keys:
+        return True
+    for option, default in compared_options.items():
+        existing_value = existing.get(option, default)
+        if isinstance(existing_value, dict):
+            existing_value = dict(existing_value)
+        if existing_value != options.get(option, default):
+            return True
+    return False
+
+def create_indexes(database="workflow-engine", collections=None, recreate=False):
+    """
+    A function to create the required indexes and drop the indexes they replaced. Creating an index that already exists
+    does nothing, so it is safe to run every time the engine starts. An index that fails to be created, such as a unique
+    index over existing duplicates, or an index that exists under its name with other keys or options, is reported and
+    the others are still created.
+
+    Parameters:
+        database (Str): The name of the database
+        collections (List): Optional, the collections to create the indexes of, by default all of them
+        recreate (Bool): If the indexes that exist with other keys or options than declared are dropped and created again
+
+    Returns:
+        List: The names of the indexes that failed to be created, as "<collection>.<index>"
+    """
+    failed = []
+    for collection in collections or required_indexes:
+        collection_conn = get_collection(database, collection)
+        existing = collection_conn.index_information()
+        for name in replaced_indexes.get(collection, []):
+            if name in existing:
+                try:
+                    collection_conn.drop_index(name)
+                    print("Dropped the replaced " + name + " index on " + collection)
+                except PyMongoError as error:
+                    print("Failed to drop the replaced " + name + " index on " + collection + ": ", error)
+
+        for keys, options in required_indexes[collection]:
+            try:
+                if recreate and options["name"] in existing and index_differs(existing[options["name"]], keys, options):
+                    collection_conn.drop_index(options["name"])
+                    print("Dropped the " + options["name"] + " index on " + collection + " to create it again as declared")
+                collection_conn.create_index(keys, **options)
+            except PyMongoError as error:
+                print("Failed to create the " + options["name"] + " index on " + collection + ": ", error)
+                if options["name"] in existing and index_differs(existing[options["name"]], keys, options):
+                    print("The " + options["name"] + " index on " + collection + " differs from its declaration, run python -m modules.indexes --create --recreate to create it again")
+                failed.append(collection + "." + options["name"])
+    return failed
+
+def index_usage(collection_conn):
+    """
+    A function to get how often each index of a collection was used, from the $indexStats of the server. The counts
+    start when the server starts or the index is created, and are for the server answering, not the whole replica set.
+
+    Parameters:
+        collection_conn (Collection): The collection
+
+    Returns:
+        Dict: The number of operations that used each index and the time counting started, by index name. None if the server does not give index stats
+    """
+    try:
+        return {stats["name"]: {"ops": stats["accesses"]["ops"], "since": str(stats["accesses"]["since"])}
+            for stats in collection_conn.aggregate([{"$indexStats": {}}])}
+    except (OperationFailure, NotImplementedError) as error:
+        print("Index stats are not available for " + collection_conn.name + ": ", error)
+        return None
+
+def index_report(database="workflow-engine"):
+    """
+    A function to compare the indexes in the database with the required indexes.
+
+    Parameters:
+        database (Str): The name of the database
+
+    Returns:
+        Dict: For each collection:
+            missing: The required indexes that do not exist
+            different: The required indexes that exist under their name with other keys or options
+            replaced: The indexes earlier versions of the engine created that a required index replaced, create_indexes drops them
+            undeclared: The indexes that exist but are not required by the engine, they may be used by another service
+            unused: The indexes no operation used since the server started counting
+            usage: The operations of each index, if the server gives index stats
+    """
+    report = {}
+    for collection, indexes in required_indexes.items():
+        collection_conn = get_collection(database, collection)
+        existing = collection_conn.index_information()
+        required = {options["name"]: (keys, options) for keys, options in indexes}
+        replaced = replaced_indexes.get(collection, [])
+        usage = index_usage(collection_conn)
+        report[collection] = {
+            "missing": [name for name in required if name not in existing],
+            "different": [name for name, (keys, options) in required.items() if name in existing and index_differs(existing[name], keys, options)],
+            "replaced": [name for name in replaced if name in existing],
+            "undeclared": [name for name in existing if name not in required and name not in replaced and name != "_id_"],
+            "unused": sorted(name for name, stats in (usage or {}).items() if stats["ops"] == 0 and name != "_id_"),
+            "usage": usage
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conf-home", default=Database.conf_home)
+    parser.add_argument("--database", default="workflow-engine")
+    parser.add_argument("--create", action="store_true", help="Create the missing indexes and drop the replaced ones")
+    parser.add_argument("--recreate", action="store_true", help="With --create, drop and create again the indexes that differ from their declaration")
+    parser.add_argument("--report", action="store_true", help="Print the missing, different, replaced, undeclared and unused indexes as JSON")
+    args = parser.parse_args()
+
+    Database.conf_home = args.conf_home
+    failed = []
+    if args.create:
+        failed = create_indexes(args.database, recreate=args.recreate)
+    if args.report or not args.create:
+        print(json.dumps(index_report(args.database), indent=2))
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from kubernetes import client, config
+from kubernetes.client.rest import ApiException
+from kubernetes.config.config_exception import ConfigException
+
+api_client = None
+api_client_lock = threading.Lock()
+
+def get_api_client(connection_pool_size):
+    """
+    A function to get the Kubernetes API client. The kube config is loaded and the client is built once per process,
+    every job submission reuses the client and its HTTP connection pool. The in-cluster config is used when the
+    engine runs in a pod, otherwise the local kube config is used.
+
+    Parameters:
+        connection_pool_size (Int): The maximum number of HTTP connections to the API server
+
+    Returns:
+        ApiClient: The shared Kubernetes API client
+    """
+    global api_client
+
+    with api_client_lock:
+        if api_client is None:
+            configuration = client.Configuration()
+            try:
+                config.load_incluster_config(client_configuration=configuration)
+            except ConfigException:
+                config.load_kube_config(client_configuration=configuration)
+            configuration.connection_pool_maxsize = connection_pool_size
+            api_client = client.ApiClient(configuration)
+
+    return api_client
+
+class JobSubmitter:
+    """
+    Creates Kubernetes jobs with the shared API client. The number of create requests in flight is bounded across
+    every thread submitting jobs. When the API server throttles a request with a 429 the request is retried after
+    the Retry-After the server sent, or an exponential backoff with jitter.
+
+    Attributes:
+        namespace (Str): The Kubernetes namespace the jobs are created in
+        connection_pool_size (Int): The maximum number of HTTP connections to the API server
+        in_flight (BoundedSemaphore): Limits the number of create requests in flight
+        max_retries (Int): The number of times a throttled request is retried
+        backoff (Float): The number of seconds to wait before the first retry, doubled for each retry after it
+        max_backoff (Float): The longest wait between retries
+    """
+
+    def __init__(self, namespace, connection_pool_size, max_in_flight, max_retries=5, backoff=0.5, max_backoff=30) -> None:
+        """
+        The constructor for the JobSubmitter class.
+
+        Parameters:
+            self (JobSubmitter): The object itself
+            namespace (Str): The Kubernetes namespace the jobs are created in
+            connection_pool_size (Int): The maximum number of HTTP connections to the API server
+            max_in_flight (Int): The maximum number of create requests in flight
+            max_retries (Int): The number of times a throttled request is retried
+            backoff (Float): The number of seconds to wait before the first retry
+            max_backoff (Float): The longest wait between retries
+        """
+        self.namespace = namespace
+        self.connection_pool_size = connection_pool_size
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def create_job(self, job_dict):
+        """
+        Create a single job.
+
+        Parameters:
+            self (JobSubmitter): The object itself
+            job_dict (Dict): The batch/v1 Job to create
+
+        Returns:
+            V1Job: The created job
+        """
+        batch_api = client.BatchV1Api(get_api_client(self.connection_pool_size))
+        backoff = self.backoff
+        attempt = 0
+
+        while True:
+            try:
+                with self.in_flight:
+                    return batch_api.create_namespaced_job(self.namespace, job_dict)
+            except ApiException as error:
+                if error.status != 429 or attempt >= self.max_retries:
+                    raise
+                time.sleep(self.retry_after(error, backoff))
+                backoff = min(backoff * 2, self.max_backoff)
+                attempt = attempt + 1
+
+    def create_jobs(self, job_dicts):
+        """
+        Create many jobs concurrently, sharing the in flight limit with every other submission.
+
+        Parameters:
+            self (JobSubmitter): The object itself
+            job_dicts (List): The batch/v1 Jobs to create
+
+        Returns:
+            List: The created jobs, in the same order as job_dicts
+        """
+        if len(job_dicts) == 1:
+            return [self.create_job(job_dicts[0])]
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_in_flight, len(job_dicts))), thread_name_prefix="job-submit") as pool:
+            return list(pool.map(self.create_job, job_dicts))
+
+    def retry_after(self, error, backoff):
+        """
+        Work out how long to wait before retrying a throttled request.
+
+        Parameters:
+            self (JobSubmitter): The object itself
+            error (ApiException): The 429 returned by the API server
+            backoff (Float): The current backoff
+
+        Returns:
+            Float: The number of seconds to wait
+        """
+        if error.headers and error.headers.get("Retry-After"):
+            try:
+                return min(float(error.headers["Retry-After"]), self.max_backoff)
+            except ValueError:
+                pass
+        return backoff / 2 + random.uniform(0, backoff / 2)
@@ -0,0 +1,105 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+
+import os
+from flask import Response
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import multiprocess
+
+workflow_labels = ["workflow_namespace", "workflow_name", "workflow_version"]
+action_labels = ["action_namespace", "action_name", "action_version"]
+
+definition_lookup_seconds = Histogram(
+    "llamaflow_definition_lookup_seconds", "Time to get a workflow or action definition, including cache hits",
+    ["kind", "namespace", "name", "version"])
+execution_record_insert_seconds = Histogram(
+    "llamaflow_execution_record_insert_seconds", "Time to insert the runnerExecution record of an action", action_labels)
+job_submit_seconds = Histogram(
+    "llamaflow_job_submit_seconds", "Time for an execution backend to accept the runners of a submission, a batch of one action can hold several runners",
+    ["backend"] + action_labels)
+workflow_queue_wait_seconds = Histogram(
+    "llamaflow_workflow_queue_wait_seconds", "Time a workflow execution waited in the queue before an executor claimed it",
+    workflow_labels)
+runner_queue_wait_seconds = Histogram(
+    "llamaflow_runner_queue_wait_seconds", "Time a pooled action waited before a runner claimed it", action_labels)
+runner_run_seconds = Histogram(
+    "llamaflow_runner_run_seconds", "Time from an action being submitted, or claimed by a pooled runner, to its result being posted",
+    action_labels + ["execution_status"])
+result_write_seconds = Histogram(
+    "llamaflow_result_write_seconds", "Time to write the result a runner posted back", action_labels)
+step_seconds = Histogram(
+    "llamaflow_step_seconds", "Time to run an action as a workflow step, from submission to completion",
+    action_labels + ["execution_status"])
+workflow_seconds = Histogram(
+    "llamaflow_workflow_seconds", "Time to run a workflow execution once it was claimed",
+    workflow_labels + ["status"])
+workflows_total = Counter(
+    "llamaflow_workflows", "Workflow executions finished", workflow_labels + ["status"])
+actions_total = Counter(
+    "llamaflow_actions", "Actions finished", action_labels + ["execution_status"])
+action_cache_total = Counter(
+    "llamaflow_action_cache", "Lookups of cacheable actions in the action result cache", action_labels + ["result"])
+executions_archived_total = Counter(
+    "llamaflow_executions_archived", "Executions archived and removed by the retention sweeper", ["collection"])
+admission_queued = Gauge(
+    "llamaflow_admission_queued", "Actions waiting for admission to launch", ["workflow_namespace"], multiprocess_mode="livesum")
+admission_running = Gauge(
+    "llamaflow_admission_running", "Admitted actions that have not finished", ["workflow_namespace"], multiprocess_mode="livesum")
+admission_wait_seconds = Histogram(
+    "llamaflow_admission_wait_seconds", "Time an action waited for admission to launch", ["workflow_namespace"])
+
+def workflow_label_values(workflow_namespace, workflow_name, version):
+    """
+    A function to get the label values of a workflow.
+
+    Parameters:
+        workflow_namespace (Str): The namespace the workflow resides in
+        workflow_name (Str): The name of the workflow
+        version (Int): The version of the workflow
+
+    Returns:
+        Dict: The workflow labels
+    """
+    return {"workflow_namespace": workflow_namespace, "workflow_name": workflow_name, "workflow_version": str(version)}
+
+def action_label_values(action_namespace, action_name, version):
+    """
+    A function to get the label values of an action.
+
+    Parameters:
+        action_namespace (Str): The namespace the action resides in
+        action_name (Str): The name of the action
+        version (Int): The version of the action
+
+    Returns:
+        Dict: The action labels
+    """
+    return {"action_namespace": action_namespace, "action_name": action_name, "action_version": str(version)}
+
+def metrics():
+    """
+    The /metrics endpoint, in the Prometheus text format. When the app runs in several processes with
+    PROMETHEUS_MULTIPROC_DIR set, the metrics of every process are combined.
+
+    Returns:
+        Response: The metrics
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
@@ -0,0 +1,224 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+
+import threading
+import time
+from pymongo.errors import OperationFailure, PyMongoError
+
+class ExecutionNotifier:
+    """
+    An in-process notifier used to wake up anything waiting on a runner execution as soon as its result is recorded.
+
+    Attributes:
+        waiters (Dict): Maps an execution id to a list with the threading.Event and the status it was notified with
+        lock (Lock): Protects the waiters dict
+    """
+
+    def __init__(self) -> None:
+        """
+        The constructor for the ExecutionNotifier class.
+
+        Parameters:
+            self (ExecutionNotifier): The object itself
+        """
+        self.waiters = {}
+        self.lock = threading.Lock()
+
+    def register(self, execution_id):
+        """
+        Register interest in an execution. This must be called before the execution status is checked, so a result recorded
+        between the check and the wait is not missed.
+
+        Parameters:
+            self (ExecutionNotifier): The object itself
+            execution_id (Str): A 24 character hexadecimal string with lowercase letters.
+
+        Returns:
+            none
+        """
+        with self.lock:
+            waiter = self.waiters.setdefault(execution_id, [threading.Event(), None, 0])
+            waiter[2] = waiter[2] + 1
+
+    def unregister(self, execution_id):
+        """
+        Remove interest in an execution once the waiter is done with it.
+
+        Parameters:
+            self (ExecutionNotifier): The object itself
+            execution_id (Str): A 24 character hexadecimal string with lowercase letters.
+
+        Returns:
+            none
+        """
+        with self.lock:
+            waiter = self.waiters.get(execution_id)
+            if waiter:
+                waiter[2] = waiter[2] - 1
+                if waiter[2] <= 0:
+                    del self.waiters[execution_id]
+
+    def notify(self, execution_id, execution_status):
+        """
+        Wake up everything waiting on an execution. Executions nobody is waiting on are ignored.
+
+        Parameters:
+            self (ExecutionNotifier): The object itself
+            execution_id (Str): A 24 character hexadecimal string with lowercase letters.
+            execution_status (Str): ("submitted", "success", "failed")
+
+        Returns:
+            none
+        """
+        with self.lock:
+            waiter = self.waiters.get(execution_id)
+            if waiter:
+                waiter[1] = execution_status
+                waiter[0].set()
+
+    def wait(self, execution_id, timeout):
+        """
+        Wait for an execution to be notified.
+
+        Parameters:
+            self (ExecutionNotifier): The object itself
+            execution_id (Str): A 24 character hexadecimal string with lowercase letters.
+            timeout (Float): The number of seconds to wait before giving up
+
+        Returns:
+            Str: The execution status the execution was notified with
+            None: If the timeout expired first
+        """
+        with self.lock:
+            waiter = self.waiters.get(execution_id)
+        if not waiter:
+            return None
+
+        if waiter[0].wait(timeout):
+            execution_status = waiter[1]
+            if execution_status not in ("success", "failed"):
+                waiter[0].clear()
+            return execution_status
+        return None
+
+
+class ChangeStreamWatcher(threading.Thread):
+    """
+    A background thread that watches the runnerExecution collection with a MongoDB change stream and notifies waiters when a
+    runner execution finishes. This covers results that were posted to a different engine process. Change streams need a
+    replica set, if the server does not support them the watcher stops and the waiters fall back to polling.
+    When the change stream fails, in a failover or a network error, it is opened again after a backoff, resuming after
+    the last change it saw. If that change is no longer in the oplog the stream starts from the present, the waiters
+    poll for the changes that were missed.
+
+    Attributes:
+        collection (Collection): The runnerExecution collection to watch
+        notifier (ExecutionNotifier): The notifier to wake waiters with
+        resume_token (Dict): The resume token of the last change seen, None until the first one
+        backoff (Float): The number of seconds to wait before the first retry, doubled for each retry after it
+        max_backoff (Float): The longest wait between retries
+    """
+
+    pipeline = [
+        {"$match": {
+            "operationType": "update",
+            "updateDescription.updatedFields.execution_status": {"$in": ["success", "failed"]}
+        }}
+    ]
+
+    # The server errors that mean change streams are not supported, such as on a standalone server
+    unsupported_codes = (40573,)
+    # The server errors that mean the resume token is no longer in the oplog
+    history_lost_codes = (280, 286)
+
+    def __init__(self, collection, notifier, backoff=1, max_backoff=30) -> None:
+        """
+        The constructor for the ChangeStreamWatcher class.
+
+        Parameters:
+            self (ChangeStreamWatcher): The object itself
+            collection (Collection): The runnerExecution collection to watch
+            notifier (ExecutionNotifier): The notifier to wake waiters with
+            backoff (Float): The number of seconds to wait before the first retry
+            max_backoff (Float): The longest wait between retries
+        """
+        super().__init__(name="runner-execution-watcher", daemon=True)
+        self.collection = collection
+        self.notifier = notifier
+        self.resume_token = None
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def run(self):
+        """
+        Watch the collection until the process exits, opening the change stream again whenever it fails. The watcher
+        only stops if the server does not support change streams.
+
+        Parameters:
+            self (ChangeStreamWatcher): The object itself
+
+        Returns:
+            none
+        """
+        backoff = self.backoff
+        while True:
+            try:
+                with self.collection.watch(self.pipeline, resume_after=self.resume_token) as stream:
+                    backoff = self.backoff
+                    for change in stream:
+                        execution_id = str(change['documentKey']['_id'])
+                        execution_status = change['updateDescription']['updatedFields']['execution_status']
+                        self.notifier.notify(execution_id, execution_status)
+                        self.resume_token = stream.resume_token
+            except NotImplementedError as error:
+                print("Change streams are not supported, falling back to polling: ", error)
+                return
+            except OperationFailure as error:
+                if error.code in self.unsupported_codes:
+                    print("Change streams are not supported, falling back to polling: ", error)
+                    return
+                if error.code in self.history_lost_codes:
+                    print("The change stream can not resume after its last change, watching from now: ", error)
+                    self.resume_token = None
+                    continue
+                print("Change stream watcher failed, retrying in " + str(backoff) + " seconds: ", error)
+            except PyMongoError as error:
+                print("Change stream watcher failed, retrying in " + str(backoff) + " seconds: ", error)
+
+            time.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+
+notifier = ExecutionNotifier()
+watcher = None
+watcher_lock = threading.Lock()
+
+def start_change_stream_watcher(collection):
+    """
+    Start the change stream watcher for this process, if it is not already running.
+
+    Parameters:
+        collection (Collection): The runnerExecution collection to watch
+
+    Returns:
+        none
+    """
+    global watcher
+
+    with watcher_lock:
+        if watcher is None:
+            watcher = ChangeStreamWatcher(collection, notifier)
+            watcher.start()
@@ -0,0 +1,188 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+
+import json
+import threading
+import time
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+from modules.database import Database
+
+class OutputStore:
+    """
+    The output of action executions, stored as numbered chunks in the runnerOutput collection instead of one string
+    in the runnerExecution document. Runners append output while they run, and readers fetch or stream the chunks,
+    so the execution document stays small however much output an action writes.
+
+    Attributes:
+        chunk_size (Int): The most characters stored in one chunk
+        recheck_interval (Float): The longest a stream goes without checking the database, for output appended by another engine process
+        condition (Condition): Notified when output is appended in this process, so waiting streams send it right away
+    """
+
+    def __init__(self, chunk_size=262144, recheck_interval=1) -> None:
+        """
+        The constructor for the OutputStore class.
+
+        Parameters:
+            self (OutputStore): The object itself
+            chunk_size (Int): The most characters stored in one chunk
+            recheck_interval (Float): The longest a stream goes without checking the database
+        """
+        self.chunk_size = chunk_size
+        self.recheck_interval = recheck_interval
+        self.condition = threading.Condition()
+
+    def append(self, execution_id, output):
+        """
+        Append output to an execution. The chunk numbers are reserved with a counter on the execution document, so
+        appends from several processes keep their order without reading the chunks already stored.
+
+        Parameters:
+            self (OutputStore): The object itself
+            execution_id (Str): A 24 character hexadecimal string with lowercase letters.
+            output (Str): The output to append
+
+        Returns:
+            Dict: The number of chunks and characters of output the execution has
+            None: If the execution does not exist
+        """
+        chunks = [output[start:start + self.chunk_size] for start in range(0, len(output), self.chunk_size)]
+
+        execution = Database("workflow-engine", "runnerExecution").collection.find_one_and_update(
+            {"_id": ObjectId(execution_id)},
+            {"$inc": {"output_chunks": len(chunks), "output_size": len(output)}},
+            projection={"output_chunks": 1, "output_size": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if not execution:
+            return None
+
+        if not chunks:
+            return {"output_chunks": execution["output_chunks"], "output_size": execution["output_size"]}
+
+        first = execution["output_chunks"] - len(chunks)
+        now = time.time()
+        Database("workflow-engine", "runnerOutput").collection.insert_many(
+            [{"execution_id": execution_id, "seq": first + index, "data": chunk, "time": now} for index, chunk in enumerate(chunks)],
+            ordered=False
+        )
+
+        with self.condition:
+            self.condition.notify_all()
+
+        return {"output_chunks": execution["output_chunks"], "output_size": execution["output_size"]}
+
+    def chunks(self, execution_id, after=-1):
+        """
+        Get the chunks of an execution's output in order.
+
+        Parameters:
+            self (OutputStore): The object itself
+            execution_id (Str): A 24 character hexadecimal string with lowercase letters.
+            after (Int): Only get the chunks numbered after this one
+
+        Returns:
+            Cursor: The chunk documents, with their seq and data
+        """
+        return Database("workflow-engine", "runnerOutput").collection.find(
+            {"execution_id": execution_id, "seq": {"$gt": after}},
+            projection={"_id": 0, "seq": 1, "data": 1}
+        ).sort("seq", ASCENDING)
+
+    def inline_output(self, execution_id):
+        """
+        Get the output of an execution that has no chunks, the output kept in its execution_output.
+
+        Parameters:
+            self (OutputStore): The object itself
+            execution_id (Str): A 24 character hexadecimal string with lowercase letters.
+
+        Returns:
+            Str: The inline output, or None if the execution has output chunks or no output
+        """
+        execution = Database("workflow-engine", "runnerExecution").collection.find_one(
+            {"_id": ObjectId(execution_id)}, projection={"output_chunks": 1, "execution_output": 1})
+        if execution is None or execution.get("output_chunks"):
+            return None
+        return execution.get("execution_output")
+
+    def read(self, execution_id):
+        """
+        Get all the output of an execution. Output that was posted with the result and fit within the inline limit is
+        only in the execution_output of the execution, there are no chunks for it.
+
+        Parameters:
+            self (OutputStore): The object itself
+            execution_id (Str): A 24 character hexadecimal string with lowercase letters.
+
+        Returns:
+            Str: The output
+        """
+        inline = self.inline_output(execution_id)
+        if inline is not None:
+            return inline
+        return "".join(chunk["data"] for chunk in self.chunks(execution_id))
+
+    def stream(self, execution_id, after=-1, keepalive=15):
+        """
+        Stream the output of an execution as server sent events, one event per chunk with the chunk number as its id,
+        until the execution has finished and all its output is sent. Chunks are sent in order without gaps: appends
+        reserve their chunk numbers before inserting the chunks, so a later chunk can be stored before an earlier one,
+        and the stream waits for the earlier one. Once the execution has finished a missing chunk is skipped, its append
+        failed. An execution without chunks, whose output is inline in its execution_output, gets that output as one
+        event numbered 0 once it has finished. The stream then ends with an "end" event that has the execution status
+        as its data.
+
+        Parameters:
+            self (OutputStore): The object itself
+            execution_id (Str): A 24 character hexadecimal string with lowercase letters.
+            after (Int): Only stream the chunks numbered after this one, for a client resuming with Last-Event-ID
+            keepalive (Float): The number of seconds between comments sent to keep an idle stream open
+
+        Returns:
+            Generator: The server sent events
+        """
+        executions = Database("workflow-engine", "runnerExecution").collection
+        last_sent = time.monotonic()
+
+        while True:
+            execution = executions.find_one({"_id": ObjectId(execution_id)}, projection={"execution_status": 1})
+            finished = execution is None or execution.get("execution_status") in ("success", "failed")
+            sent = False
+            for chunk in self.chunks(execution_id, after):
+                if chunk["seq"] != after + 1 and not finished:
+                    # An append reserved the missing chunk numbers and has not inserted them yet
+                    break
+                after = chunk["seq"]
+                sent = True
+                yield f"id: {after}\n" + "".join(f"data: {line}\n" for line in chunk["data"].split("\n")) + "\n"
+
+            if sent:
+                last_sent = time.monotonic()
+                continue
+            if finished:
+                inline = self.inline_output(execution_id) if execution is not None and after < 0 else None
+                if inline:
+                    yield "id: 0\n" + "".join(f"data: {line}\n" for line in inline.split("\n")) + "\n"
+                yield f"event: end\ndata: {json.dumps(execution.get('execution_status') if execution else None)}\n\n"
+                return
+            if time.monotonic() - last_sent >= keepalive:
+                last_sent = time.monotonic()
+                yield ": keepalive\n\n"
+
+            with self.condition:
+                self.condition.wait(self.recheck_interval)
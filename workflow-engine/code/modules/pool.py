@@ -0,0 +1,242 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+
+import atexit
+import os
+import subprocess
+import sys
+import threading
+import time
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+from modules.database import Database
+from modules import metrics
+
+class RunnerPoolQueue:
+    """
+    The queue pooled runners claim work from. The queue is the runnerExecution documents with the execution status
+    "queued", each tagged with the runner pool that should run it. A claim waits for work to show up, so idle
+    workers long poll the engine instead of spinning. Only max_waiting claims wait at once, so idle workers can not
+    hold all the request threads of the engine, the others return right away.
+
+    A claimed execution has a lease the worker renews while it runs. An execution whose lease expired, because its
+    worker died, is claimed again like queued work, up to max_claims times.
+
+    Attributes:
+        condition (Condition): Notified when work is queued in this process, so waiting claims retry right away
+        recheck_interval (Float): The longest a waiting claim goes without checking the database, for work queued by another engine process
+        lease_seconds (Float): How long a claim lasts without being renewed
+        max_claims (Int): The number of times an execution is claimed before an expired lease fails it
+        max_waiting (Int): The most claims that wait for work at once
+        waiting (Int): The claims waiting for work now
+    """
+
+    def __init__(self, recheck_interval=1, lease_seconds=60, max_claims=3, max_waiting=8) -> None:
+        """
+        The constructor for the RunnerPoolQueue class.
+
+        Parameters:
+            self (RunnerPoolQueue): The object itself
+            recheck_interval (Float): The longest a waiting claim goes without checking the database
+            lease_seconds (Float): How long a claim lasts without being renewed
+            max_claims (Int): The number of times an execution is claimed before an expired lease fails it
+            max_waiting (Int): The most claims that wait for work at once
+        """
+        self.condition = threading.Condition()
+        self.recheck_interval = recheck_interval
+        self.lease_seconds = lease_seconds
+        self.max_claims = max_claims
+        self.max_waiting = max_waiting
+        self.waiting = 0
+
+    def notify(self):
+        """
+        Wake up the claims waiting in this process.
+
+        Parameters:
+            self (RunnerPoolQueue): The object itself
+
+        Returns:
+            none
+        """
+        with self.condition:
+            self.condition.notify_all()
+
+    def claim(self, runner_pool, worker_id, wait):
+        """
+        Atomically claim the oldest queued execution for a runner pool, or an execution whose claim expired.
+
+        Parameters:
+            self (RunnerPoolQueue): The object itself
+            runner_pool (Str): The name of the runner pool
+            worker_id (Str): The id of the worker claiming the work, recorded as the pod id of the execution
+            wait (Float): The number of seconds to wait for work when none is queued, no wait if max_waiting claims are already waiting
+
+        Returns:
+            Dict: The claimed runnerExecution document
+            None: If no work was queued before the wait ran out
+        """
+        db_connection = Database("workflow-engine", "runnerExecution")
+        deadline = time.monotonic() + wait
+        waiting = False
+
+        try:
+            while True:
+                now = time.time()
+                execution = db_connection.collection.find_one_and_update(
+                    {"runner_pool": runner_pool, "$or": [
+                        {"execution_status": "queued"},
+                        {"execution_status": "submitted", "lease_expires": {"$lt": now}, "claims": {"$lt": self.max_claims}}
+                    ]},
+                    {
+                        "$set": {"execution_status": "submitted", "pod_id": worker_id, "claimed_time": now, "lease_expires": now + self.lease_seconds},
+                        "$inc": {"claims": 1}
+                    },
+                    sort=[("_id", 1)],
+                    return_document=ReturnDocument.AFTER
+                )
+                if execution:
+                    if "submitted_time" in execution and execution["claims"] == 1:
+                        labels = metrics.action_label_values(execution["action_namespace"], execution["action_name"], execution["version"])
+                        metrics.runner_queue_wait_seconds.labels(**labels).observe(execution["claimed_time"] - execution["submitted_time"])
+                    return execution
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                with self.condition:
+                    if not waiting:
+                        if self.waiting >= self.max_waiting:
+                            return None
+                        self.waiting += 1
+                        waiting = True
+                    self.condition.wait(min(self.recheck_interval, remaining))
+        finally:
+            if waiting:
+                with self.condition:
+                    self.waiting -= 1
+
+    def renew(self, runner_pool, execution_id, worker_id):
+        """
+        Extend the lease of a claimed execution, called by the worker running it.
+
+        Parameters:
+            self (RunnerPoolQueue): The object itself
+            runner_pool (Str): The name of the runner pool
+            execution_id (Str): The execution id of the claimed execution
+            worker_id (Str): The id of the worker that claimed the execution
+
+        Returns:
+            Float: The time the lease now expires
+            None: If the execution finished or was claimed by another worker after its lease expired
+        """
+        db_connection = Database("workflow-engine", "runnerExecution")
+        lease_expires = time.time() + self.lease_seconds
+
+        update = db_connection.collection.update_one(
+            {"_id": ObjectId(execution_id), "runner_pool": runner_pool, "execution_status": "submitted", "pod_id": worker_id},
+            {"$set": {"lease_expires": lease_expires}}
+        )
+        if update.matched_count == 0:
+            return None
+        return lease_expires
+
+    def abandoned(self, runner_pool):
+        """
+        Find the executions of a runner pool whose lease expired after their last claim, the caller fails them.
+
+        Parameters:
+            self (RunnerPoolQueue): The object itself
+            runner_pool (Str): The name of the runner pool
+
+        Returns:
+            List: The execution ids, as strings
+        """
+        db_connection = Database("workflow-engine", "runnerExecution")
+
+        executions = db_connection.collection.find(
+            {"runner_pool": runner_pool, "execution_status": "submitted", "lease_expires": {"$lt": time.time()}, "claims": {"$gte": self.max_claims}},
+            {"_id": 1}
+        )
+        return [str(execution["_id"]) for execution in executions]
+
+
+class LocalRunnerPool:
+    """
+    Runs a runner pool as local processes instead of pods, so pooled execution can be used and tested without a cluster.
+    Each worker is the runner script started in loop mode, with the same environment a pod of the pool gets.
+
+    Attributes:
+        runner_pool (Str): The name of the runner pool
+        script (Str): The path of the runner script, such as runners/runner-echo/code/runner.py
+        workers (Int): The number of worker processes
+        api_url (Str): The base url of the engine API, such as http://127.0.0.1:8000/api
+        processes (List): The running worker processes
+    """
+
+    def __init__(self, runner_pool, script, workers, api_url) -> None:
+        """
+        The constructor for the LocalRunnerPool class.
+
+        Parameters:
+            self (LocalRunnerPool): The object itself
+            runner_pool (Str): The name of the runner pool
+            script (Str): The path of the runner script
+            workers (Int): The number of worker processes
+            api_url (Str): The base url of the engine API
+        """
+        self.runner_pool = runner_pool
+        self.script = script
+        self.workers = workers
+        self.api_url = api_url
+        self.processes = []
+
+    def start(self):
+        """
+        Start the worker processes. They are stopped when the engine exits.
+
+        Parameters:
+            self (LocalRunnerPool): The object itself
+
+        Returns:
+            none
+        """
+        for worker in range(self.workers):
+            env = dict(os.environ)
+            env.update({
+                "RUNNER_MODE": "loop",
+                "POD_ID": f"{self.runner_pool}-local-{worker}",
+                "RUNNER_POOL_URL": f"{self.api_url}/runner/pool/{self.runner_pool}/claim",
+                "POSTBACK_BASE_URL": f"{self.api_url}/runner",
+            })
+            self.processes.append(subprocess.Popen([sys.executable, self.script], env=env))
+        atexit.register(self.stop)
+
+    def stop(self):
+        """
+        Stop the worker processes.
+
+        Parameters:
+            self (LocalRunnerPool): The object itself
+
+        Returns:
+            none
+        """
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.wait()
+        self.processes = []
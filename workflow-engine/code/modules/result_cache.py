@@ -0,0 +1,97 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+
+import datetime
+import hashlib
+import json
+import time
+from modules.database import Database
+
+class ActionResultCache:
+    """
+    The results of cacheable actions, stored in the actionResultCache collection. An action definition with
+    "cacheable": true declares its action a pure function of its namespace, name, version and parameters, so a
+    successful execution can be reused for the same parameters until it expires. Each entry maps the hash of those
+    to the execution id of the successful run, and a TTL index on expires_at removes expired entries.
+
+    Attributes:
+        default_ttl (Int): The number of seconds an entry lasts when the action definition has no cache_ttl
+    """
+
+    def __init__(self, default_ttl=3600) -> None:
+        """
+        The constructor for the ActionResultCache class.
+
+        Parameters:
+            self (ActionResultCache): The object itself
+            default_ttl (Int): The number of seconds an entry lasts when the action definition has no cache_ttl
+        """
+        self.default_ttl = default_ttl
+
+    def key(self, action_namespace, action_name, version, parameters):
+        """
+        Get the cache key of an action run, the sha256 hash of the action and its parameters as canonical JSON.
+
+        Parameters:
+            self (ActionResultCache): The object itself
+            action_namespace (Str): The namespace the action resides in
+            action_name (Str): The name of the action
+            version (Int): The version of the action
+            parameters (Object): The parameters of the action
+
+        Returns:
+            Str: The cache key
+        """
+        canonical = json.dumps([action_namespace, action_name, version, parameters], sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def get(self, key):
+        """
+        Get the execution id of a cached run. Entries are checked for expiry here as well, the TTL index only removes
+        them about once a minute.
+
+        Parameters:
+            self (ActionResultCache): The object itself
+            key (Str): The cache key
+
+        Returns:
+            Str: The execution id of the successful run
+            None: If there is no entry that has not expired
+        """
+        entry = Database("workflow-engine", "actionResultCache").collection.find_one(
+            {"_id": key, "expires_at": {"$gt": datetime.datetime.utcnow()}}, projection={"execution_id": 1})
+        return entry["execution_id"] if entry else None
+
+    def put(self, key, execution_id, ttl=None):
+        """
+        Cache the successful run of an action.
+
+        Parameters:
+            self (ActionResultCache): The object itself
+            key (Str): The cache key
+            execution_id (Str): The execution id of the successful run
+            ttl (Int): Optional, the number of seconds the entry lasts, by default default_ttl
+
+        Returns:
+            none
+        """
+        ttl = ttl if ttl is not None else self.default_ttl
+        Database("workflow-engine", "actionResultCache").collection.update_one(
+            {"_id": key},
+            {"$set": {"execution_id": execution_id, "cached_time": time.time(),
+                      "expires_at": datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl)}},
+            upsert=True
+        )
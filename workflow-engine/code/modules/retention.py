@@ -0,0 +1,401 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+"""
+The retention of execution history. Finished workflow and action executions older than the retention of their
+namespace and status are archived to compressed newline delimited JSON files, then removed from the database with
+their output chunks and result cache entries, so the collections the engine works from stay small.
+
+Usage:
+    python -m modules.retention sweep [--dry-run]
+    python -m modules.retention query runnerExecution --namespace core --status failed --since 2026-01-01
+"""
+
+import argparse
+import datetime
+import gzip
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from bson.objectid import ObjectId
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+from modules.database import Database, json_safe
+from modules import metrics
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# The fields each collection is matched on by the retention rules, and the statuses of the executions that are finished
+collections = {
+    "workflowExecution": {"kind": "workflow", "namespace": "workflow_namespace", "status": "status", "finished": ["success", "failed"]},
+    "runnerExecution": {"kind": "action", "namespace": "action_namespace", "status": "execution_status", "finished": ["success", "failed", "cached"]},
+}
+
+def rule_rank(rule):
+    """
+    A function to get how specific a retention rule is, a rule for a namespace is more specific than a rule for a
+    status, which is more specific than a rule for a kind of execution.
+    """
+    return (rule.get("namespace") is not None) * 4 + (rule.get("status") is not None) * 2 + (rule.get("kind") is not None)
+
+def rule_match(rule, fields):
+    """
+    A function to get the query matching the executions of a collection a retention rule is for.
+    """
+    match = {}
+    if rule.get("namespace") is not None:
+        match[fields["namespace"]] = rule["namespace"]
+    if rule.get("status") is not None:
+        match[fields["status"]] = rule["status"]
+    return match
+
+def retention_queries(rules, collection, now):
+    """
+    A function to get the queries that find the executions of a collection past their retention. Each execution is
+    kept for the days of the most specific rule that matches it, so the query of a rule leaves out the executions a
+    more specific rule matches. A rule without days, or with 0 days, keeps its executions.
+
+    Parameters:
+        rules (List): The retention rules, each with days and optionally a kind ("workflow" or "action"), namespace and status
+        collection (Str): workflowExecution or runnerExecution
+        now (Float): The unix timestamp the ages are counted from
+
+    Returns:
+        List: (rule, query) tuples, with the age limit of the rule as a range on _id
+    """
+    fields = collections[collection]
+    rules = [rule for rule in rules if rule.get("kind") in (None, fields["kind"])]
+    queries = []
+    for rule in rules:
+        if not rule.get("days"):
+            continue
+        overlapping = [other for other in rules if rule_rank(other) > rule_rank(rule)
+            and all(rule.get(field) is None or other.get(field) is None or rule.get(field) == other.get(field) for field in ("namespace", "status"))]
+        cutoff = datetime.datetime.fromtimestamp(now - rule["days"] * 86400, datetime.timezone.utc)
+        query = dict(rule_match(rule, fields), _id={"$lt": ObjectId.from_datetime(cutoff)})
+        if rule.get("status") is None:
+            query[fields["status"]] = {"$in": fields["finished"]}
+        elif rule["status"] not in fields["finished"]:
+            continue
+        exclusions = [rule_match(other, fields) for other in overlapping]
+        if {} in exclusions:
+            # A more specific rule matches every execution this rule does
+            continue
+        if exclusions:
+            query["$nor"] = exclusions
+        queries.append((rule, query))
+    return queries
+
+def archive_path(archive_dir, collection, documents):
+    """
+    A function to get the file a batch of executions is archived to, named after the first and last execution id, in a
+    directory per collection and month.
+    """
+    first = documents[0]["_id"]
+    extension = ".ndjson.zst" if zstandard else ".ndjson.gz"
+    return os.path.join(archive_dir, collection, first.generation_time.strftime("%Y-%m"),
+        f"{collection}-{first}-{documents[-1]['_id']}{extension}")
+
+def write_archive(path, documents):
+    """
+    A function to write executions to an archive file, one JSON document per line, compressed with zstd, or gzip when
+    zstandard is not installed. The file is written under a temporary name and synced before it is renamed, so a file
+    with the final name is always complete.
+
+    Parameters:
+        path (Str): The archive file
+        documents (List): The execution documents
+
+    Returns:
+        none
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = "".join(json.dumps(json_safe(document), separators=(",", ":")) + "\n" for document in documents).encode()
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        if path.endswith(".zst"):
+            file.write(zstandard.ZstdCompressor(level=10).compress(data))
+        else:
+            file.write(gzip.compress(data))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+def read_archive_file(path):
+    """
+    A function to read the executions of an archive file.
+
+    Parameters:
+        path (Str): The archive file
+
+    Returns:
+        Generator: The execution documents, in extended JSON
+    """
+    with open(path, "rb") as file:
+        if path.endswith(".zst"):
+            if zstandard is None:
+                raise RuntimeError("zstandard must be installed to read " + path)
+            stream = zstandard.ZstdDecompressor().stream_reader(file)
+        else:
+            stream = gzip.GzipFile(fileobj=file)
+        for line in stream.read().decode().splitlines():
+            if line:
+                yield json.loads(line)
+
+def read_archive(archive_dir, collection, namespace=None, status=None, since=None, until=None):
+    """
+    A function to query archived executions. The files whose execution id range is outside the time range are skipped
+    without being read.
+
+    Parameters:
+        archive_dir (Str): The archive directory
+        collection (Str): workflowExecution or runnerExecution
+        namespace (Str): Optional, only executions in this namespace
+        status (Str): Optional, only executions with this status
+        since (datetime): Optional, only executions created at or after this time
+        until (datetime): Optional, only executions created before this time
+
+    Returns:
+        Generator: The matching execution documents, oldest first
+    """
+    fields = collections[collection]
+    lower = ObjectId.from_datetime(since) if since else None
+    upper = ObjectId.from_datetime(until) if until else None
+    files = []
+    for directory, subdirectories, names in os.walk(os.path.join(archive_dir, collection)):
+        for name in names:
+            if name.endswith(".tmp"):
+                continue
+            first, last = name.split(".")[0].split("-")[1:3]
+            if (upper and ObjectId(first) >= upper) or (lower and ObjectId(last) < lower):
+                continue
+            files.append((first, os.path.join(directory, name)))
+
+    for first, path in sorted(files):
+        for document in read_archive_file(path):
+            execution_id = ObjectId(document["_id"]["$oid"])
+            if (lower and execution_id < lower) or (upper and execution_id >= upper):
+                continue
+            if namespace is not None and document.get(fields["namespace"]) != namespace:
+                continue
+            if status is not None and document.get(fields["status"]) != status:
+                continue
+            yield document
+
+class RetentionSweeper:
+    """
+    Archives and removes the executions past their retention, in the background every interval. Only one engine
+    process sweeps at a time, the sweep is leased through a document in the engineLocks collection.
+
+    Attributes:
+        rules (List): The retention rules
+        archive_dir (Str): The directory the archive files are written to
+        interval (Float): The number of seconds between sweeps
+        batch_size (Int): The most executions archived to one file
+        owner (Str): The id this process takes the sweep lease as
+    """
+
+    def __init__(self, rules, archive_dir, interval=3600, batch_size=1000, owner=None) -> None:
+        """
+        The constructor for the RetentionSweeper class.
+
+        Parameters:
+            self (RetentionSweeper): The object itself
+            rules (List): The retention rules, each with days and optionally a kind ("workflow" or "action"), namespace and status
+            archive_dir (Str): The directory the archive files are written to
+            interval (Float): The number of seconds between sweeps
+            batch_size (Int): The most executions archived to one file
+            owner (Str): Optional, the id to take the sweep lease as, by default the host name, process id and a random suffix
+        """
+        self.rules = rules
+        self.archive_dir = archive_dir
+        self.interval = interval
+        self.batch_size = batch_size
+        self.owner = owner or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.thread = None
+
+    def start(self):
+        """
+        Start the sweeper thread, if there are rules and it is not already running.
+
+        Parameters:
+            self (RetentionSweeper): The object itself
+
+        Returns:
+            none
+        """
+        if self.thread is None and self.rules and self.interval:
+            self.thread = threading.Thread(target=self.run, name="retention-sweeper", daemon=True)
+            self.thread.start()
+
+    def run(self):
+        """
+        The sweeper loop, sweeps every interval while it holds the sweep lease.
+        """
+        while True:
+            try:
+                if self.claim():
+                    self.sweep()
+            except Exception as error:
+                print("Retention sweep failed: ", error)
+            time.sleep(self.interval)
+
+    def claim(self):
+        """
+        Take the sweep lease, if no other process holds it.
+
+        Parameters:
+            self (RetentionSweeper): The object itself
+
+        Returns:
+            Bool: If this process holds the lease until the next sweep
+        """
+        now = time.time()
+        try:
+            Database("workflow-engine", "engineLocks").collection.update_one(
+                {"_id": "retention", "$or": [{"owner": self.owner}, {"expires": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires": now + self.interval}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    def sweep(self, dry_run=False):
+        """
+        Archive and remove the executions of every collection past their retention.
+
+        Parameters:
+            self (RetentionSweeper): The object itself
+            dry_run (Bool): Only count the executions that would be archived
+
+        Returns:
+            Dict: The number of executions archived, or that would be, from each collection
+        """
+        now = time.time()
+        swept = {}
+        for collection in collections:
+            swept[collection] = 0
+            for rule, query in retention_queries(self.rules, collection, now):
+                swept[collection] = swept[collection] + self.sweep_query(collection, query, dry_run)
+        return swept
+
+    def sweep_query(self, collection, query, dry_run=False):
+        """
+        Archive and remove the executions matching a retention query, a batch at a time in _id order. Each batch
+        continues after the last _id of the previous one, so executions kept by the $nor of the query are not scanned
+        again. A batch is only removed once its archive file is written.
+
+        Parameters:
+            self (RetentionSweeper): The object itself
+            collection (Str): workflowExecution or runnerExecution
+            query (Dict): The query from retention_queries
+            dry_run (Bool): Only count the executions that would be archived
+
+        Returns:
+            Int: The number of executions archived
+        """
+        executions = Database("workflow-engine", collection).collection
+        if dry_run:
+            return executions.count_documents(query)
+
+        archived = 0
+        id_range = dict(query["_id"])
+        while True:
+            documents = list(executions.find(dict(query, _id=id_range)).sort("_id", ASCENDING).limit(self.batch_size))
+            if not documents:
+                return archived
+            ids = [document["_id"] for document in documents]
+            if collection == "runnerExecution":
+                self.attach_output(documents)
+            write_archive(archive_path(self.archive_dir, collection, documents), documents)
+            executions.delete_many({"_id": {"$in": ids}})
+            if collection == "runnerExecution":
+                execution_ids = [str(execution_id) for execution_id in ids]
+                Database("workflow-engine", "runnerOutput").collection.delete_many({"execution_id": {"$in": execution_ids}})
+                Database("workflow-engine", "actionResultCache").collection.delete_many({"execution_id": {"$in": execution_ids}})
+            metrics.executions_archived_total.labels(collection).inc(len(documents))
+            archived = archived + len(documents)
+            id_range["$gt"] = ids[-1]
+
+    def attach_output(self, documents):
+        """
+        Add the output stored in the runnerOutput chunks of each execution to it as full_output, so the archive holds
+        the whole output and the chunks can be removed with the execution.
+
+        Parameters:
+            self (RetentionSweeper): The object itself
+            documents (List): The runnerExecution documents of a batch
+
+        Returns:
+            none
+        """
+        chunked = {str(document["_id"]): document for document in documents if document.get("output_chunks")}
+        if not chunked:
+            return
+        outputs = {}
+        for chunk in Database("workflow-engine", "runnerOutput").collection.find(
+                {"execution_id": {"$in": list(chunked)}}, projection={"_id": 0, "execution_id": 1, "seq": 1, "data": 1}
+            ).sort([("execution_id", ASCENDING), ("seq", ASCENDING)]):
+            outputs.setdefault(chunk["execution_id"], []).append(chunk["data"])
+        for execution_id, chunks in outputs.items():
+            chunked[execution_id]["full_output"] = "".join(chunks)
+
+def parse_date(value):
+    """
+    Parse a date or date and time given on the command line, as UTC.
+    """
+    return datetime.datetime.fromisoformat(value).replace(tzinfo=datetime.timezone.utc)
+
+def main():
+    from modules import config
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conf-home", default=Database.conf_home)
+    commands = parser.add_subparsers(dest="command", required=True)
+    sweep = commands.add_parser("sweep", help="Archive and remove the executions past their retention")
+    sweep.add_argument("--dry-run", action="store_true", help="Only count the executions that would be archived")
+    query = commands.add_parser("query", help="Print the archived executions that match, one JSON document per line")
+    query.add_argument("collection", choices=list(collections))
+    query.add_argument("--namespace")
+    query.add_argument("--status")
+    query.add_argument("--since", type=parse_date)
+    query.add_argument("--until", type=parse_date)
+    query.add_argument("--limit", type=int, default=0)
+    args = parser.parse_args()
+
+    Database.conf_home = args.conf_home
+    config.conf_home = args.conf_home
+    engine_config = config.get_engine_config()
+    if args.command == "sweep":
+        sweeper = RetentionSweeper(engine_config["retention_rules"], engine_config["retention_archive_dir"], engine_config["retention_interval"], engine_config["retention_batch_size"])
+        if not args.dry_run and not sweeper.claim():
+            sys.exit("An engine is sweeping, try again once it is done")
+        print(json.dumps(sweeper.sweep(args.dry_run)))
+    else:
+        documents = read_archive(engine_config["retention_archive_dir"], args.collection, args.namespace, args.status, args.since, args.until)
+        for count, document in enumerate(documents, 1):
+            sys.stdout.write(json.dumps(document) + "\n")
+            if count == args.limit:
+                break
+
+if __name__ == "__main__":
+    main()
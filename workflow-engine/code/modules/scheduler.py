@@ -0,0 +1,217 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+class WorkflowDefinitionError(Exception):
+    pass
+
+def as_list(value):
+    """
+    A function to treat a step reference that can be a single step name or a list of step names as a list.
+
+    Parameters:
+        value (Str or List): The step reference
+
+    Returns:
+        List: The step names
+    """
+    if value is None:
+        return []
+    elif isinstance(value, list):
+        return value
+    else:
+        return [value]
+
+def is_positive_int(value):
+    """
+    A function to check a setting of a definition is a positive integer, booleans are not counted as integers.
+
+    Parameters:
+        value (Object): The value of the setting
+
+    Returns:
+        Bool: True if the value is a positive integer
+    """
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+class WorkflowGraph:
+    """
+    The steps of a workflow definition as a directed acyclic graph. Steps are linked two ways, and both can be mixed:
+        on_success (Str or List): The step or steps that run after this step succeeds, a list fans out to steps that run in parallel
+        depends_on (List): The steps that must all succeed before this step runs, this is how parallel steps are joined
+    The entrypoint can also be a list to start several steps at once. Only the steps reachable from the entrypoint are run.
+    A step with the type "map" runs its action once for each element of its items list, see runner.execute_map_step.
+
+    Attributes:
+        steps (Dict): Maps each step name to its definition
+        entrypoints (List): The names of the steps the workflow starts with
+        dependencies (Dict): Maps each step that will run to the set of steps that must finish before it
+    """
+
+    def __init__(self, definition) -> None:
+        """
+        The constructor for the WorkflowGraph class. The graph is validated here, so a bad definition is rejected when it is loaded.
+
+        Parameters:
+            self (WorkflowGraph): The object itself
+            definition (Dict): The workflow definition
+
+        Raises:
+            WorkflowDefinitionError: If max_concurrency is not a positive integer, a step references a step that does not exist, a map step has no items list or a max_parallel that is not a positive integer, or the steps have a cycle
+        """
+        self.steps = definition['workflow']
+        self.entrypoints = as_list(definition['entrypoint'])
+
+        if not is_positive_int(definition.get('max_concurrency', 1)):
+            raise WorkflowDefinitionError("max_concurrency must be a positive integer")
+
+        successors = {name: set() for name in self.steps}
+        dependencies = {name: set() for name in self.steps}
+        for name, step in self.steps.items():
+            if step.get('type') == "map" and not isinstance(step.get('items'), list):
+                raise WorkflowDefinitionError(f"Map step {name} must have a list of items")
+            if step.get('type') == "map" and not is_positive_int(step.get('max_parallel', 1)):
+                raise WorkflowDefinitionError(f"Map step {name} must have a positive integer max_parallel")
+            for next_step in as_list(step.get('on_success')):
+                if next_step == "complete_workflow":
+                    continue
+                self.check_step(name, next_step)
+                successors[name].add(next_step)
+                dependencies[next_step].add(name)
+            for dependency in as_list(step.get('depends_on')):
+                self.check_step(name, dependency)
+                successors[dependency].add(name)
+                dependencies[name].add(dependency)
+
+        for entrypoint in self.entrypoints:
+            self.check_step("entrypoint", entrypoint)
+
+        reachable = set()
+        to_visit = list(self.entrypoints)
+        while to_visit:
+            name = to_visit.pop()
+            if name not in reachable:
+                reachable.add(name)
+                to_visit.extend(successors[name])
+
+        self.dependencies = {name: dependencies[name] & reachable for name in self.steps if name in reachable}
+        self.check_cycles()
+
+    def check_step(self, referenced_by, name):
+        """
+        Check a referenced step exists.
+
+        Parameters:
+            self (WorkflowGraph): The object itself
+            referenced_by (Str): The step that references it, used in the error message
+            name (Str): The name of the referenced step
+
+        Raises:
+            WorkflowDefinitionError: If the step does not exist
+        """
+        if name not in self.steps:
+            raise WorkflowDefinitionError(f"Step {referenced_by} references step {name}, which does not exist")
+
+    def check_cycles(self):
+        """
+        Check the steps that will run have no cycle, by sorting them topologically.
+
+        Parameters:
+            self (WorkflowGraph): The object itself
+
+        Raises:
+            WorkflowDefinitionError: If the steps have a cycle
+        """
+        remaining = {name: set(dependencies) for name, dependencies in self.dependencies.items()}
+        ready = [name for name, dependencies in remaining.items() if not dependencies]
+        while ready:
+            name = ready.pop()
+            del remaining[name]
+            for other, dependencies in remaining.items():
+                if name in dependencies:
+                    dependencies.discard(name)
+                    if not dependencies:
+                        ready.append(other)
+
+        if remaining:
+            raise WorkflowDefinitionError(f"Workflow steps have a cycle between: {', '.join(sorted(remaining))}")
+
+    def ready_steps(self, completed, started):
+        """
+        Get the steps that can start now.
+
+        Parameters:
+            self (WorkflowGraph): The object itself
+            completed (Set): The names of the steps that finished successfully
+            started (Set): The names of the steps that have been started
+
+        Returns:
+            List: The names of the steps that have not started and whose dependencies have all completed
+        """
+        return [name for name, dependencies in self.dependencies.items() if name not in started and dependencies <= completed]
+
+def run_graph(graph, execute_step, max_concurrency, completed_results=None):
+    """
+    A function to run the steps of a workflow graph. Every step whose dependencies have completed is started at once,
+    up to max_concurrency steps at a time. If a step fails no new steps are started, the steps already running are
+    waited for and the error of the failed step is raised.
+
+    Parameters:
+        graph (WorkflowGraph): The steps to run
+        execute_step (Callable): Called with the step name and step definition, returns the result to record for the step
+        max_concurrency (Int): The maximum number of steps running at once
+        completed_results (Dict): Optional, the results of steps that already completed, which are not run again
+
+    Returns:
+        Dict: Maps each step name to the result execute_step returned for it
+    """
+    results = {name: result for name, result in (completed_results or {}).items() if name in graph.dependencies}
+    completed = set(results)
+    started = set(results)
+    running = {}
+    failure = None
+
+    pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="workflow-step")
+    try:
+        while True:
+            if failure is None:
+                for name in graph.ready_steps(completed, started):
+                    started.add(name)
+                    running[pool.submit(execute_step, name, graph.steps[name])] = name
+
+            if not running:
+                break
+
+            done, not_done = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                    completed.add(name)
+                except Exception as error:
+                    if failure is None:
+                        failure = error
+                        for queued in not_done:
+                            if queued.cancel():
+                                running.pop(queued)
+    finally:
+        pool.shutdown(wait=False)
+
+    if failure is not None:
+        raise failure
+
+    return results
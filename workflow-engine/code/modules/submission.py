@@ -0,0 +1,108 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+import threading
+import time
+
+class SubmissionBatcher:
+    """
+    Coalesces the submissions of actions launched together, such as the runs of a map step admitted at once, into
+    one call of submit_executions, which creates their runners concurrently. The first submission to arrive collects
+    the ones that arrive after it, for up to max_delay seconds or until it has max_batch, and submits them all, the
+    others wait for it to hand back their execution ids. If the call fails, every submission of the batch fails.
+
+    Attributes:
+        submit_executions (Function): Submits a list of actions and returns their execution ids, in the same order
+        max_batch (Int): The number of submissions a batch is submitted at without waiting out max_delay
+        max_delay (Float): The longest the first submission of a batch waits for the batch to fill, in seconds
+        condition (Condition): Guards the pending submissions, and wakes them when their batch is submitted
+        pending (List): The submissions collected for the next batch
+        collecting (Bool): If a submission is collecting the next batch
+    """
+
+    def __init__(self, submit_executions, max_batch, max_delay=0.02) -> None:
+        """
+        The constructor for the SubmissionBatcher class.
+
+        Parameters:
+            self (SubmissionBatcher): The object itself
+            submit_executions (Function): Submits a list of (action_namespace, action_name, version, parameters) tuples with a list of requested execution ids
+            max_batch (Int): The number of submissions a batch is submitted at without waiting out max_delay
+            max_delay (Float): The longest the first submission of a batch waits for the batch to fill, in seconds
+        """
+        self.submit_executions = submit_executions
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay
+        self.condition = threading.Condition()
+        self.pending = []
+        self.collecting = False
+
+    def submit(self, action, execution_id=None):
+        """
+        Submit an action with the batch it arrives in.
+
+        Parameters:
+            self (SubmissionBatcher): The object itself
+            action (Tuple): The (action_namespace, action_name, version, parameters) of the action
+            execution_id (Str): Optional, the execution id to submit the action as
+
+        Returns:
+            Str: The execution id of the action
+        """
+        entry = {"action": action, "execution_id": execution_id, "done": False, "error": None}
+        with self.condition:
+            self.pending.append(entry)
+            if self.collecting:
+                if len(self.pending) >= self.max_batch:
+                    self.condition.notify_all()
+                while not entry["done"]:
+                    self.condition.wait()
+                return self.result(entry)
+
+            self.collecting = True
+            deadline = time.monotonic() + self.max_delay
+            while len(self.pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            batch = self.pending
+            self.pending = []
+            self.collecting = False
+
+        error = None
+        try:
+            execution_ids = self.submit_executions([pending["action"] for pending in batch], [pending["execution_id"] for pending in batch])
+        except Exception as submit_error:
+            error = submit_error
+
+        with self.condition:
+            for index, pending in enumerate(batch):
+                if error is None:
+                    pending["execution_id"] = execution_ids[index]
+                else:
+                    pending["error"] = error
+                pending["done"] = True
+            self.condition.notify_all()
+
+        return self.result(entry)
+
+    def result(self, entry):
+        """
+        Return the execution id of a submitted entry, or raise the error its batch failed with.
+        """
+        if entry["error"] is not None:
+            raise entry["error"]
+        return entry["execution_id"]
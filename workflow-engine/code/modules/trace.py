@@ -0,0 +1,234 @@
+#     Llamaflow - A self service portal with runbook automation
+#     Copyright (C) 2024  Whitestar Research LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#      Unless required by applicable law or agreed to in writing, software
+#      distributed under the License is distributed on an "AS IS" BASIS,
+#      WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#      See the License for the specific language governing permissions and
+#      limitations under the License.
+
+
+import hashlib
+import json
+import os
+import requests
+
+def build_trace(graph, action_executions, runner_executions, start, end, cache_hits=None):
+    """
+    A function to build the trace of a finished or failed workflow execution, the timeline of its steps and its critical path.
+    Each step is timed from the runner executions it ran:
+        submitted: When the first action of the step was submitted
+        started: When the first runner of the step started, or was claimed from a runner pool
+        finished: When the last runner of the step posted its result
+        ready: When the steps it depends on had all finished, or the workflow started
+        engine_delay: Time from ready to submitted, spent in the engine
+        queue_delay: Time from submitted to started, spent scheduling the job or waiting for a pooled runner
+        run_time: Time from started to finished
+    An action served from the result cache ran for another workflow execution, its runner times are not this workflow's.
+    It is timed as submitted, started and finished at the cache hit, so it takes no time.
+    The critical path is the chain of steps, each the last dependency of the next to finish, that ends with the last step to finish.
+
+    Parameters:
+        graph (WorkflowGraph): The steps of the workflow
+        action_executions (Dict): Maps each step name to its execution id, or list of execution ids for a map step
+        runner_executions (Dict): Maps each execution id to its runnerExecution document
+        start (Float): When the workflow execution started, as a unix timestamp
+        end (Float): When the workflow execution finished, as a unix timestamp
+        cache_hits (Dict): Optional, maps each step name to the time of the cache hit of each item index, as a string, served from the result cache
+
+    Returns:
+        Dict: The trace
+    """
+    steps = {}
+    for step_name, execution_ids in action_executions.items():
+        if not isinstance(execution_ids, list):
+            execution_ids = [execution_ids]
+        hits = (cache_hits or {}).get(step_name, {})
+        times = []
+        for index, execution_id in enumerate(execution_ids):
+            if str(index) in hits:
+                times.append((hits[str(index)], hits[str(index)], hits[str(index)]))
+            elif execution_id in runner_executions:
+                execution = runner_executions[execution_id]
+                times.append((execution.get("submitted_time"), execution.get("start_time", execution.get("claimed_time")), execution.get("finished_time")))
+
+        submitted = min_time(submitted for submitted, started, finished in times)
+        started = min_time(started for submitted, started, finished in times)
+        finished = max_time(finished for submitted, started, finished in times)
+        steps[step_name] = {
+            "executions": execution_ids,
+            "cached": [execution_ids[int(index)] for index in sorted(hits, key=int) if int(index) < len(execution_ids)],
+            "submitted": submitted,
+            "started": started,
+            "finished": finished,
+        }
+
+    for step_name, step in steps.items():
+        ready = max_time(steps[dependency]["finished"] for dependency in graph.dependencies.get(step_name, []) if dependency in steps)
+        step["ready"] = ready if ready is not None else start
+        step["engine_delay"] = difference(step["submitted"], step["ready"])
+        step["queue_delay"] = difference(step["started"], step["submitted"])
+        step["run_time"] = difference(step["finished"], step["started"])
+
+    return {
+        "start": start,
+        "end": end,
+        "duration": end - start,
+        "steps": steps,
+        "critical_path": critical_path(graph, steps),
+    }
+
+def critical_path(graph, steps):
+    """
+    A function to find the critical path of a workflow execution, walking back from the last step to finish through
+    the dependency of each step that finished last.
+
+    Parameters:
+        graph (WorkflowGraph): The steps of the workflow
+        steps (Dict): The timed steps of the trace
+
+    Returns:
+        List: The step names on the critical path, in the order they ran
+    """
+    finished = {name: step["finished"] for name, step in steps.items() if step["finished"] is not None}
+    if not finished:
+        return []
+
+    path = [max(finished, key=finished.get)]
+    while True:
+        dependencies = [dependency for dependency in graph.dependencies.get(path[-1], []) if dependency in finished]
+        if not dependencies:
+            break
+        path.append(max(dependencies, key=finished.get))
+
+    path.reverse()
+    return path
+
+def min_time(times):
+    times = [value for value in times if value is not None]
+    return min(times) if times else None
+
+def max_time(times):
+    times = [value for value in times if value is not None]
+    return max(times) if times else None
+
+def difference(later, earlier):
+    if later is None or earlier is None:
+        return None
+    return later - earlier
+
+def to_otlp(execution_id, execution, trace, runner_executions):
+    """
+    A function to convert a trace to OpenTelemetry spans, in the OTLP/JSON format. The workflow execution is the root
+    span, each step is a child span of it, and each runner execution is a child span of its step.
+
+    Parameters:
+        execution_id (Str): The workflow execution id, used as the trace id
+        execution (Dict): The workflow execution, used for the workflow attributes
+        trace (Dict): The trace built by build_trace
+        runner_executions (Dict): Maps each execution id to its runnerExecution document
+
+    Returns:
+        Dict: An OTLP/JSON ExportTraceServiceRequest
+    """
+    trace_id = execution_id.rjust(32, "0")
+    root_span_id = execution_id[-16:]
+
+    def attribute(key, value):
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    def nanoseconds(timestamp):
+        return str(int(timestamp * 1e9))
+
+    spans = [{
+        "traceId": trace_id,
+        "spanId": root_span_id,
+        "name": f"{execution['workflow_namespace']}/{execution['workflow_name']}",
+        "kind": 1,
+        "startTimeUnixNano": nanoseconds(trace["start"]),
+        "endTimeUnixNano": nanoseconds(trace["end"]),
+        "attributes": [
+            attribute("llamaflow.workflow.namespace", execution['workflow_namespace']),
+            attribute("llamaflow.workflow.name", execution['workflow_name']),
+            attribute("llamaflow.workflow.version", execution['version']),
+        ],
+    }]
+
+    for step_name, step in trace["steps"].items():
+        if step["submitted"] is None or step["finished"] is None:
+            continue
+        step_span_id = hashlib.sha256(f"{execution_id}/{step_name}".encode()).hexdigest()[:16]
+        spans.append({
+            "traceId": trace_id,
+            "spanId": step_span_id,
+            "parentSpanId": root_span_id,
+            "name": step_name,
+            "kind": 1,
+            "startTimeUnixNano": nanoseconds(step["ready"]),
+            "endTimeUnixNano": nanoseconds(step["finished"]),
+            "attributes": [
+                attribute("llamaflow.step.engine_delay", step["engine_delay"]),
+                attribute("llamaflow.step.queue_delay", step["queue_delay"]),
+                attribute("llamaflow.step.run_time", step["run_time"]),
+                attribute("llamaflow.step.critical", step_name in trace["critical_path"]),
+                attribute("llamaflow.step.cached", len(step.get("cached", []))),
+            ],
+        })
+        for runner_execution_id in step["executions"]:
+            if runner_execution_id in step.get("cached", []):
+                continue
+            runner_execution = runner_executions.get(runner_execution_id, {})
+            if runner_execution.get("submitted_time") is None or runner_execution.get("finished_time") is None:
+                continue
+            started = runner_execution.get("start_time", runner_execution.get("claimed_time"))
+            spans.append({
+                "traceId": trace_id,
+                "spanId": runner_execution_id[-16:],
+                "parentSpanId": step_span_id,
+                "name": f"{step_name} {runner_execution_id}",
+                "kind": 3,
+                "startTimeUnixNano": nanoseconds(runner_execution["submitted_time"]),
+                "endTimeUnixNano": nanoseconds(runner_execution["finished_time"]),
+                "attributes": [
+                    attribute("llamaflow.execution_id", runner_execution_id),
+                    attribute("llamaflow.execution.queue_delay", difference(started, runner_execution["submitted_time"])),
+                ],
+            })
+
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [attribute("service.name", "llamaflow-workflow-engine")]},
+            "scopeSpans": [{"scope": {"name": "llamaflow"}, "spans": spans}],
+        }]
+    }
+
+def export_trace(otlp, export_file=None, export_url=None):
+    """
+    A function to export OpenTelemetry spans to a file, a collector, or both. Export errors are printed and otherwise ignored,
+    a trace is not worth failing a workflow over.
+
+    Parameters:
+        otlp (Dict): The spans in the OTLP/JSON format
+        export_file (Str): Optional, a file to append the spans to, one JSON document per line
+        export_url (Str): Optional, the OTLP/HTTP traces endpoint of a collector, such as http://localhost:4318/v1/traces
+
+    Returns:
+        none
+    """
+    if export_file:
+        try:
+            with open(export_file, "a") as file:
+                file.write(json.dumps(otlp) + os.linesep)
+        except OSError as error:
+            print("Failed to export the trace to " + export_file + ": ", error)
+    if export_url:
+        try:
+            requests.post(export_url, json=otlp, timeout=5)
+        except requests.RequestException as error:
+            print("Failed to export the trace to " + export_url + ": ", error)
@@ -16,13 +16,29 @@
 
 import time
 from modules.database import Database
-from flask import abort, request
+from modules.notifier import notifier, start_change_stream_watcher
+from modules.executor import WorkflowExecutor
+from modules.config import get_engine_config
+from modules.definitions import DefinitionCache, DefinitionWatcher
+from modules.scheduler import WorkflowGraph, WorkflowDefinitionError, run_graph
+from modules.trace import build_trace, to_otlp, export_trace
+from modules.output import OutputStore
+from modules.checkpoint import WorkflowCheckpoint, LeaseLostError
+from modules.result_cache import ActionResultCache
+from modules.admission import AdmissionController
+from modules.submission import SubmissionBatcher
+from modules.retention import RetentionSweeper
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from flask import abort, request, Response
 import re
-from kubernetes import client, config, utils
+from modules.kube import JobSubmitter
+from modules.pool import RunnerPoolQueue, LocalRunnerPool
+from modules.backends import KubernetesBackend, LocalBackend, get_runner_args
+from modules import metrics
 import yaml
-from urllib.parse import urlparse
 from bson.objectid import ObjectId
-from time import sleep
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
 class RunnerExecutionError(Exception):
     pass
@@ -30,6 +46,14 @@ class RunnerExecutionError(Exception):
 class RunnerTimeoutError(Exception):
     pass
 
+class DefinitionNotFound(Exception):
+    pass
+
+engine_config = get_engine_config()
+workflow_definitions = DefinitionCache(engine_config["definition_cache_size"])
+action_definitions = DefinitionCache(engine_config["definition_cache_size"])
+result_metrics_projection = {"action_namespace": 1, "action_name": 1, "version": 1, "submitted_time": 1, "claimed_time": 1}
+
 def get_workflow_definition(workflow_namespace,workflow_name,version):
     """
     A function to get the definitin of an workflow from the database
@@ -47,17 +71,24 @@ def get_workflow_definition(workflow_namespace,workflow_name,version):
             "workflow": Dict,
             "parameter_schema": None, to be used later
     """
-    db_connection = Database("workflow-engine", "workflowDefinition")
-    query = {"$and": [
-        {"namespace":workflow_namespace},
-        {"workflow_name":workflow_name},
-        {"version":version}
-    ]}
-    result = db_connection.find_one_by_query(query)
+    def load():
+        db_connection = Database("workflow-engine", "workflowDefinition")
+        query = {"$and": [
+            {"namespace":workflow_namespace},
+            {"workflow_name":workflow_name},
+            {"version":version}
+        ]}
+        definition = db_connection.find_one_by_query(query)
+        if definition:
+            WorkflowGraph(definition)
+        return definition
+
+    with metrics.definition_lookup_seconds.labels("workflow", workflow_namespace, workflow_name, str(version)).time():
+        result = workflow_definitions.get((workflow_namespace, workflow_name, version), load)
     if result:
         return result
     else:
-        raise(f"Workflow in namespace: {workflow_namespace}, with name {workflow_name}, and version {version} not found")
+        raise DefinitionNotFound(f"Workflow in namespace: {workflow_namespace}, with name {workflow_name}, and version {version} not found")
 
 def get_workflow_execution(execution_id):
     """
@@ -91,46 +122,378 @@ def get_workflow_execution(execution_id):
         raise(f"Workflow execution {execution_id} not found", execution_id)
 
 
-def execute_workflow(execution_id):
+def new_workflow_execution(submission, queued_time):
+    """
+    A function to build the record of a submitted workflow execution. The workflow definition is checked to exist,
+    which is a cache hit for all but the first submission of a workflow.
+
+    Parameters:
+        submission (Dict): The workflow_namespace, workflow_name and version of the workflow, and optionally its parameters, priority and an idempotency_key
+        queued_time (Float): The unix timestamp the execution is queued at
+
+    Returns:
+        Dict: The workflow execution record, queued for the workflow executor
+    """
+    get_workflow_definition(submission['workflow_namespace'], submission['workflow_name'], submission['version'])
+
+    execution = {
+        "workflow_namespace": submission['workflow_namespace'],
+        "workflow_name": submission['workflow_name'],
+        "version": submission['version'],
+        "parameters": submission.get('parameters'),
+        "priority": submission.get('priority', 0),
+        "status": "queued",
+        "queued_time": queued_time
+    }
+    if submission.get('idempotency_key'):
+        execution['idempotency_key'] = submission['idempotency_key']
+    return execution
+
+def submit_workflow(submission):
+    """
+    A function to create a workflow execution and queue it to be run by the workflow executor, in one insert.
+    A submission with the idempotency_key of an earlier submission does not create a new execution, the execution
+    of the earlier submission is returned instead, so a client can safely retry a submission.
+
+    Parameters:
+        submission (Dict): The workflow_namespace, workflow_name and version of the workflow, and optionally its parameters and an idempotency_key
+
+    Returns:
+        Dict: A dict with the execution id of the workflow execution
+        Int: The HTTP status code, 201 if the execution was created or 200 if it was created by an earlier submission
+    """
+    try:
+        execution = new_workflow_execution(submission, time.time())
+    except DefinitionNotFound as error:
+        abort(404, str(error))
+
+    db_connection = Database("workflow-engine", "workflowExecution")
+    try:
+        execution_id = db_connection.insert_document(execution)
+    except DuplicateKeyError:
+        existing = db_connection.collection.find_one({"idempotency_key": submission['idempotency_key']}, projection={"_id": 1})
+        return {"execution_id": str(existing['_id'])}, 200
+
+    workflow_executor.wake()
+
+    return {"execution_id": execution_id}, 201
+
+def submit_workflows(submissions):
+    """
+    A function to create and queue many workflow executions with one unordered insert. Submissions are handled the
+    same as by submit_workflow, and a submission that fails does not stop the others.
+
+    Parameters:
+        submissions (List): The submissions, each with the workflow_namespace, workflow_name and version of the workflow, and optionally its parameters and an idempotency_key
+
+    Returns:
+        Dict: The result of each submission in order, either its execution_id and if it was created, or its error, and the number of executions created
+    """
+    queued_time = time.time()
+    results = [None] * len(submissions)
+    executions = []
+    positions = []
+    for position, submission in enumerate(submissions):
+        try:
+            executions.append(new_workflow_execution(submission, queued_time))
+            positions.append(position)
+        except DefinitionNotFound as error:
+            results[position] = {"error": str(error)}
+
+    db_connection = Database("workflow-engine", "workflowExecution")
+    failed = {}
+    if executions:
+        try:
+            db_connection.collection.insert_many(executions, ordered=False)
+        except BulkWriteError as error:
+            failed = {write_error["index"]: write_error for write_error in error.details["writeErrors"]}
+
+    duplicate_keys = [executions[index]['idempotency_key'] for index, write_error in failed.items() if write_error["code"] == 11000]
+    existing = {}
+    if duplicate_keys:
+        for execution in db_connection.collection.find({"idempotency_key": {"$in": duplicate_keys}}, projection={"idempotency_key": 1}):
+            existing[execution['idempotency_key']] = str(execution['_id'])
+
+    created = 0
+    for index, execution in enumerate(executions):
+        position = positions[index]
+        if index not in failed:
+            results[position] = {"execution_id": str(execution['_id']), "created": True}
+            created += 1
+        elif execution.get('idempotency_key') in existing:
+            results[position] = {"execution_id": existing[execution['idempotency_key']], "created": False}
+        else:
+            results[position] = {"error": failed[index]["errmsg"]}
+
+    if created:
+        workflow_executor.wake()
+
+    return {"executions": results, "created": created}
+
+def enqueue_workflow(execution_id):
     """
-    A function to execute a workflow
+    A function to queue a workflow execution to be run by the workflow executor. It returns as soon as the
+    execution is queued, the workflow itself runs in the background. A workflow execution that finished or failed
+    runs again from the start, its checkpointed steps, lease, error and trace from the earlier run are removed.
 
     Parameters:
         execution_id (string): A 24 character hexadecimal string with lowercase letters.
 
     Returns:
-        none
+        Dict: A dict with the execution id of the queued workflow execution
+        Int: The HTTP status code
     """
     if not re.match('^[0-9a-f]{24}$',execution_id):
         abort(406, "Execution id must be 24 chacters hexadecimal string with lowercase letters")
 
+    db_connection = Database("workflow-engine", "workflowExecution")
+
+    query = {"$and": [
+        {"_id": ObjectId(execution_id)},
+        {"status": {"$nin": ["queued", "running"]}}
+    ]}
+    result = db_connection.collection.update_one(query, {
+        '$set': {"status": "queued", "queued_time": time.time()},
+        '$unset': {"steps": "", "owner": "", "lease_expires": "", "recoveries": "", "error": "", "trace": ""}
+    })
+    if result.matched_count == 0:
+        if db_connection.find_by_id(execution_id):
+            abort(409, f"Workflow execution {execution_id} is already queued or running")
+        abort(404, f"Workflow execution {execution_id} not found")
+
+    workflow_executor.wake()
+
+    return {"execution_id": execution_id}, 202
+
+def run_workflow(execution_id):
+    """
+    A function used by the workflow executor to run a claimed workflow execution. If the workflow raises an error
+    the workflow execution is marked as failed, unless another engine took it over.
+
+    Parameters:
+        execution_id (string): A 24 character hexadecimal string with lowercase letters.
+
+    Returns:
+        none
+    """
     execution = get_workflow_execution(execution_id)
+    labels = metrics.workflow_label_values(execution["workflow_namespace"], execution["workflow_name"], execution["version"])
+    start = time.monotonic()
+    status = "failed"
+
+    try:
+        execute_workflow(execution_id, execution)
+        status = "success"
+    except LeaseLostError as error:
+        status = "lease_lost"
+        print(error)
+    except Exception as error:
+        try:
+            update_workflow_result(execution_id, {"status": "failed", "error": str(error)}, execution.get("owner"))
+        except LeaseLostError as lease_error:
+            status = "lease_lost"
+            print(lease_error)
+            return
+        raise
+    finally:
+        metrics.workflow_seconds.labels(status=status, **labels).observe(time.monotonic() - start)
+        metrics.workflows_total.labels(status=status, **labels).inc()
+
+def execute_workflow(execution_id, execution=None):
+    """
+    A function to execute a workflow. Steps run as soon as the steps they depend on have completed, so independent
+    steps run in parallel, up to the max_concurrency of the workflow definition.
+    Each step is checkpointed to the workflow execution. A workflow execution that was running when its engine
+    stopped skips the steps that succeeded, and re-attaches to the actions that were submitted instead of
+    submitting them again. The trace is recorded whether the workflow succeeds or fails.
+
+    Parameters:
+        execution_id (string): A 24 character hexadecimal string with lowercase letters.
+        execution (Dict): Optional, the workflow execution if the caller already read it
+
+    Returns:
+        none
+    """
+    if not re.match('^[0-9a-f]{24}$',execution_id):
+        abort(406, "Execution id must be 24 chacters hexadecimal string with lowercase letters")
+
+    if execution is None:
+        execution = get_workflow_execution(execution_id)
     definition = get_workflow_definition(execution["workflow_namespace"],execution["workflow_name"],execution["version"])
 
-    entrypoint = definition['entrypoint']
-    current_action = definition['workflow'][entrypoint]
-    step_name = entrypoint
-    workflow_complete = False
-    action_executions = {}
-
-    while not workflow_complete:
-        action_executions[step_name] = single_action_execute(current_action['action_namespace'], current_action['action_name'], current_action['version'], current_action['parameters'])
-         
-        if current_action['on_success'] != "complete_workflow":
-            next_step = current_action['on_success']
-            current_action = definition['workflow'][next_step]
-            step_name = next_step
-        else:
-            workflow_complete = True
+    graph = WorkflowGraph(definition)
+    max_concurrency = definition.get('max_concurrency', engine_config["workflow_max_concurrency"])
+    checkpoint = WorkflowCheckpoint(execution_id, execution.get("owner"), execution.get("steps"))
+
+    def run_step(step_name, step):
+        try:
+            step_result = execute_step(step_name, step, checkpoint, execution["workflow_namespace"], execution.get("priority", 0))
+        except LeaseLostError:
+            raise
+        except Exception as error:
+            checkpoint.step_failed(step_name, error)
+            raise
+        checkpoint.step_succeeded(step_name, step_result)
+        return step_result
+
+    start = time.time()
+    try:
+        action_executions = run_graph(graph, run_step, max_concurrency, checkpoint.completed())
+    except LeaseLostError:
+        raise
+    except Exception:
+        try:
+            map_steps = {name for name, step in graph.steps.items() if step.get('type') == "map"}
+            trace = trace_workflow(execution_id, execution, graph, checkpoint.action_executions(map_steps), start, time.time(), checkpoint.cache_hits())
+            update_workflow_result(execution_id, {"trace": trace}, execution.get("owner"))
+        except LeaseLostError:
+            raise
+        except Exception as error:
+            print("Failed to trace the failed workflow execution " + execution_id + ": ", error)
+        raise
+    trace = trace_workflow(execution_id, execution, graph, action_executions, start, time.time(), checkpoint.cache_hits())
 
     workflow_result = {
         "status": "success",
-        "action_executions": action_executions
+        "action_executions": action_executions,
+        "trace": trace
     }
 
-    update_workflow_result(execution_id, workflow_result)
+    update_workflow_result(execution_id, workflow_result, execution.get("owner"))
+
+def trace_workflow(execution_id, execution, graph, action_executions, start, end, cache_hits=None):
+    """
+    A function to build the trace of a finished or failed workflow execution from the timestamps of its runner
+    executions, and export it as OpenTelemetry spans if trace_export_file or trace_export_url is set in the engine config.
+
+    Parameters:
+        execution_id (string): A 24 character hexadecimal string with lowercase letters.
+        execution (Dict): The workflow execution
+        graph (WorkflowGraph): The steps of the workflow
+        action_executions (Dict): Maps each step name to its execution id, or list of execution ids for a map step
+        start (Float): When the workflow execution started, as a unix timestamp
+        end (Float): When the workflow execution finished, as a unix timestamp
+        cache_hits (Dict): Optional, the time of each action served from the result cache, from WorkflowCheckpoint.cache_hits
+
+    Returns:
+        Dict: The trace
+    """
+    execution_ids = []
+    for step_execution_ids in action_executions.values():
+        execution_ids.extend(step_execution_ids if isinstance(step_execution_ids, list) else [step_execution_ids])
+    execution_ids = [id for id in execution_ids if id]
+
+    db_connection = Database("workflow-engine", "runnerExecution")
+    runner_executions = {}
+    for runner_execution in db_connection.collection.find({"_id": {"$in": [ObjectId(id) for id in execution_ids]}},
+            projection={"submitted_time": 1, "claimed_time": 1, "start_time": 1, "finished_time": 1}):
+        runner_executions[str(runner_execution["_id"])] = runner_execution
+
+    trace = build_trace(graph, action_executions, runner_executions, start, end, cache_hits)
+
+    if engine_config["trace_export_file"] or engine_config["trace_export_url"]:
+        export_trace(to_otlp(execution_id, execution, trace, runner_executions), engine_config["trace_export_file"], engine_config["trace_export_url"])
+
+    return trace
+
+def get_workflow_trace(execution_id):
+    """
+    A function to get the trace of a finished workflow execution, the timeline of its steps with the time each spent
+    waiting in the engine, waiting to start and running, and its critical path.
+
+    Parameters:
+        execution_id (string): A 24 character hexadecimal string with lowercase letters.
+
+    Returns:
+        Dict: The trace
+    """
+    if not re.match('^[0-9a-f]{24}$',execution_id):
+        abort(406, "Execution id must be 24 chacters hexadecimal string with lowercase letters")
+
+    db_connection = Database("workflow-engine", "workflowExecution")
+    execution = db_connection.find_by_id(execution_id, projection={"trace": 1})
+
+    if not execution:
+        abort(404, "Workflow execution not found")
+    if "trace" not in execution:
+        abort(404, "Workflow execution has no trace, it has not finished")
+
+    return execution["trace"]
+
+def execute_step(step_name, step, checkpoint=None, workflow_namespace=None, priority=0):
+    """
+    A function to execute a single step of a workflow
+
+    Parameters:
+        step_name (Str): The name of the step
+        step (Dict): The definition of the step
+        checkpoint (WorkflowCheckpoint): Optional, the checkpoint of the workflow execution, that gives the execution ids of the actions
+        workflow_namespace (Str): Optional, the namespace of the workflow, that the actions are admitted under
+        priority (Int): The priority the actions are admitted with
+
+    Returns:
+        execution_id (Str): The execution id of the action the step ran
+        List: The execution ids of a map step, in the same order as its items
+    """
+    if step.get('type') == "map":
+        return execute_map_step(step_name, step, checkpoint, workflow_namespace, priority)
+
+    execution_id, attach = checkpoint.action_execution_id(step_name) if checkpoint else (None, False)
+    result_execution_id = single_action_execute(step['action_namespace'], step['action_name'], step['version'], step['parameters'], execution_id, attach, workflow_namespace, priority)
+    if checkpoint and result_execution_id != execution_id:
+        checkpoint.action_cached(step_name)
+    return result_execution_id
+
+def execute_map_step(step_name, step, checkpoint=None, workflow_namespace=None, priority=0):
+    """
+    A function to execute a map step, which runs its action once for each element of its items list.
+    Each element is used as the parameters of its run. If the step also has a parameters dict, each run gets a copy
+    of it with the element added under the item_parameter key, "item" by default.
+    At most max_parallel runs are in flight at once, and these are not counted in the max_concurrency of the workflow.
+    The runs admitted together are submitted together, with one call of submit_executions.
+    If a run fails the runs that have not started are cancelled and the step fails.
+
+    Parameters:
+        step_name (Str): The name of the step
+        step (Dict): The definition of the step
+        checkpoint (WorkflowCheckpoint): Optional, the checkpoint of the workflow execution, that gives the execution ids of the runs
+        workflow_namespace (Str): Optional, the namespace of the workflow, that the runs are admitted under
+        priority (Int): The priority the runs are admitted with
+
+    Returns:
+        List: The execution ids of the runs, in the same order as the items
+    """
+    max_parallel = step.get('max_parallel', engine_config["map_max_parallel"])
+    item_parameter = step.get('item_parameter', "item")
+    shared_parameters = step.get('parameters')
+
+    def run_item(index, item):
+        if isinstance(shared_parameters, dict):
+            parameters = dict(shared_parameters)
+            parameters[item_parameter] = item
+        else:
+            parameters = item
+        execution_id, attach = checkpoint.action_execution_id(step_name, index) if checkpoint else (None, False)
+        result_execution_id = single_action_execute(step['action_namespace'], step['action_name'], step['version'], parameters, execution_id, attach, workflow_namespace, priority, submitter)
+        if checkpoint and result_execution_id != execution_id:
+            checkpoint.action_cached(step_name, index)
+        return result_execution_id
+
+    submitter = SubmissionBatcher(submit_executions, min(max_parallel, len(step['items'])), engine_config["map_submit_batch_delay"])
+    pool = ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix=f"map-{step_name}")
+    try:
+        runs = [pool.submit(run_item, index, item) for index, item in enumerate(step['items'])]
+        done, not_done = wait(runs, return_when=FIRST_EXCEPTION)
+        for run in runs:
+            if run in done and run.exception() is not None:
+                for pending in not_done:
+                    pending.cancel()
+                raise run.exception()
+        return [run.result() for run in runs]
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
 
-def single_action_execute(action_namespace, action_name, version, parameters):
+def single_action_execute(action_namespace, action_name, version, parameters, execution_id=None, attach=False, workflow_namespace=None, priority=0, submitter=None):
     """
     A function to submit an action for execution
 
@@ -138,34 +501,87 @@ def single_action_execute(action_namespace, action_name, version, parameters):
     action_namespace (Str): The namespace the action resides in
     action_name (Str): The name of the action
     parameters (Object): Contans the parameters for the action. This will vary from action to action
+    execution_id (Str): Optional, the execution id to submit the action as
+    attach (Bool): If the action may have been submitted already as execution_id, in which case it is waited for instead of submitted again
+    workflow_namespace (Str): Optional, the namespace of the workflow the action runs in, by default the namespace of the action
+    priority (Int): The priority of the action, actions with a higher priority are admitted to launch first
+    submitter (SubmissionBatcher): Optional, submits the action in a batch with the other actions it was admitted with
+
+    The action is launched once the admission controller has a slot for it, and holds the slot until it finishes.
+    If the action definition is cacheable, a successful execution of the action with the same parameters is returned
+    instead of running the action again, until it expires after the cache_ttl of the definition.
     """
-    execution_id = submit_execution(action_namespace, action_name, version, parameters)
-    wait_for_execution_completion(execution_id)
+    start = time.monotonic()
+    execution_status = "failed"
+    labels = metrics.action_label_values(action_namespace, action_name, version)
+
+    try:
+        action_definition = get_action_definition(action_namespace, action_name, version)
+        cache_key = None
+        if action_definition.get('cacheable') and not attach:
+            cache_key = action_result_cache.key(action_namespace, action_name, version, parameters)
+            cached_execution_id = action_result_cache.get(cache_key)
+            metrics.action_cache_total.labels(result="hit" if cached_execution_id else "miss", **labels).inc()
+            if cached_execution_id:
+                execution_status = "cached"
+                return cached_execution_id
+
+        slot = admission_controller.acquire(workflow_namespace or action_namespace, action_namespace, action_name, priority)
+        try:
+            if not (attach and Database("workflow-engine", "runnerExecution").find_by_id(execution_id, {"_id": 1})):
+                if submitter:
+                    execution_id = submitter.submit((action_namespace, action_name, version, parameters), execution_id)
+                else:
+                    execution_id = submit_execution(action_namespace, action_name, version, parameters, execution_id)
+            wait_for_execution_completion(execution_id)
+        finally:
+            admission_controller.release(slot)
+        execution_status = "success"
+
+        if cache_key:
+            action_result_cache.put(cache_key, execution_id, action_definition.get('cache_ttl'))
+    finally:
+        metrics.step_seconds.labels(execution_status=execution_status, **labels).observe(time.monotonic() - start)
+
     return execution_id
 
-def wait_for_execution_completion(execution_id):
+def wait_for_execution_completion(execution_id, timeout=100):
     """
-    Function to wait for an execution to complete or fail
+    Function to wait for an execution to complete or fail. The wait is woken up as soon as the result is posted back,
+    either through the in-process notifier or the change stream watcher. Polling the database with a backoff is only
+    kept as a fallback in case a notification is missed.
 
     Paramters:
         execution_id (string): A 24 character hexadecimal string with lowercase letters.
+        timeout (Int): The number of seconds to wait before giving up on the execution
 
     Returns:
      none
     """
-    poll_time = 10
-    poll_count = 0 
+    poll_time = 0.5
+    max_poll_time = 10
+    deadline = time.monotonic() + timeout
 
-    while poll_count < 10: #TO-DO add some logic so this isn't hard coded
-        execution = get_execution(execution_id)
-        if execution["execution_status"] == "success":
-            return
-        elif execution["execution_status"] == "failed":
-            raise RunnerExecutionError("Runner execution failed")
-        sleep(poll_time)
-        poll_count = poll_count + 1
-        
-    raise RunnerTimeoutError("Running runtime exceeded")
+    start_change_stream_watcher(Database("workflow-engine", "runnerExecution").collection)
+    notifier.register(execution_id)
+    try:
+        execution_status = get_execution_status(execution_id)
+        while True:
+            if execution_status == "success":
+                return
+            elif execution_status == "failed":
+                raise RunnerExecutionError("Runner execution failed")
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RunnerTimeoutError("Running runtime exceeded")
+
+            execution_status = notifier.wait(execution_id, min(poll_time, remaining))
+            if execution_status is None:
+                execution_status = get_execution_status(execution_id)
+                poll_time = min(poll_time * 2, max_poll_time)
+    finally:
+        notifier.unregister(execution_id)
 
 
 def result(execution_id, runner_result):
@@ -185,25 +601,180 @@ def result(execution_id, runner_result):
     db_connection = Database("workflow-engine", "runnerExecution")
 
     runner_result['time'] = int(time.time())
+    runner_result['finished_time'] = time.time()
+    store_large_output(execution_id, runner_result)
 
     print(runner_result)
     print("The execution id is: " + execution_id)
 
 
     query = {"_id": ObjectId(execution_id)}
-    result = db_connection.collection.update_one(query, {'$set':runner_result})
-    print("Insert Result: ", result.upserted_id)
+    start = time.monotonic()
+    execution = db_connection.collection.find_one_and_update(query, {'$set':runner_result}, projection=result_metrics_projection)
+    print("Insert Result: ", execution is not None)
+
+    notifier.notify(execution_id, runner_result.get('execution_status'))
+
+    if execution:
+        record_result_metrics(execution, runner_result, time.monotonic() - start)
+
+def batch_result(runner_results):
+    """
+    A function to capture the results of many action executions at once, so runners that finish together can post
+    their results in one request. The results are written with one unordered bulk write, a result that fails to write
+    does not stop the others.
+
+    Parameters:
+        runner_results (list): The results, each a dictonary containg the execution_id and the result of the execution
+
+    Returns:
+        Dict: The number of executions matched, and the execution id and error of each result that failed to write
+    """
+    execution_ids = []
+    for runner_result in runner_results:
+        if not re.match('^[0-9a-f]{24}$',runner_result['execution_id']):
+            abort(406, "Execution id must be 24 chacters hexadecimal string with lowercase letters")
+        execution_ids.append(runner_result['execution_id'])
+
+    db_connection = Database("workflow-engine", "runnerExecution")
+
+    finished_time = time.time()
+    operations = []
+    for runner_result in runner_results:
+        runner_result['time'] = int(finished_time)
+        runner_result['finished_time'] = finished_time
+        store_large_output(runner_result['execution_id'], runner_result)
+        operations.append(UpdateOne({"_id": ObjectId(runner_result['execution_id'])}, {'$set': runner_result}))
+
+    start = time.monotonic()
+    errors = []
+    try:
+        matched = db_connection.collection.bulk_write(operations, ordered=False).matched_count
+    except BulkWriteError as error:
+        matched = error.details["nMatched"]
+        errors = [{"execution_id": execution_ids[write_error["index"]], "error": write_error["errmsg"]} for write_error in error.details["writeErrors"]]
+    write_seconds = time.monotonic() - start
+    print("Batch Result: ", len(runner_results), " results, ", matched, " matched")
+
+    failed = {error["execution_id"] for error in errors}
+    written = {}
+    for runner_result in runner_results:
+        if runner_result['execution_id'] not in failed:
+            notifier.notify(runner_result['execution_id'], runner_result.get('execution_status'))
+            written[runner_result['execution_id']] = runner_result
+
+    for execution in db_connection.collection.find({"_id": {"$in": [ObjectId(id) for id in written]}}, projection=result_metrics_projection):
+        record_result_metrics(execution, written[str(execution["_id"])], write_seconds)
+
+    return {"matched": matched, "errors": errors}
+
+def store_large_output(execution_id, runner_result):
+    """
+    A function to move a large execution_output out of a runner result before it is written, so the execution
+    document stays small. Output longer than output_inline_limit is appended to the output store, and only its tail
+    is kept in the execution document with output_truncated set.
+
+    Parameters:
+        execution_id (string): A 24 character hexadecimal string with lowercase letters.
+        runner_result (dict): A dictonary containg the result of the execution, changed in place
+
+    Returns:
+        none
+    """
+    execution_output = runner_result.get('execution_output')
+    inline_limit = engine_config["output_inline_limit"]
+    if not isinstance(execution_output, str) or len(execution_output) <= inline_limit:
+        return
+
+    output_store.append(execution_id, execution_output)
+    runner_result['execution_output'] = execution_output[-inline_limit:]
+    runner_result['output_truncated'] = True
+
+def append_output(execution_id, runner_output):
+    """
+    A function for a runner to append to the output of its execution while it runs. A runner that streams its output
+    can leave execution_output in its result empty.
+
+    Parameters:
+        execution_id (string): A 24 character hexadecimal string with lowercase letters.
+        runner_output (dict): A dictonary with the output to append
+
+    Returns:
+        Dict: The number of chunks and characters of output the execution has
+    """
+    if not re.match('^[0-9a-f]{24}$',execution_id):
+        abort(406, "Execution id must be 24 chacters hexadecimal string with lowercase letters")
+
+    appended = output_store.append(execution_id, runner_output['output'])
+    if appended is None:
+        abort(404, f"Execution {execution_id} not found")
+
+    return appended
+
+def get_output(execution_id, follow=False):
+    """
+    A function to get the output of an action execution. With follow, or when the client accepts text/event-stream,
+    the output is streamed as server sent events until the execution has finished. A client that reconnects with a
+    Last-Event-ID header resumes after the last chunk it got.
+
+    Parameters:
+        execution_id (string): A 24 character hexadecimal string with lowercase letters.
+        follow (Bool): Stream the output as it is appended
+
+    Returns:
+        Response: The output as text/plain, or the stream as text/event-stream
+    """
+    if not re.match('^[0-9a-f]{24}$',execution_id):
+        abort(406, "Execution id must be 24 chacters hexadecimal string with lowercase letters")
+
+    get_execution_status(execution_id)
+
+    if follow or request.accept_mimetypes.best == "text/event-stream":
+        try:
+            after = int(request.headers.get("Last-Event-ID", -1))
+        except ValueError:
+            abort(400, "Last-Event-ID must be the integer id of an event")
+        return Response(output_store.stream(execution_id, after), mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    return Response(output_store.read(execution_id), mimetype="text/plain")
+
+def record_result_metrics(execution, runner_result, write_seconds):
+    """
+    A function to record the metrics of a captured action result
+
+    Parameters:
+        execution (Dict): The runner execution, with the fields of result_metrics_projection
+        runner_result (Dict): The result of the execution
+        write_seconds (Float): How long the result took to write
 
-def update_workflow_result(execution_id, workflow_result):
+    Returns:
+        none
+    """
+    if "action_namespace" not in execution:
+        return
+
+    labels = metrics.action_label_values(execution["action_namespace"], execution["action_name"], execution["version"])
+    metrics.result_write_seconds.labels(**labels).observe(write_seconds)
+    metrics.actions_total.labels(execution_status=runner_result.get('execution_status'), **labels).inc()
+    started = runner_result.get("start_time", execution.get("claimed_time", execution.get("submitted_time")))
+    if started:
+        metrics.runner_run_seconds.labels(execution_status=runner_result.get('execution_status'), **labels).observe(time.time() - started)
+
+def update_workflow_result(execution_id, workflow_result, owner=None):
     """
     A function to capture the result of an workflow execution
 
     Parameters:
         execution_id (string): A 24 character hexadecimal string with lowercase letters.
         workflow_result (dict): A dictonary containg the result of the execution
+        owner (Str): Optional, the engine that holds the lease on the workflow execution. The result is only written if it still does
 
     Returns:
         none  
+
+    Raises:
+        LeaseLostError: If owner was given and another engine took over the workflow execution
     """
     if not re.match('^[0-9a-f]{24}$',execution_id):
         abort(406, "Execution id must be 24 chacters hexadecimal string with lowercase letters")
@@ -217,8 +788,12 @@ def update_workflow_result(execution_id, workflow_result):
 
 
     query = {"_id": ObjectId(execution_id)}
+    if owner:
+        query["owner"] = owner
     result = db_connection.collection.update_one(query, {'$set':workflow_result})
     print("Insert Workflow Result: ", result.upserted_id)
+    if owner and result.matched_count == 0:
+        raise LeaseLostError(f"Workflow execution {execution_id} is no longer owned by {owner}")
 
 
 def get_execution(execution_id):
@@ -233,7 +808,7 @@ def get_execution(execution_id):
     "standard_output": Str or None,
     "error_output": Str or None,
     "completion_time": Unix timestamp,
-    "execution_status": Str ("submitted", "success", "failed")
+    "execution_status": Str ("queued", "submitted", "success", "failed")
     "parameters": The parameters for the action, this will be a string or object, depending on the action
 
     Parameters:
@@ -255,6 +830,25 @@ def get_execution(execution_id):
 
     print(result)
 
+def get_execution_status(execution_id):
+    """
+    The function to get only the status of an action execution. It is used while waiting on an execution, so the
+    parameters and output of the execution are not read on every poll.
+
+    Parameters:
+        execution_id (string): A 24 character hexadecimal string with lowercase letters.
+
+    Returns:
+        Str: The execution status ("queued", "submitted", "success", "failed")
+    """
+    db_connection = Database("workflow-engine", "runnerExecution")
+
+    result = db_connection.find_by_id(execution_id, {"execution_status": 1})
+    if result:
+        return result["execution_status"]
+    else:
+        abort(404, f"Execution {execution_id} not found")
+
 def get_action_definition(action_namespace,action_name,version):
     """
     A function to get the definitin of an action from the database
@@ -274,19 +868,81 @@ def get_action_definition(action_namespace,action_name,version):
             "container_tag": String,
             "parameter_schema": None, to be used later
     """
-    db_connection = Database("workflow-engine", "actionDefinition")
-    query = {"$and": [
-        {"namespace":action_namespace},
-        {"action_name":action_name},
-        {"version":version}
-    ]}
-    result = db_connection.find_one_by_query(query)
+    def load():
+        db_connection = Database("workflow-engine", "actionDefinition")
+        query = {"$and": [
+            {"namespace":action_namespace},
+            {"action_name":action_name},
+            {"version":version}
+        ]}
+        return db_connection.find_one_by_query(query)
+
+    with metrics.definition_lookup_seconds.labels("action", action_namespace, action_name, str(version)).time():
+        result = action_definitions.get((action_namespace, action_name, version), load)
     if result:
         return result
     else:
-        raise(f"Action in namespace: {action_namespace}, with name {action_name}, and version {version} not found")
+        raise DefinitionNotFound(f"Action in namespace: {action_namespace}, with name {action_name}, and version {version} not found")
+
+def publish_workflow_definition(definition):
+    """
+    A function to publish a version of a workflow definition. The steps are checked for missing references and cycles
+    first. An existing definition with the same namespace, name and version is replaced, and the cached copy is dropped.
+
+    Parameters:
+        definition (Dict): The workflow definition, see get_workflow_definition for the schema
+
+    Returns:
+        Dict: The namespace, name and version of the published definition
+        Int: The HTTP status code
+    """
+    try:
+        WorkflowGraph(definition)
+    except WorkflowDefinitionError as error:
+        abort(400, str(error))
+
+    key = (definition['namespace'], definition['workflow_name'], definition['version'])
+    query = {"namespace": key[0], "workflow_name": key[1], "version": key[2]}
+
+    db_connection = Database("workflow-engine", "workflowDefinition")
+    db_connection.collection.replace_one(query, definition, upsert=True)
+    workflow_definitions.invalidate(key)
 
-def create_execution_record(action_namespace,action_name,version,parameters,job_id):
+    return query, 201
+
+def publish_action_definition(definition):
+    """
+    A function to publish a version of an action definition. An existing definition with the same namespace, name and
+    version is replaced, and the cached copy is dropped.
+
+    Parameters:
+        definition (Dict): The action definition, see get_action_definition for the schema
+
+    Returns:
+        Dict: The namespace, name and version of the published definition
+        Int: The HTTP status code
+    """
+    key = (definition['namespace'], definition['action_name'], definition['version'])
+    query = {"namespace": key[0], "action_name": key[1], "version": key[2]}
+
+    db_connection = Database("workflow-engine", "actionDefinition")
+    db_connection.collection.replace_one(query, definition, upsert=True)
+    action_definitions.invalidate(key)
+
+    return query, 201
+
+def prepare_definitions():
+    """
+    A function run at startup to start the watchers that clear the definition caches when definitions are changed
+    directly in the database.
+
+    Returns:
+        none
+    """
+    for collection, cache in [("workflowDefinition", workflow_definitions), ("actionDefinition", action_definitions)]:
+        DefinitionWatcher(Database("workflow-engine", collection).collection, cache).start()
+
+def create_execution_record(action_namespace,action_name,version,parameters,job_id,execution_status="submitted",runner_pool=None,execution_id=None):
     """
     A function to create the inital record in the database used for a action execution
 
@@ -296,7 +952,9 @@ def create_execution_record(action_namespace,action_name,version,parameters,job_
         version (Int): The version of the action
         parameters (Object): The parameters used to run the object
         job_id (Str): The name of the kubernetes job that will run the action
-        execution_status (Str): ("submitted", "success","failed")
+        execution_status (Str): ("queued", "submitted", "success","failed"), queued is used for pooled actions waiting for a runner
+        runner_pool (Str): Optional, the runner pool that should claim a pooled action
+        execution_id (Str): Optional, the execution id to create the record with
 
     Returns:
         execution_id (Str): A 24 character hexadecimal string 
@@ -308,14 +966,21 @@ def create_execution_record(action_namespace,action_name,version,parameters,job_
         "version": version,
         "parameters": parameters,
         "job_id": job_id,
-        "execution_status": "submitted"
+        "execution_status": execution_status,
+        "submitted_time": time.time()
     }
+    if runner_pool:
+        document["runner_pool"] = runner_pool
+        document["runner_args"] = get_runner_args(parameters)
+    if execution_id:
+        document["_id"] = ObjectId(execution_id)
     
-    execution_id = db_connection.insert_document(document)
+    with metrics.execution_record_insert_seconds.labels(**metrics.action_label_values(action_namespace, action_name, version)).time():
+        execution_id = db_connection.insert_document(document)
 
     return execution_id
 
-def submit_execution(action_namespace, action_name, version, parameters):
+def submit_execution(action_namespace, action_name, version, parameters, execution_id=None):
     """
     A function to submit an action for execution
 
@@ -323,81 +988,160 @@ def submit_execution(action_namespace, action_name, version, parameters):
     action_namespace (Str): The namespace the action resides in
     action_name (Str): The name of the action
     parameters (Object): Contans the parameters for the action. This will vary from action to action
+    execution_id (Str): Optional, the execution id to submit the action as
+
+    Returns:
+        execution_id (Str): A 24 character hexadecimal string
     """
+    return submit_executions([(action_namespace, action_name, version, parameters)], [execution_id])[0]
 
-    config.load_kube_config()
-    k8s_client = client.ApiClient()
-
-    job_id =  action_namespace + "-" + action_name + "-" + str(time.time_ns())
-    action_definition = get_action_definition(action_namespace, action_name, version)
-    execution_id = create_execution_record(action_namespace,action_name,version, parameters,job_id)
-
-    #TO-DO Figure out a better way to generate the callback url
-    parsed_url = urlparse(request.base_url)
-    callback_base_url = parsed_url[0] + "://" + parsed_url[1] + "/api/runner/" 
-                
-    #This is not pretty, but better than using a heredoc with some yaml in it.
-    job_dict = {
-        'apiVersion': 'batch/v1',
-        'kind': 'Job',
-        'metadata': { 'name': job_id},
-        'spec': {
-            'template': {
-                'spec': {
-                    'containers': [{
-                            'name': 'action-runner',
-                            'image': f"{action_definition['container_repo']}/{action_definition['container_name']}:{action_definition['container_tag']}",
-                            'env': [
-                                {
-                                    'name': 'RUNNER_ARGS',
-                                    'value': 'I am running in a k8s job'
-                                }, {
-                                    'name': 'POD_ID',
-                                    'valueFrom': {'fieldRef': { 'fieldPath': 'metadata.name'}}
-                                }, {
-                                    'name': 'JOB_ID',
-                                    'value': job_id
-                                }, {
-                                    'name': 'EXECUTION_ID',
-                                    'value': execution_id
-                                }, {
-                                    'name': 'POSTBACK_BASE_URL',
-                                    'valueFrom': {'configMapKeyRef': {'name': 'postback-url', 'key':'url'}}
-                                }
-                            ]
-                        }
-                    ],
-                    'restartPolicy': 'Never',
-                    'imagePullSecrets': [
-                        {'name': 'regcred'}
-                    ]
-                }
-            },
-            'backoffLimit': 0,
-            'podFailurePolicy': {
-                'rules': [
-                    {
-                        'action': 'FailJob',
-                        'onExitCodes': {
-                            'containerName': 'action-runner',
-                            'operator': 'NotIn',
-                            'values': [0]
-                        }
-                    }, {
-                        'action': 'Ignore',
-                        'onPodConditions': [
-                            {'type': 'DisruptionTarget'}
-                        ]
-                    }
-                ]
-            }
-        }
-    }
-   
-    narf = utils.create_from_dict(k8s_client, job_dict, namespace="testing")
+def submit_executions(actions, execution_ids=None):
+    """
+    A function to submit many actions for execution at once. The execution records are created first, then the
+    runners are started by the execution backend of each action: kubernetes jobs, created concurrently, or local
+    processes. The backend is the execution_backend of the action definition, or of engine.yaml.
+    Actions whose definition has the execution_mode "pooled" are not started, they are queued for a warm runner of
+    their runner_pool to claim.
 
-    return execution_id
+    Parameters:
+        actions (List): A list of (action_namespace, action_name, version, parameters) tuples
+        execution_ids (List): Optional, the execution id to submit each action as, or None to create a new one
+
+    Returns:
+        List: The execution ids of the actions, in the same order as actions
+    """
+    requested_ids = execution_ids or [None] * len(actions)
+    execution_ids = []
+    backend_executions = {}
+    pooled = False
+    for (action_namespace, action_name, version, parameters), requested_id in zip(actions, requested_ids):
+        job_id =  action_namespace + "-" + action_name + "-" + str(time.time_ns())
+        action_definition = get_action_definition(action_namespace, action_name, version)
+
+        if action_definition.get('execution_mode', "job") == "pooled":
+            runner_pool = action_definition.get('runner_pool', action_definition['container_name'])
+            execution_id = create_execution_record(action_namespace,action_name,version, parameters,job_id,"queued",runner_pool,requested_id)
+            pooled = True
+        else:
+            execution_id = create_execution_record(action_namespace,action_name,version, parameters,job_id,execution_id=requested_id)
+            backend = action_definition.get('execution_backend', engine_config["execution_backend"])
+            backend_executions.setdefault((backend, action_namespace, action_name, version), []).append({
+                "action_definition": action_definition,
+                "job_id": job_id,
+                "execution_id": execution_id,
+                "parameters": parameters
+            })
+        execution_ids.append(execution_id)
+
+    if pooled:
+        runner_pool_queue.notify()
+    for (backend, action_namespace, action_name, version), executions in backend_executions.items():
+        with metrics.job_submit_seconds.labels(backend=backend, **metrics.action_label_values(action_namespace, action_name, version)).time():
+            execution_backends[backend].submit(executions)
+
+    return execution_ids
+
+def claim_pooled_execution(runner_pool, claim, wait=0):
+    """
+    A function used by the workers of a runner pool to claim the next queued action. If nothing is queued the call
+    waits up to wait seconds for work before returning. Executions whose workers let their lease expire too many times
+    are failed first.
+
+    Parameters:
+        runner_pool (Str): The name of the runner pool
+        claim (Dict): Contains the worker_id of the worker
+        wait (Int): The number of seconds to wait for work, at most the runner_pool_claim_max_wait of the engine
+
+    Returns:
+        Dict: The execution_id, job_id and runner_args of the claimed action, and the lease_seconds the worker renews its claim within
+        Int: The HTTP status code, 204 if there was no work
+    """
+    for execution_id in runner_pool_queue.abandoned(runner_pool):
+        result(execution_id, {"job_id": None, "pod_id": None, "execution_status": "failed",
+            "execution_output": "The runner pool worker stopped renewing its claim of the execution"})
+
+    execution = runner_pool_queue.claim(runner_pool, claim['worker_id'], min(max(wait, 0), engine_config["runner_pool_claim_max_wait"]))
+    if execution is None:
+        return None, 204
+
+    return {
+        "execution_id": str(execution['_id']),
+        "job_id": execution['job_id'],
+        "runner_args": execution['runner_args'],
+        "lease_seconds": runner_pool_queue.lease_seconds
+    }, 200
+
+def renew_pooled_execution(runner_pool, execution_id, claim):
+    """
+    A function used by the workers of a runner pool to renew the lease on the action they are running. An action
+    whose lease expires is claimed again by another worker.
+
+    Parameters:
+        runner_pool (Str): The name of the runner pool
+        execution_id (string): A 24 character hexadecimal string with lowercase letters.
+        claim (Dict): Contains the worker_id of the worker
+
+    Returns:
+        Dict: The time the lease now expires
+    """
+    if not re.match('^[0-9a-f]{24}$',execution_id):
+        abort(406, "Execution id must be 24 chacters hexadecimal string with lowercase letters")
+
+    lease_expires = runner_pool_queue.renew(runner_pool, execution_id, claim['worker_id'])
+    if lease_expires is None:
+        abort(409, "The execution is no longer claimed by this worker")
+
+    return {"lease_expires": lease_expires}
+
+def report_local_failure(execution_id, error_output):
+    """
+    A function used by the local execution backend to record a runner that exited with an error.
+
+    Parameters:
+        execution_id (string): A 24 character hexadecimal string with lowercase letters.
+        error_output (Str): The error output of the runner
+
+    Returns:
+        none
+    """
+    execution_status = get_execution_status(execution_id)
+    if execution_status not in ("success", "failed"):
+        result(execution_id, {"job_id": None, "pod_id": None, "execution_status": "failed", "execution_output": error_output})
 
 def do_something():
     #submit_execution("core","echo",1,"ccc")
-    execute_workflow("663a8c84bbe4cf949c6e51e4")
+    return enqueue_workflow("663a8c84bbe4cf949c6e51e4")
+
+job_submitter = JobSubmitter(engine_config["kube_namespace"], engine_config["kube_connection_pool_size"], engine_config["kube_max_in_flight"])
+execution_backends = {
+    "kubernetes": KubernetesBackend(job_submitter),
+    "local": LocalBackend(engine_config["local_entrypoints"], engine_config["local_api_url"] + "/runner", engine_config["local_max_workers"], report_local_failure)
+}
+runner_pool_queue = RunnerPoolQueue(lease_seconds=engine_config["runner_pool_lease_seconds"],
+    max_claims=engine_config["runner_pool_max_claims"], max_waiting=engine_config["runner_pool_max_waiting_claims"])
+output_store = OutputStore(engine_config["output_chunk_size"])
+action_result_cache = ActionResultCache(engine_config["action_cache_ttl"])
+retention_sweeper = RetentionSweeper(engine_config["retention_rules"], engine_config["retention_archive_dir"],
+    engine_config["retention_interval"], engine_config["retention_batch_size"])
+admission_controller = AdmissionController(engine_config["admission_max_running"], engine_config["admission_namespace_limits"],
+    engine_config["admission_action_limits"], engine_config["admission_default_namespace_limit"])
+workflow_executor = WorkflowExecutor(run_workflow, engine_config["executor_workers"], engine_config["executor_poll_interval"], engine_config["workflow_lease_seconds"], max_recoveries=engine_config["workflow_max_recoveries"])
+
+def get_admission_status():
+    """
+    A function to get the admission limits of this engine, and the actions running and waiting to launch in each workflow namespace
+
+    Returns:
+        Dict: The admission status
+    """
+    return admission_controller.status()
+
+def start_local_runner_pools():
+    """
+    A function run at startup to start the runner pools configured to run as local processes in local_runner_pools of engine.yaml.
+
+    Returns:
+        none
+    """
+    for runner_pool, pool_config in engine_config["local_runner_pools"].items():
+        LocalRunnerPool(runner_pool, pool_config['script'], pool_config.get('workers', 1), engine_config["local_api_url"]).start()